@@ -1,70 +1,17 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-from utils.chaves_pix_manager import carregar_chaves_pix, adicionar_chave_pix
-import json
-import os
-import logging
-
-# Configura o logging para exibir mensagens no console
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-app = Flask(__name__)
-app.secret_key = 'sua_chave_secreta_aqui'
+"""
+Ponto de entrada WSGI do serviço Pix (front-end, webhook e APIs em um único app).
 
-# Rota de depuração para visualizar o conteúdo do arquivo JSON
-@app.route('/debug/chaves')
-def debug_chaves():
-    try:
-        with open('/tmp/chaves_pix.json', 'r', encoding='utf-8') as f:
-            content = f.read()
-        logger.info(f"Conteúdo de /tmp/chaves_pix.json: {content}")
-        return f"Conteúdo de /tmp/chaves_pix.json:<pre>{content}</pre>"
-    except Exception as e:
-        logger.error(f"Erro ao ler /tmp/chaves_pix.json: {str(e)}")
-        return f"Erro ao ler /tmp/chaves_pix.json: {str(e)}"
+Uso:
+    gunicorn -c gunicorn.conf.py app:app
+    python app.py
 
-# Rota de teste para verificar permissões de escrita
-@app.route('/test_write')
-def test_write():
-    test_file = '/tmp/test_write.txt'
-    try:
-        with open(test_file, 'w') as f:
-            f.write('Teste de escrita bem-sucedido')
-        logger.info(f"Arquivo escrito em {test_file}")
-        return f"Arquivo escrito em {test_file}"
-    except Exception as e:
-        logger.error(f"Erro ao escrever em {test_file}: {str(e)}")
-        return f"Erro ao escrever em {test_file}: {str(e)}"
+O app é criado por webhook_pix.create_app; ver gunicorn.conf.py para a configuração de produção.
+"""
 
-@app.route('/')
-def index():
-    chaves_pix = carregar_chaves_pix()
-    logger.info(f"Chaves Pix carregadas para a página inicial: {json.dumps(chaves_pix, indent=4)}")
-    return render_template('index.html', chaves_pix=chaves_pix)
-
-@app.route('/adicionar', methods=['GET', 'POST'])
-def adicionar_chave_pix_route():
-    if request.method == 'POST':
-        descricao = request.form.get('descricao')
-        tipo_chave = request.form.get('tipo_chave')
-        chave = request.form.get('chave')
-        logger.info(f"Dados do formulário: descricao={descricao}, tipo_chave={tipo_chave}, chave={chave}")
-        if not descricao or not tipo_chave or not chave:
-            flash('Todos os campos são obrigatórios!')
-            return redirect(url_for('adicionar_chave_pix_route'))
-        try:
-            adicionar_chave_pix(descricao, tipo_chave, chave)
-            flash('Chave adicionada com sucesso!')
-        except Exception as e:
-            flash(f'Erro ao adicionar chave: {str(e)}')
-        return redirect(url_for('listar_chaves'))
-    return render_template('adicionar_chave_pix.html')
+import os
+from webhook_pix import create_app
 
-@app.route('/chaves')
-def listar_chaves():
-    chaves_pix = carregar_chaves_pix()
-    logger.info(f"Chaves Pix carregadas para a lista: {json.dumps(chaves_pix, indent=4)}")
-    return render_template('chaves.html', chaves_pix=chaves_pix)
+app = create_app()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
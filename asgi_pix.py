@@ -0,0 +1,146 @@
+"""
+Ponto de entrada assíncrono (ASGI) do serviço Pix.
+
+As rotas de maior latência (`/gerar_qrcode`, `/webhook/pix` e `/webhook/pix/status`)
+são atendidas por um app Quart com cliente HTTP não bloqueante (httpx): enquanto a
+OpenPix responde, o event loop atende outras requisições, então um único processo
+sustenta centenas de cobranças em andamento. O armazenamento (SQLite e diário) roda
+em threads via asyncio.to_thread. O stream SSE de confirmação de pagamento
+(`/eventos/<txid>`) também fica aqui, para que milhares de páginas de QR Code abertas
+não ocupem workers. As demais rotas são repassadas ao app Flask.
+
+Uso:
+    uvicorn asgi_pix:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import logging
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, Response, render_template, request, redirect, url_for, flash, jsonify
+import webhook_pix
+from utils.openpix_client import criar_cliente_openpix_async, CircuitoAberto
+from utils.eventos import formatar_sse
+
+logger = logging.getLogger(__name__)
+
+quart_app = Quart(__name__)
+quart_app.secret_key = webhook_pix.SECRET_KEY  # Mesmo cookie de sessão do Flask (mensagens flash)
+quart_app.url_defaults(webhook_pix.versionar_estatico)  # Mesmas URLs versionadas de static/ (servidas pelo Flask)
+
+# Rotas servidas pelo Flask, registradas aqui só para o url_for dos templates
+for regra, endpoint in (('/', 'index'), ('/chaves', 'listar_chaves'), ('/adicionar', 'adicionar_chave_pix_route')):
+    quart_app.add_url_rule(regra, endpoint)
+
+openpix = None
+
+
+@quart_app.before_serving
+async def iniciar():
+    global openpix
+    openpix = criar_cliente_openpix_async()
+    if webhook_pix.EXPIRACAO_ATIVA:
+        webhook_pix.obter_agendador()
+    if webhook_pix.CONVERSAO_ATIVA:
+        webhook_pix.obter_conversor()
+
+
+@quart_app.after_serving
+async def encerrar():
+    await openpix.fechar()
+
+
+@quart_app.route('/gerar_qrcode', methods=['POST'])
+async def gerar_qrcode():
+    form = await request.form
+    try:
+        chave_pix, valor_float, payload = webhook_pix.preparar_cobranca(form.get('valor'), form.get('chave_pix_id'),
+                                                                        form.get('moeda'))
+    except ValueError as e:
+        await flash(str(e))
+        return redirect(url_for('index'))
+
+    try:
+        with webhook_pix.ETAPA_COBRANCA.cronometrar(etapa='openpix'):
+            charge = await openpix.criar_cobranca(payload)
+        contexto = await asyncio.to_thread(webhook_pix.concluir_cobranca, valor_float, chave_pix, form.get('moeda'), charge)
+        webhook_pix.COBRANCAS.inc(resultado='criada')
+        return await render_template('qrcode.html', **contexto)
+    except CircuitoAberto:
+        webhook_pix.COBRANCAS.inc(resultado='circuito_aberto')
+        logger.warning("Cobrança recusada: circuit breaker da OpenPix aberto")
+        await flash("OpenPix temporariamente indisponível. Tente novamente em alguns instantes.")
+        return redirect(url_for('index'))
+    except Exception as e:
+        webhook_pix.COBRANCAS.inc(resultado='erro')
+        logger.error(f"Erro ao gerar QR Code: {str(e)}")
+        await flash(f"Erro ao gerar QR Code: {str(e)}")
+        return redirect(url_for('index'))
+
+
+@quart_app.route('/webhook/pix', methods=['POST'])
+async def webhook_pix_route():
+    corpo = await request.get_data()
+    resposta, status, headers = await asyncio.to_thread(webhook_pix.receber_notificacao, corpo)
+    return jsonify(resposta), status, headers
+
+
+@quart_app.route('/webhook/pix/status', methods=['GET'])
+async def webhook_status():
+    resposta, status = await asyncio.to_thread(
+        webhook_pix.montar_status, request.args.get('since', type=int), request.args.get('limit', 10, type=int)
+    )
+    return jsonify(resposta), status
+
+
+@quart_app.route('/eventos/<txid>', methods=['GET'])
+async def eventos_pagamento(txid):
+    """Stream SSE que envia a confirmação do pagamento assim que o webhook a publica.
+
+    Cada conexão aberta custa só uma corrotina e uma fila, não um worker.
+    """
+    loop = asyncio.get_running_loop()
+    fila = asyncio.Queue()
+    assinatura = webhook_pix.eventos.assinar(txid, lambda evento: loop.call_soon_threadsafe(fila.put_nowait, evento))
+
+    async def gerar():
+        try:
+            yield 'retry: 3000\n\n'
+            evento = await asyncio.to_thread(webhook_pix.estado_pagamento, txid)
+            limite = loop.time() + webhook_pix.EVENTOS_TIMEOUT
+            while evento is None and loop.time() < limite:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+            if evento is not None:
+                yield formatar_sse(evento)
+        finally:
+            webhook_pix.eventos.cancelar(assinatura)
+
+    resposta = Response(gerar(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    resposta.timeout = None  # O stream dura até EVENTOS_TIMEOUT, além do timeout padrão do Quart
+    return resposta
+
+
+ROTAS_ASYNC = {
+    ('POST', '/gerar_qrcode'),
+    ('POST', '/webhook/pix'),
+    ('GET', '/webhook/pix/status'),
+}
+
+# Rotas com parâmetros, identificadas pelo prefixo do caminho
+PREFIXOS_ASYNC = (
+    ('GET', '/eventos/'),
+)
+
+_flask_asgi = WsgiToAsgi(webhook_pix.create_app())
+
+
+async def app(scope, receive, send):
+    """Despacha as rotas assíncronas para o Quart e as demais para o Flask."""
+    if (scope['type'] != 'http' or (scope['method'], scope['path']) in ROTAS_ASYNC
+            or any(scope['method'] == metodo and scope['path'].startswith(prefixo) for metodo, prefixo in PREFIXOS_ASYNC)):
+        await quart_app(scope, receive, send)
+    else:
+        await _flask_asgi(scope, receive, send)
@@ -0,0 +1,47 @@
+"""
+Configuração de produção do gunicorn.
+
+Uso:
+    gunicorn -c gunicorn.conf.py app:app
+
+O app é carregado uma única vez no processo mestre (preload_app) e os workers são
+criados por fork, compartilhando por copy-on-write o código importado, os templates
+compilados e as constantes. Recursos que não podem ser herdados (sessão HTTP da
+OpenPix, conexões SQLite, threads da fila, do agendador e das métricas) são criados
+por processo, no primeiro uso.
+"""
+
+import os
+import gc
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(multiprocessing.cpu_count() * 2 + 1, 4))))
+# Threads por worker: o long-poll de /eventos/<txid> e as chamadas à OpenPix ficam esperando I/O
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# EVENTOS_LONGPOLL (25 s) precisa caber no timeout do worker
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))  # Tempo para drenar a fila do webhook
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Recicla workers periodicamente; o jitter evita que todos reiniciem ao mesmo tempo
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+accesslog = os.getenv('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+
+
+def when_ready(server):
+    """Antes do fork dos workers: congela os objetos do app carregado.
+
+    Objetos congelados saem das varreduras do coletor de lixo, que de outro modo
+    escreveriam nos cabeçalhos dos objetos e copiariam as páginas em cada worker.
+    """
+    if preload_app:
+        gc.collect()
+        gc.freeze()
@@ -0,0 +1,132 @@
+"""
+Benchmark: criação de cobranças no caminho síncrono (gunicorn + Flask) versus o
+assíncrono (uvicorn + asgi_pix), ambos contra a OpenPix falsa com latência fixa.
+
+Uso:
+    python scripts/bench_asgi.py --requisicoes 500 --concorrencia 200 --latencia 0.2 --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def aguardar(url, timeout=20):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Servidor não respondeu em {url}")
+
+
+def preparar_chave(data_dir):
+    """Cria a chave Pix padrão no DATA_DIR do benchmark e retorna seu ID."""
+    codigo = "from utils.chaves_pix_manager import carregar_chaves_pix; print(carregar_chaves_pix()[0]['id'])"
+    saida = subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, capture_output=True, text=True,
+                           env=dict(os.environ, DATA_DIR=data_dir), check=True)
+    return saida.stdout.strip().splitlines()[-1]
+
+
+async def disparar(url, chave_id, requisicoes, concorrencia):
+    semaforo = asyncio.Semaphore(concorrencia)
+    latencias = []
+    erros = 0
+    limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+    async with httpx.AsyncClient(timeout=120, limits=limites) as client:
+        async def uma():
+            nonlocal erros
+            async with semaforo:
+                inicio = time.perf_counter()
+                try:
+                    resposta = await client.post(f"{url}/gerar_qrcode",
+                                                 data={'valor': '10,00', 'chave_pix_id': chave_id, 'moeda': 'BTC'})
+                    if resposta.status_code != 200:
+                        erros += 1
+                except httpx.TransportError:
+                    erros += 1
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(uma() for _ in range(requisicoes)))
+        duracao = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        'requisicoes': requisicoes,
+        'erros': erros,
+        'duracao_s': round(duracao, 3),
+        'throughput_rps': round(requisicoes / duracao, 1),
+        'p50_ms': round(statistics.median(latencias) * 1000, 1),
+        'p95_ms': round(latencias[int(len(latencias) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def medir(nome, comando, env, porta, chave_id, args):
+    processo = subprocess.Popen(comando, cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{porta}"
+        aguardar(f"{url}/webhook/pix/status")
+        resultado = asyncio.run(disparar(url, chave_id, args.requisicoes, args.concorrencia))
+        resultado['modo'] = nome
+        return resultado
+    finally:
+        processo.terminate()
+        processo.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requisicoes', type=int, default=500)
+    parser.add_argument('--concorrencia', type=int, default=200)
+    parser.add_argument('--latencia', type=float, default=0.2, help='latência da OpenPix falsa, em segundos')
+    parser.add_argument('--workers', type=int, default=4, help='workers síncronos do gunicorn')
+    args = parser.parse_args()
+
+    porta_fake = porta_livre()
+    fake = subprocess.Popen([sys.executable, os.path.join(RAIZ, 'scripts', 'fake_openpix.py'),
+                             '--porta', str(porta_fake), '--latencia', str(args.latencia)],
+                            stdout=subprocess.DEVNULL)
+    try:
+        data_dir = tempfile.mkdtemp(prefix='bench_asgi_')
+        env = dict(os.environ, DATA_DIR=data_dir, PYTHONPATH=RAIZ,
+                   OPENPIX_API_URL=f"http://127.0.0.1:{porta_fake}/openpix/v1",
+                   OPENPIX_POOL_MAXSIZE=str(args.concorrencia),
+                   OPENPIX_ASYNC_MAX_CONEXOES=str(args.concorrencia))
+        chave_id = preparar_chave(data_dir)
+
+        porta = porta_livre()
+        sincrono = medir('sync (gunicorn, %d workers)' % args.workers,
+                         ['gunicorn', '-w', str(args.workers), '-b', f'127.0.0.1:{porta}', '--log-level', 'warning',
+                          'webhook_pix:app'], env, porta, chave_id, args)
+        porta = porta_livre()
+        assincrono = medir('async (uvicorn, 1 processo)',
+                           ['uvicorn', 'asgi_pix:app', '--port', str(porta), '--log-level', 'warning'],
+                           env, porta, chave_id, args)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    print(json.dumps([sincrono, assincrono], indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
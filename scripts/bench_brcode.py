@@ -0,0 +1,46 @@
+"""
+Microbenchmark da geração local de BR Code (payload EMV + CRC16) e da renderização
+do QR Code em PNG e SVG, com e sem o cache LRU.
+
+Uso:
+    python scripts/bench_brcode.py --iteracoes 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import brcode
+
+
+def medir(nome, funcao, iteracoes):
+    inicio = time.perf_counter()
+    for i in range(iteracoes):
+        funcao(i)
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:<40} {iteracoes / duracao:>12,.0f} op/s {duracao / iteracoes * 1e6:>10.1f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iteracoes', type=int, default=2000)
+    args = parser.parse_args()
+    n = args.iteracoes
+
+    chave = ('E-mail', 'loja@exemplo.com.br')
+    payload = brcode.gerar_payload(*chave, 10.5, 'Pedido 1')
+
+    medir('crc16_ccitt', lambda i: brcode.crc16_ccitt(payload.encode('ascii')), n * 10)
+    medir('gerar_payload (sem cache)', lambda i: brcode.gerar_payload.__wrapped__(*chave, i / 100 + 1, 'Pedido'), n * 10)
+    medir('gerar_payload (cache quente)', lambda i: brcode.gerar_payload(*chave, 10.5, 'Pedido 1'), n * 10)
+    medir('renderizar_qrcode png (sem cache)', lambda i: brcode.renderizar_qrcode.__wrapped__(payload, 'png'), max(n // 10, 1))
+    medir('renderizar_qrcode svg (sem cache)', lambda i: brcode.renderizar_qrcode.__wrapped__(payload, 'svg'), max(n // 10, 1))
+    medir('renderizar_qrcode png (cache quente)', lambda i: brcode.renderizar_qrcode(payload, 'png'), n * 10)
+    print(brcode.estatisticas_cache())
+
+
+if __name__ == '__main__':
+    main()
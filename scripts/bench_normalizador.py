@@ -0,0 +1,127 @@
+"""
+Microbenchmark do custo por notificação do webhook: normalização pelo registro de
+utils.normalizador (com e sem cópia do payload bruto) e processar_notificacao_pix completo.
+
+Usa o payload de exemplo salvo em logs/ e o gerador de test_webhook.py.
+
+Com --verificar, em vez de medir, envia a receber_notificacao os corpos malformados de
+PAYLOADS_MALFORMADOS e falha se algum não for respondido com 200 (a OpenPix reenviaria
+um 500 indefinidamente).
+
+Uso:
+    python scripts/bench_normalizador.py --iteracoes 20000
+    python scripts/bench_normalizador.py --verificar
+"""
+
+import os
+import sys
+import glob
+import json
+import logging
+import time
+import argparse
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+# Corpos que já derrubaram a normalização: não são objetos, não têm `pix`, ou trazem
+# campos de tipos inesperados. Todos devem ser respondidos com 200.
+PAYLOADS_MALFORMADOS = [
+    '"x"',
+    'null',
+    '[1]',
+    '{"event": "OPENPIX:PIX_RECEIVED"}',
+    '{"event": "OPENPIX:PIX_RECEIVED", "pix": [1]}',
+    '{"event": "OPENPIX:PIX_RECEIVED", "pix": {"status": "COMPLETED", "valor": "1.00", "txid": "verificar-1"}}',
+    '{"event": "OPENPIX:PIX_RECEIVED", "pix": {"status": "COMPLETED", "valor": "NaN", "txid": {"a": 1}}}',
+    '{"event": "OPENPIX:PIX_RECEIVED", "pix": {"status": ["COMPLETED"], "infoPagador": "x"}}',
+    '{"event": "OPENPIX:TRANSACTION_RECEIVED", "charge": []}',
+    '{"event": "OPENPIX:TRANSACTION_RECEIVED", "charge": {"status": "COMPLETED", "value": "abc", '
+    '"paymentMethods": "x", "customer": [1], "correlationID": "verificar-2"}}',
+    '{"event": ["lista"], "pix": {"status": "COMPLETED", "valor": 1}}',
+]
+
+
+def verificar(webhook_pix):
+    """Envia os corpos malformados ao webhook e retorna a quantidade de falhas."""
+    from utils.normalizador import normalizar
+    falhas = 0
+    for corpo in PAYLOADS_MALFORMADOS:
+        try:
+            normalizar(json.loads(corpo))
+            resposta, status, _ = webhook_pix.receber_notificacao(corpo.encode('utf-8'))
+        except Exception as e:
+            resposta, status = {'excecao': repr(e)}, None
+        ok = status == 200
+        falhas += not ok
+        print(f"{'ok   ' if ok else 'FALHA'} {status} {corpo[:70]}" + ('' if ok else f" -> {resposta}"))
+    return falhas
+
+
+def medir(nome, funcao, payloads, iteracoes):
+    total = len(payloads)
+    inicio = time.perf_counter()
+    for i in range(iteracoes):
+        funcao(payloads[i % total])
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:<50} {iteracoes / duracao:>12,.0f} op/s {duracao / iteracoes * 1e6:>10.2f} us/op")
+
+
+def carregar_payloads(quantidade):
+    from test_webhook import gerar_payload_teste
+    exemplos = []
+    for caminho in sorted(glob.glob(os.path.join(RAIZ, 'logs', 'pix_notification_*.json'))):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            exemplos.append(json.load(f))
+    gerados = [gerar_payload_teste() for _ in range(quantidade)]
+    transacoes = [{
+        'event': 'OPENPIX:TRANSACTION_RECEIVED',
+        'charge': {
+            'status': 'COMPLETED',
+            'value': 10050,
+            'correlationID': p['pix']['txid'],
+            'transactionID': p['pix']['txid'].replace('-', '')[:32],
+            'identifier': p['pix']['e2eid'],
+            'customer': {'name': p['pix']['infoPagador']['nome']}
+        }
+    } for p in gerados]
+    return exemplos, gerados, transacoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iteracoes', type=int, default=20000)
+    parser.add_argument('--payloads', type=int, default=500, help='payloads distintos gerados por formato')
+    parser.add_argument('--verificar', action='store_true', help='só confere os corpos malformados')
+    args = parser.parse_args()
+
+    # Isola as gravações do benchmark em um diretório temporário
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='bench_normalizador_'))
+    os.environ.setdefault('LOGS_DIR', tempfile.mkdtemp(prefix='bench_normalizador_logs_'))
+    from utils.normalizador import normalizar
+    import webhook_pix
+    logging.disable(logging.CRITICAL)
+
+    if args.verificar:
+        os.environ['WEBHOOK_ASYNC'] = '0'
+        webhook_pix.WEBHOOK_ASYNC = False
+        sys.exit(1 if verificar(webhook_pix) else 0)
+
+    exemplos, gerados, transacoes = carregar_payloads(args.payloads)
+    n = args.iteracoes
+
+    if exemplos:
+        medir('normalizar (exemplo de logs/)', normalizar, exemplos, n)
+    medir('normalizar (formato pix)', normalizar, gerados, n)
+    medir('normalizar (TRANSACTION_RECEIVED)', normalizar, transacoes, n)
+    medir('normalizar + payload bruto', lambda p: normalizar(p, True), gerados, n)
+    medir('normalizar + como_dict', lambda p: normalizar(p).como_dict(), gerados, n)
+    medir('processar_notificacao_pix (pix)', webhook_pix.processar_notificacao_pix, gerados, max(n // 10, 1))
+    medir('processar_notificacao_pix (TRANSACTION_RECEIVED)', webhook_pix.processar_notificacao_pix,
+          transacoes, max(n // 10, 1))
+
+
+if __name__ == '__main__':
+    main()
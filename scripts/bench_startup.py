@@ -0,0 +1,184 @@
+"""
+Benchmark de partida a frio do app: tempo de import, de create_app e latência da
+primeira requisição de cada rota (comparada à segunda), cada repetição em um
+processo Python novo com DATA_DIR e LOGS_DIR temporários.
+
+Com --gunicorn, sobe o gunicorn (gunicorn.conf.py) com e sem preload e mede o tempo
+até a primeira resposta e a memória dos processos (PSS e USS, via /proc/<pid>/smaps_rollup,
+somente Linux): com preload, as páginas do app carregado no mestre são compartilhadas
+pelos workers e o PSS total cai.
+
+Uso:
+    python scripts/bench_startup.py --repeticoes 5
+    python scripts/bench_startup.py --gunicorn --workers 4 --saida startup.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+ROTAS = ('/', '/chaves', '/webhook/pix/status', '/transacoes', '/metrics')
+
+# Executado em um processo novo: imprime os tempos em JSON
+MEDICAO = """
+import json, time, logging, sys
+inicio = time.perf_counter()
+import webhook_pix
+importado = time.perf_counter()
+app = webhook_pix.create_app()
+criado = time.perf_counter()
+logging.disable(logging.CRITICAL)
+cliente = app.test_client()
+rotas = {}
+for rota in json.loads(sys.argv[1]):
+    t0 = time.perf_counter()
+    status = cliente.get(rota).status_code
+    t1 = time.perf_counter()
+    cliente.get(rota)
+    t2 = time.perf_counter()
+    rotas[rota] = {'status': status, 'primeira_ms': (t1 - t0) * 1000, 'segunda_ms': (t2 - t1) * 1000}
+print(json.dumps({'import_ms': (importado - inicio) * 1000, 'create_app_ms': (criado - importado) * 1000, 'rotas': rotas}))
+"""
+
+
+def ambiente_isolado():
+    return dict(os.environ, DATA_DIR=tempfile.mkdtemp(prefix='bench_startup_'),
+                LOGS_DIR=tempfile.mkdtemp(prefix='bench_startup_logs_'), EXPIRACAO_ATIVA='0',
+                LOG_NIVEL='WARNING', PYTHONPATH=RAIZ)
+
+
+def medir_processo(repeticoes):
+    amostras = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = subprocess.run([sys.executable, '-c', MEDICAO, json.dumps(ROTAS)], cwd=RAIZ, env=ambiente_isolado(),
+                               capture_output=True, text=True, check=True).stdout
+        total = (time.perf_counter() - inicio) * 1000
+        amostra = json.loads(saida.strip().splitlines()[-1])
+        amostra['processo_ms'] = total
+        amostras.append(amostra)
+
+    def mediana(valores):
+        return round(statistics.median(valores), 2)
+
+    return {
+        'processo_ms': mediana([a['processo_ms'] for a in amostras]),
+        'import_ms': mediana([a['import_ms'] for a in amostras]),
+        'create_app_ms': mediana([a['create_app_ms'] for a in amostras]),
+        'rotas': {
+            rota: {
+                'status': amostras[0]['rotas'][rota]['status'],
+                'primeira_ms': mediana([a['rotas'][rota]['primeira_ms'] for a in amostras]),
+                'segunda_ms': mediana([a['rotas'][rota]['segunda_ms'] for a in amostras]),
+            }
+            for rota in ROTAS
+        },
+    }
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memoria(pid):
+    """PSS e USS (kB) do processo, a partir de /proc/<pid>/smaps_rollup."""
+    valores = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for linha in f:
+                partes = linha.split()
+                if partes[0] in ('Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                    valores[partes[0]] = int(partes[1])
+    except FileNotFoundError:
+        return None
+    return {'pss_kb': valores.get('Pss:', 0),
+            'uss_kb': valores.get('Private_Clean:', 0) + valores.get('Private_Dirty:', 0)}
+
+
+def filhos(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def medir_gunicorn(preload, workers, timeout=30):
+    porta = porta_livre()
+    env = dict(ambiente_isolado(), PORT=str(porta), WEB_CONCURRENCY=str(workers),
+               GUNICORN_PRELOAD='1' if preload else '0', GUNICORN_LOG_LEVEL='warning')
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=RAIZ, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        primeira = None
+        while time.perf_counter() - inicio < timeout:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{porta}/', timeout=5).read()
+                primeira = (time.perf_counter() - inicio) * 1000
+                break
+            except OSError:
+                time.sleep(0.02)
+        # Aquece todos os workers antes de medir a memória
+        for _ in range(workers * 10):
+            for rota in ROTAS:
+                try:
+                    urllib.request.urlopen(f'http://127.0.0.1:{porta}{rota}', timeout=5).read()
+                except OSError:
+                    pass
+        time.sleep(0.5)
+        processos = [processo.pid] + filhos(processo.pid)
+        medidas = [m for m in (memoria(pid) for pid in processos) if m]
+        return {
+            'preload': preload,
+            'workers': workers,
+            'primeira_resposta_ms': round(primeira, 1) if primeira else None,
+            'pss_total_kb': sum(m['pss_kb'] for m in medidas) if medidas else None,
+            'uss_total_kb': sum(m['uss_kb'] for m in medidas) if medidas else None,
+            'processos': len(processos),
+        }
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--gunicorn', action='store_true', help='mede também a partida do gunicorn com e sem preload')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    args = parser.parse_args()
+
+    relatorio = {
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'repeticoes': args.repeticoes,
+        'processo': medir_processo(args.repeticoes),
+    }
+    if args.gunicorn:
+        relatorio['gunicorn'] = [medir_gunicorn(False, args.workers), medir_gunicorn(True, args.workers)]
+
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    print(texto)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Gerador de carga para POST /webhook/pix, construído sobre gerar_payload_teste de test_webhook.py.
+
+Envia uma mistura de notificações no formato `pix`, OPENPIX:TRANSACTION_RECEIVED,
+reentregas duplicadas e corpos malformados, com taxa (RPS) e concorrência configuráveis,
+e reporta latências p50/p95/p99 e taxa de erro em JSON comparável entre execuções.
+
+Sem --url, o alvo é o app Flask em processo (test client) com DATA_DIR e logs temporários;
+com --url, um servidor em execução (gunicorn, uvicorn...).
+
+Uso:
+    python scripts/carga_webhook.py --requisicoes 2000 --concorrencia 16
+    python scripts/carga_webhook.py --url http://127.0.0.1:8000 --rps 200 --duracao 30 --saida carga.json
+    python scripts/carga_webhook.py --mix pix=50,transacao=30,duplicado=15,malformado=5
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from test_webhook import gerar_payload_teste
+
+MIX_PADRAO = 'pix=70,transacao=20,duplicado=5,malformado=5'
+
+# Status HTTP aceitos para cada tipo de corpo (malformados devem ser recusados com 400; um duplicado
+# que chega enquanto a primeira entrega ainda está em processamento recebe 409)
+STATUS_ESPERADOS = {
+    'pix': (200, 202),
+    'transacao': (200, 202),
+    'duplicado': (200, 202, 409),
+    'malformado': (400,),
+}
+
+
+def gerar_payload_transacao():
+    """Converte o payload de teste no formato OPENPIX:TRANSACTION_RECEIVED (só o objeto `charge`)."""
+    base = gerar_payload_teste()
+    pix = base['pix']
+    charge = dict(base['charge'])
+    charge.update({
+        'transactionID': pix['txid'].replace('-', ''),
+        'identifier': pix['e2eid'],
+        'customer': {'name': pix['infoPagador']['nome'], 'taxID': pix['infoPagador']['cpf']},
+    })
+    return {'event': 'OPENPIX:TRANSACTION_RECEIVED', 'charge': charge, 'account': base['account']}
+
+
+def interpretar_mix(texto):
+    pesos = {}
+    for parte in texto.split(','):
+        tipo, _, peso = parte.partition('=')
+        tipo = tipo.strip()
+        if tipo not in STATUS_ESPERADOS:
+            raise ValueError(f"Tipo desconhecido no mix: {tipo} (use {', '.join(STATUS_ESPERADOS)})")
+        pesos[tipo] = float(peso)
+    if sum(pesos.values()) <= 0:
+        raise ValueError("O mix precisa de ao menos um peso positivo")
+    return pesos
+
+
+def preparar_corpos(quantidade, pesos, semente):
+    """Gera todos os corpos antes da medição, para que o custo do gerador não entre nas latências."""
+    aleatorio = random.Random(semente)
+    tipos = aleatorio.choices(list(pesos), weights=list(pesos.values()), k=quantidade)
+    corpos = []
+    enviados = []
+    for tipo in tipos:
+        if tipo == 'duplicado' and not enviados:
+            tipo = 'pix'
+        if tipo == 'pix':
+            corpo = json.dumps(gerar_payload_teste()).encode('utf-8')
+            enviados.append(corpo)
+        elif tipo == 'transacao':
+            corpo = json.dumps(gerar_payload_transacao()).encode('utf-8')
+            enviados.append(corpo)
+        elif tipo == 'duplicado':
+            corpo = aleatorio.choice(enviados)
+        else:
+            corpo = json.dumps(gerar_payload_teste()).encode('utf-8')[:aleatorio.randint(1, 60)]
+        corpos.append((tipo, corpo))
+    return corpos
+
+
+def criar_enviador(url):
+    """Retorna uma função `enviar(corpo) -> status HTTP` com um cliente por thread."""
+    local = threading.local()
+
+    if url:
+        import requests
+        destino = url.rstrip('/') + '/webhook/pix'
+
+        def enviar(corpo):
+            sessao = getattr(local, 'sessao', None)
+            if sessao is None:
+                sessao = local.sessao = requests.Session()
+            return sessao.post(destino, data=corpo, headers={'Content-Type': 'application/json'}, timeout=30).status_code
+        return enviar
+
+    # App em processo: isola as gravações em diretórios temporários
+    os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='carga_webhook_'))
+    os.environ.setdefault('LOGS_DIR', tempfile.mkdtemp(prefix='carga_webhook_logs_'))
+    import webhook_pix
+    app = webhook_pix.create_app()
+    logging.disable(logging.CRITICAL)
+
+    def enviar(corpo):
+        cliente = getattr(local, 'cliente', None)
+        if cliente is None:
+            cliente = local.cliente = app.test_client()
+        return cliente.post('/webhook/pix', data=corpo, content_type='application/json').status_code
+    return enviar
+
+
+def percentil(ordenados, p):
+    """Percentil pelo método do posto mais próximo sobre uma lista já ordenada."""
+    if not ordenados:
+        return None
+    indice = max(int(round(p / 100 * len(ordenados) + 0.5)) - 1, 0)
+    return ordenados[min(indice, len(ordenados) - 1)]
+
+
+def resumir_latencias(latencias):
+    ordenadas = sorted(latencias)
+    return {
+        'quantidade': len(ordenadas),
+        'p50_ms': round(percentil(ordenadas, 50) * 1000, 2) if ordenadas else None,
+        'p95_ms': round(percentil(ordenadas, 95) * 1000, 2) if ordenadas else None,
+        'p99_ms': round(percentil(ordenadas, 99) * 1000, 2) if ordenadas else None,
+        'max_ms': round(ordenadas[-1] * 1000, 2) if ordenadas else None,
+    }
+
+
+def executar(enviar, corpos, concorrencia, rps, duracao):
+    """Dispara os corpos com `concorrencia` threads.
+
+    Com `rps`, a requisição i é agendada para `inicio + i / rps` e a latência é medida a partir
+    do horário agendado, de modo que atrasos do próprio alvo em aceitar carga apareçam nos percentis.
+    """
+    resultados = []
+    proximo = [0]
+    lock = threading.Lock()
+    inicio = time.perf_counter()
+    limite = inicio + duracao if duracao else None
+
+    def worker():
+        registros = []
+        while True:
+            with lock:
+                i = proximo[0]
+                proximo[0] += 1
+            if i >= len(corpos):
+                break
+            agendado = inicio + i / rps if rps else time.perf_counter()
+            if limite and agendado >= limite:
+                break
+            espera = agendado - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            tipo, corpo = corpos[i]
+            try:
+                status = enviar(corpo)
+            except Exception as e:
+                status = f"falha: {type(e).__name__}"
+            registros.append((tipo, status, time.perf_counter() - agendado))
+        with lock:
+            resultados.extend(registros)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resultados, time.perf_counter() - inicio
+
+
+def montar_relatorio(resultados, duracao, args):
+    por_tipo = {}
+    codigos = {}
+    erros = 0
+    for tipo, status, latencia in resultados:
+        grupo = por_tipo.setdefault(tipo, {'latencias': [], 'erros': 0, 'codigos': {}})
+        grupo['latencias'].append(latencia)
+        grupo['codigos'][str(status)] = grupo['codigos'].get(str(status), 0) + 1
+        codigos[str(status)] = codigos.get(str(status), 0) + 1
+        if status not in STATUS_ESPERADOS[tipo]:
+            grupo['erros'] += 1
+            erros += 1
+
+    total = len(resultados)
+    return {
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {
+            'alvo': args.url or 'flask-test-client',
+            'rps_alvo': args.rps,
+            'concorrencia': args.concorrencia,
+            'mix': args.mix,
+            'semente': args.semente,
+        },
+        'requisicoes': total,
+        'duracao_s': round(duracao, 3),
+        'throughput_rps': round(total / duracao, 1) if duracao else None,
+        'erros': erros,
+        'taxa_erro': round(erros / total, 4) if total else None,
+        'codigos': codigos,
+        'latencia': resumir_latencias([r[2] for r in resultados]),
+        'por_tipo': {
+            tipo: dict(resumir_latencias(grupo['latencias']), erros=grupo['erros'], codigos=grupo['codigos'])
+            for tipo, grupo in sorted(por_tipo.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='servidor alvo (ex.: http://127.0.0.1:8000); sem ele, usa o app em processo')
+    parser.add_argument('--requisicoes', type=int, default=1000, help='total de requisições (limite superior com --duracao)')
+    parser.add_argument('--duracao', type=float, default=0, help='encerra após N segundos (requer --rps)')
+    parser.add_argument('--rps', type=float, default=0, help='taxa alvo; 0 envia o mais rápido possível')
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--mix', default=MIX_PADRAO, help=f'pesos por tipo de corpo (padrão: {MIX_PADRAO})')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    args = parser.parse_args()
+
+    if args.duracao and not args.rps:
+        parser.error('--duracao requer --rps')
+    quantidade = max(args.requisicoes, int(args.rps * args.duracao)) if args.duracao else args.requisicoes
+
+    corpos = preparar_corpos(quantidade, interpretar_mix(args.mix), args.semente)
+    enviar = criar_enviador(args.url)
+    resultados, duracao = executar(enviar, corpos, args.concorrencia, args.rps, args.duracao)
+    relatorio = montar_relatorio(resultados, duracao, args)
+
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    print(texto)
+
+
+if __name__ == '__main__':
+    main()
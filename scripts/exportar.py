@@ -0,0 +1,69 @@
+"""
+Exporta transações ou notificações (diário) em CSV ou JSONL para conciliação,
+em streaming: a memória usada não depende da quantidade de registros.
+
+Uso:
+    python scripts/exportar.py transacoes --formato csv --desde 2025-05-01 --ate 2025-06-01 --saida maio.csv
+    python scripts/exportar.py notificacoes --formato jsonl --gzip --saida notificacoes.jsonl.gz
+    python scripts/exportar.py transacoes --status CONCLUIDA --moeda BTC > concluidas.jsonl
+
+As variáveis DATA_DIR e LOGS_DIR apontam para os mesmos dados usados pelo servidor.
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from utils.exportacao import exportar, iterar_notificacoes, linha_notificacao, CAMPOS_TRANSACOES, CAMPOS_NOTIFICACOES
+from utils.journal import JournalNotificacoes
+from utils.transacoes_store import instante
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tipo', choices=('transacoes', 'notificacoes'))
+    parser.add_argument('--formato', choices=('csv', 'jsonl'), default='jsonl')
+    parser.add_argument('--gzip', action='store_true', help='compacta a saída em gzip')
+    parser.add_argument('--desde', help='data inicial inclusiva (ISO 8601 ou epoch)')
+    parser.add_argument('--ate', help='data final exclusiva (ISO 8601 ou epoch)')
+    parser.add_argument('--status', help='apenas transações com este status')
+    parser.add_argument('--chave-id', help='apenas transações desta chave Pix')
+    parser.add_argument('--moeda', help='apenas transações nesta moeda')
+    parser.add_argument('--saida', help='arquivo de saída (padrão: stdout)')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    try:
+        instante(args.desde)
+        instante(args.ate)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.tipo == 'transacoes':
+        from utils.chaves_pix_manager import iterar_transacoes_pix
+        registros = iterar_transacoes_pix(status=args.status, chave_id=args.chave_id, moeda=args.moeda,
+                                          desde=args.desde, ate=args.ate)
+        campos = CAMPOS_TRANSACOES
+    else:
+        logs_dir = os.getenv('LOGS_DIR', os.path.join(RAIZ, 'logs'))
+        journal = JournalNotificacoes(os.path.join(logs_dir, 'journal'), legado_dir=logs_dir)
+        registros = iterar_notificacoes(journal, desde=args.desde, ate=args.ate)
+        if args.formato == 'csv':
+            registros = (linha_notificacao(entrada) for entrada in registros)
+        campos = CAMPOS_NOTIFICACOES
+
+    saida = open(args.saida, 'wb') if args.saida else sys.stdout.buffer
+    try:
+        for bloco in exportar(registros, args.formato, campos, gzip_saida=args.gzip):
+            saida.write(bloco)
+    finally:
+        if args.saida:
+            saida.close()
+
+
+if __name__ == '__main__':
+    main()
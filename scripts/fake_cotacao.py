@@ -0,0 +1,105 @@
+"""
+Servidor local que imita a rota /simple/price da CoinGecko, para testes e benchmarks
+do conversor de pagamentos (utils/conversao.py). Responde preços em BRL fixos, com
+latência e taxa de falhas configuráveis, e conta as requisições recebidas.
+
+Uso:
+    python scripts/fake_cotacao.py --porta 8090 --latencia 0.2
+    COTACAO_URL=http://127.0.0.1:8090/api/v3 python webhook_pix.py
+
+Rotas auxiliares:
+    GET /__fake/estatisticas            contadores de requisições
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PREFIXO = '/api/v3'
+
+# Preço em BRL por id da CoinGecko
+PRECOS = {'bitcoin': 350000.0, 'ethereum': 18000.0, 'tether': 5.4}
+
+
+class FakeCotacao(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, endereco, latencia=0.0, taxa_falha=0.0, precos=None):
+        super().__init__(endereco, HandlerCotacao)
+        self.latencia = latencia
+        self.taxa_falha = taxa_falha
+        self.precos = dict(precos or PRECOS)
+        self.lock = threading.Lock()
+        self.estatisticas = {'consultas': 0, 'por_id': {}, 'falhas_injetadas': 0}
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}{PREFIXO}"
+
+
+class HandlerCotacao(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/__fake/estatisticas':
+            with self.server.lock:
+                return self._responder(200, self.server.estatisticas)
+        if url.path != f"{PREFIXO}/simple/price":
+            return self._responder(404, {'error': 'not found'})
+        if self.server.latencia:
+            time.sleep(self.server.latencia)
+        parametros = parse_qs(url.query)
+        ids = [i for i in parametros.get('ids', [''])[0].split(',') if i]
+        moeda = parametros.get('vs_currencies', ['brl'])[0]
+        with self.server.lock:
+            self.server.estatisticas['consultas'] += 1
+            for id_moeda in ids:
+                self.server.estatisticas['por_id'][id_moeda] = self.server.estatisticas['por_id'].get(id_moeda, 0) + 1
+            if self.server.taxa_falha and random.random() < self.server.taxa_falha:
+                self.server.estatisticas['falhas_injetadas'] += 1
+                falha = True
+            else:
+                falha = False
+        if falha:
+            return self._responder(429, {'status': {'error_code': 429, 'error_message': 'rate limited'}})
+        self._responder(200, {id_moeda: {moeda: self.server.precos[id_moeda]}
+                              for id_moeda in ids if id_moeda in self.server.precos})
+
+
+def iniciar_servidor(porta=0, latencia=0.0, taxa_falha=0.0, precos=None):
+    """Sobe o servidor em uma thread e o retorna (use `servidor.url` e `servidor.shutdown()`)."""
+    servidor = FakeCotacao(('127.0.0.1', porta), latencia=latencia, taxa_falha=taxa_falha, precos=precos)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--porta', type=int, default=8090)
+    parser.add_argument('--latencia', type=float, default=0.0, help='atraso por requisição, em segundos')
+    parser.add_argument('--taxa-falha', type=float, default=0.0, help='fração de requisições respondidas com 429')
+    args = parser.parse_args()
+    servidor = FakeCotacao(('127.0.0.1', args.porta), latencia=args.latencia, taxa_falha=args.taxa_falha)
+    print(f"Fake de cotações em {servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
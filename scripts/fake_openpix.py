@@ -0,0 +1,158 @@
+"""
+Servidor local que imita a API da OpenPix para testes e benchmarks.
+Implementa a criação (idempotente por correlationID com `?return_existing=true`;
+sem o parâmetro, um correlationID repetido recebe 400, como na OpenPix) e a consulta de cobranças,
+com latência e taxa de falhas configuráveis. Cobranças não pagas passam a EXPIRED
+depois de `expiresIn` segundos (padrão: 900), como na OpenPix.
+
+Uso:
+    python scripts/fake_openpix.py --porta 8089 --latencia 0.05 --taxa-falha 0.1
+    OPENPIX_API_URL=http://127.0.0.1:8089/openpix/v1 python webhook_pix.py
+
+Rotas auxiliares:
+    POST /__fake/pagar/<correlationID>   marca a cobrança como COMPLETED
+    GET  /__fake/estatisticas            contadores de requisições
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PREFIXO = '/openpix/v1'
+
+
+class FakeOpenPix(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Suporta rajadas de conexões simultâneas dos benchmarks
+
+    def __init__(self, endereco, latencia=0.0, taxa_falha=0.0):
+        super().__init__(endereco, HandlerOpenPix)
+        self.latencia = latencia
+        self.taxa_falha = taxa_falha
+        self.cobrancas = {}
+        self.lock = threading.Lock()
+        self.estatisticas = {'criadas': 0, 'repetidas': 0, 'duplicadas': 0, 'consultas': 0, 'falhas_injetadas': 0}
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}{PREFIXO}"
+
+
+class HandlerOpenPix(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Evita o atraso de ~40ms entre cabeçalho e corpo no keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _simular_rede(self):
+        if self.server.latencia:
+            time.sleep(self.server.latencia)
+        if self.server.taxa_falha and random.random() < self.server.taxa_falha:
+            with self.server.lock:
+                self.server.estatisticas['falhas_injetadas'] += 1
+            self._responder(503, {'error': 'falha injetada'})
+            return False
+        return True
+
+    def _ler_json(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(tamanho) or b'{}')
+
+    def do_POST(self):
+        if self.path.startswith('/__fake/pagar/'):
+            correlation_id = self.path.rsplit('/', 1)[-1]
+            with self.server.lock:
+                cobranca = self.server.cobrancas.get(correlation_id)
+                if cobranca:
+                    cobranca['status'] = 'COMPLETED'
+            return self._responder(200 if cobranca else 404, {'charge': cobranca})
+        url = urlsplit(self.path)
+        if url.path != f'{PREFIXO}/charge':
+            return self._responder(404, {'error': 'rota não encontrada'})
+        retornar_existente = parse_qs(url.query).get('return_existing') == ['true']
+        payload = self._ler_json()
+        if not self._simular_rede():
+            return
+        correlation_id = payload.get('correlationID')
+        if not correlation_id or not payload.get('value'):
+            return self._responder(400, {'error': 'correlationID e value são obrigatórios'})
+        with self.server.lock:
+            cobranca = self.server.cobrancas.get(correlation_id)
+            duplicada = bool(cobranca) and not retornar_existente
+            if duplicada:
+                self.server.estatisticas['duplicadas'] += 1
+            elif cobranca:
+                self.server.estatisticas['repetidas'] += 1
+            else:
+                agora = datetime.now()
+                cobranca = {
+                    'correlationID': correlation_id,
+                    'value': payload['value'],
+                    'comment': payload.get('comment'),
+                    'status': 'ACTIVE',
+                    'transactionID': correlation_id.replace('-', '')[:32],
+                    'identifier': correlation_id.replace('-', '')[:32],
+                    'brCode': f"00020101021226880014br.gov.bcb.pix2566fake.openpix/{correlation_id}5204000053039865802BR6304FAKE",
+                    'qrCodeImage': f"https://fake.openpix/openpix/charge/brcode/image/{correlation_id}.png",
+                    'createdAt': agora.isoformat(),
+                    'expiresIn': int(payload.get('expiresIn') or 900),
+                    'expiresDate': (agora + timedelta(seconds=int(payload.get('expiresIn') or 900))).isoformat()
+                }
+                self.server.cobrancas[correlation_id] = cobranca
+                self.server.estatisticas['criadas'] += 1
+        if duplicada:
+            return self._responder(400, {'error': 'Já existe uma cobrança com esse correlationID'})
+        self._responder(200, {'charge': cobranca})
+
+    def do_GET(self):
+        if self.path == '/__fake/estatisticas':
+            with self.server.lock:
+                return self._responder(200, dict(self.server.estatisticas, total=len(self.server.cobrancas)))
+        if not self.path.startswith(f'{PREFIXO}/charge/'):
+            return self._responder(404, {'error': 'rota não encontrada'})
+        if not self._simular_rede():
+            return
+        correlation_id = self.path.rsplit('/', 1)[-1]
+        with self.server.lock:
+            self.server.estatisticas['consultas'] += 1
+            cobranca = self.server.cobrancas.get(correlation_id)
+            if cobranca and cobranca['status'] == 'ACTIVE' and datetime.fromisoformat(cobranca['expiresDate']) <= datetime.now():
+                cobranca['status'] = 'EXPIRED'
+        if not cobranca:
+            return self._responder(404, {'error': 'cobrança não encontrada'})
+        self._responder(200, {'charge': cobranca})
+
+
+def iniciar_servidor(porta=0, latencia=0.0, taxa_falha=0.0):
+    """Sobe o servidor em uma thread e o retorna (use `servidor.url` e `servidor.shutdown()`)."""
+    servidor = FakeOpenPix(('127.0.0.1', porta), latencia=latencia, taxa_falha=taxa_falha)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--porta', type=int, default=8089)
+    parser.add_argument('--latencia', type=float, default=0.0, help='atraso por requisição, em segundos')
+    parser.add_argument('--taxa-falha', type=float, default=0.0, help='fração de requisições respondidas com 503')
+    args = parser.parse_args()
+    servidor = FakeOpenPix(('127.0.0.1', args.porta), latencia=args.latencia, taxa_falha=args.taxa_falha)
+    print(f"Fake OpenPix em {servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,70 @@
+"""
+Redistribui as transações de DATA_DIR entre N bancos SQLite (shards por hash do txid).
+
+Rode com o serviço parado e, depois, suba o serviço com TRANSACOES_SHARDS=N. Enquanto o
+rebalanceamento não termina, o serviço recusa o banco. Se ele for interrompido, basta
+rodar de novo com o mesmo número: cada lote é copiado para o destino antes de ser
+removido da origem. Com jump consistent hash, ir de N para N+1 shards move só ~1/(N+1)
+das transações. Ao final, imprime um relatório JSON.
+
+Uso:
+    python scripts/rebalancear_transacoes.py --shards 4
+    python scripts/rebalancear_transacoes.py --shards 1 --saida rebalanceamento.json   # volta a um único banco
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from utils.chaves_pix_manager import TRANSACOES_DB
+from utils.transacoes_store import rebalancear, ler_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, required=True, help='número de shards de destino')
+    parser.add_argument('--lote', type=int, default=5000, help='transações lidas por consulta')
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error('--shards deve ser ao menos 1')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    inicio = time.perf_counter()
+    ultimo = [inicio]
+
+    def progresso(resultado):
+        if time.perf_counter() - ultimo[0] >= 5:
+            ultimo[0] = time.perf_counter()
+            logging.info(f"{resultado['lidas']} lidas, {resultado['movidas']} movidas")
+
+    antes = ler_shards(TRANSACOES_DB)
+    resultado = rebalancear(TRANSACOES_DB, args.shards, lote=args.lote, progresso=progresso)
+    duracao = time.perf_counter() - inicio
+    relatorio = {
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'banco': TRANSACOES_DB,
+        'estado_anterior': antes,
+        **resultado,
+        'duracao_s': round(duracao, 2),
+        'movidas_por_s': round(resultado['movidas'] / duracao) if duracao else None,
+    }
+
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    print(texto)
+
+
+if __name__ == '__main__':
+    main()
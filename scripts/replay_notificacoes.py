@@ -0,0 +1,145 @@
+"""
+Reconstrói o status das transações a partir das notificações arquivadas em LOGS_DIR.
+
+Lê os segmentos do diário (sem depender do índice) e, se não houver diário, os arquivos
+legados pix_notification_*.json. Decodifica e normaliza as notificações em um pool de
+processos, com a mesma regra de processar_notificacao_pix, e consolida por txid pelo
+horário do evento (a última escrita vence). O resultado é gravado em lotes no banco de
+transações de DATA_DIR. Ao final, imprime um relatório com a vazão de cada fase.
+
+Uso:
+    python scripts/replay_notificacoes.py --simular
+    python scripts/replay_notificacoes.py --processos 4 --saida replay.json
+    python scripts/replay_notificacoes.py --sintetico 1000000    # benchmark em diretórios temporários
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from utils.journal import JournalNotificacoes
+from utils.replay import reprocessar, aplicar, TAMANHO_BLOCO
+
+LINHAS_POR_SEGMENTO = 200000
+
+
+def gerar_sintetico(quantidade, logs_dir, semente=42):
+    """Grava `quantidade` notificações em segmentos do diário e retorna os txids pendentes a criar.
+
+    Mistura o formato `pix`, OPENPIX:TRANSACTION_RECEIVED (só com correlationID),
+    reentregas fora de ordem e eventos desconhecidos.
+    """
+    aleatorio = random.Random(semente)
+    diario = os.path.join(logs_dir, 'journal')
+    os.makedirs(diario, exist_ok=True)
+    base = datetime(2025, 1, 1)
+    txids = []
+    arquivo = None
+    for seq in range(1, quantidade + 1):
+        if (seq - 1) % LINHAS_POR_SEGMENTO == 0:
+            if arquivo:
+                arquivo.close()
+            arquivo = open(os.path.join(diario, f"notificacoes-{(seq - 1) // LINHAS_POR_SEGMENTO + 1:06d}.jsonl"), 'w',
+                           encoding='utf-8')
+        horario = (base + timedelta(seconds=seq)).isoformat()
+        sorteio = aleatorio.random()
+        if sorteio < 0.05 and txids:
+            payload = {'event': 'OPENPIX:PIX_RECEIVED',
+                       'pix': {'status': 'COMPLETED', 'valor': 1.0, 'txid': aleatorio.choice(txids),
+                               'horario': (base + timedelta(seconds=aleatorio.randint(0, seq))).isoformat()}}
+        elif sorteio < 0.10:
+            payload = {'event': 'OPENPIX:CHARGE_CREATED', 'charge': {'status': 'ACTIVE', 'correlationID': f"sint-{seq}"}}
+        elif sorteio < 0.30:
+            txid = f"sint-{seq:09d}"
+            txids.append(txid)
+            payload = {'event': 'OPENPIX:TRANSACTION_RECEIVED',
+                       'charge': {'status': 'COMPLETED', 'value': seq % 10000 + 1, 'correlationID': txid,
+                                  'paidAt': horario}}
+        else:
+            txid = f"sint-{seq:09d}"
+            txids.append(txid)
+            payload = {'event': 'OPENPIX:PIX_RECEIVED',
+                       'pix': {'status': 'COMPLETED', 'valor': (seq % 10000 + 1) / 100, 'txid': txid,
+                               'e2eid': f"E{seq:031d}", 'horario': horario, 'infoPagador': {'nome': 'Pagador'}}}
+        entrada = {'seq': seq, 'id': f"sint_{seq}", 'recebido_em': horario, 'evento': payload['event'],
+                   'status': 'COMPLETED', 'payload': payload}
+        arquivo.write(json.dumps(entrada, ensure_ascii=False, separators=(',', ':')) + '\n')
+    if arquivo:
+        arquivo.close()
+    return txids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 1, help='processos do pool (1 = sem pool)')
+    parser.add_argument('--bloco', type=int, default=TAMANHO_BLOCO, help='notificações por tarefa do pool')
+    parser.add_argument('--legado', choices=('auto', 'sim', 'nao'), default='auto',
+                        help='inclui os arquivos pix_notification_*.json (auto: só se não houver diário)')
+    parser.add_argument('--simular', action='store_true', help='não grava no banco, apenas reporta')
+    parser.add_argument('--sintetico', type=int, default=0, help='gera N notificações e transações em diretórios temporários')
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    args = parser.parse_args()
+
+    relatorio = {
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {'processos': args.processos, 'bloco': args.bloco, 'simular': args.simular},
+    }
+
+    if args.sintetico:
+        os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='replay_dados_')
+        os.environ['LOGS_DIR'] = tempfile.mkdtemp(prefix='replay_logs_')
+    logs_dir = os.getenv('LOGS_DIR', os.path.join(RAIZ, 'logs'))
+    logging.disable(logging.INFO)
+
+    from utils.chaves_pix_manager import obter_store_transacoes, _nova_transacao
+    store = obter_store_transacoes()
+
+    if args.sintetico:
+        inicio = time.perf_counter()
+        txids = gerar_sintetico(args.sintetico, logs_dir)
+        for posicao in range(0, len(txids), 100000):
+            store.inserir_lote([_nova_transacao(1.0, 'BTC', 'sintetica', txid, 'PENDENTE')
+                                for txid in txids[posicao:posicao + 100000]])
+        relatorio['sintetico'] = {'notificacoes': args.sintetico, 'transacoes': len(txids),
+                                  'geracao_s': round(time.perf_counter() - inicio, 2)}
+
+    journal = JournalNotificacoes(os.path.join(logs_dir, 'journal'), legado_dir=logs_dir)
+    tem_diario = bool(journal.nomes_segmentos())
+    incluir_legado = args.legado == 'sim' or (args.legado == 'auto' and not tem_diario)
+
+    inicio = time.perf_counter()
+    estado, estatisticas = reprocessar(journal, logs_dir if incluir_legado else None,
+                                       processos=args.processos, tamanho_bloco=args.bloco)
+    reprocessamento = time.perf_counter() - inicio
+    relatorio.update(estatisticas)
+    relatorio['reprocessamento_s'] = round(reprocessamento, 2)
+    relatorio['notificacoes_por_s'] = round(estatisticas['lidas'] / reprocessamento) if reprocessamento else None
+
+    if not args.simular:
+        inicio = time.perf_counter()
+        relatorio.update(aplicar(store, estado))
+        escrita = time.perf_counter() - inicio
+        relatorio['escrita_s'] = round(escrita, 2)
+        relatorio['transacoes_por_s'] = round(len(estado) / escrita) if escrita else None
+    relatorio['total_s'] = round(reprocessamento + relatorio.get('escrita_s', 0), 2)
+
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    print(texto)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Simula a conversão de pagamentos confirmados (utils/conversao.py) contra o fake de cotações.
+
+Duas fases, com DATA_DIR e LOGS_DIR temporários:
+- cache: N threads pedem a mesma cotação ao mesmo tempo, com o cache vazio e um
+  provedor lento; deve haver uma única consulta ao provedor;
+- pipeline: grava N transações PENDENTE (BTC e USDT) e entrega N confirmações
+  simultâneas a processar_notificacao_pix. Confere que todas foram convertidas
+  pela cotação do fake, que cada moeda foi cotada uma vez e que reentregar as
+  confirmações não converte de novo.
+
+Uso:
+    python scripts/simular_conversao.py --confirmacoes 500 --latencia 0.2
+    python scripts/simular_conversao.py --confirmacoes 5000 --threads 64 --saida conversao.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+from datetime import datetime
+from decimal import Decimal, ROUND_DOWN
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from fake_cotacao import iniciar_servidor, PRECOS
+from utils.conversao import CacheCotacoes, ProvedorCoinGecko, CASAS_DECIMAIS
+
+IDS = {'BTC': 'bitcoin', 'USDT': 'tether'}
+
+
+def fase_cache(servidor, threads):
+    cache = CacheCotacoes(ProvedorCoinGecko(servidor.url), ttl=60)
+    barreira = threading.Barrier(threads)
+
+    def pedir(_):
+        barreira.wait()
+        return cache.cotar(['BTC']).get('BTC')
+
+    antes = servidor.estatisticas['consultas']
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        cotacoes = list(executor.map(pedir, range(threads)))
+    return {
+        'pedidos': threads,
+        'consultas_provedor': servidor.estatisticas['consultas'] - antes,
+        'respondidos': sum(1 for c in cotacoes if c),
+        'duracao_s': round(time.perf_counter() - inicio, 3),
+        'origens': cache.metricas(),
+    }
+
+
+def confirmacao(txid, valor):
+    return {'event': 'OPENPIX:PIX_RECEIVED',
+            'pix': {'status': 'COMPLETED', 'valor': valor, 'txid': txid, 'e2eid': f"E{txid}",
+                    'horario': datetime.now().isoformat()}}
+
+
+def fase_pipeline(webhook_pix, servidor, quantidade, threads, timeout):
+    from utils.chaves_pix_manager import salvar_transacoes_pix_lote, obter_store_transacoes
+    itens = [{'valor': round(10 + i * 0.37, 2), 'moeda': 'BTC' if i % 2 else 'USDT', 'chave_id': 'sim',
+              'txid': f"conv{i:08d}"} for i in range(quantidade)]
+    salvar_transacoes_pix_lote(itens)
+    store = obter_store_transacoes()
+
+    antes = servidor.estatisticas['consultas']
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        resultados = list(executor.map(lambda item: webhook_pix.processar_notificacao_pix(
+            confirmacao(item['txid'], item['valor'])), itens))
+    confirmado = time.perf_counter() - inicio
+    while next(store.pendentes_conversao(lote=1), None) is not None and time.perf_counter() - inicio < timeout:
+        time.sleep(0.05)
+    convertido = time.perf_counter() - inicio
+    consultas = servidor.estatisticas['consultas'] - antes
+
+    # Reentrega: não deve converter de novo nem consultar o provedor
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda item: webhook_pix.processar_notificacao_pix(
+            confirmacao(item['txid'], item['valor'])), itens[:100]))
+    time.sleep(webhook_pix.CONVERSAO_JANELA * 2)
+
+    divergentes = 0
+    convertidas = 0
+    for transacao in store.iterar():
+        conversao = transacao.get('conversao')
+        if not conversao:
+            continue
+        convertidas += 1
+        preco = Decimal(str(PRECOS[IDS[transacao['moeda']]]))
+        esperado = (Decimal(str(transacao['valor'])) / preco).quantize(
+            Decimal(1).scaleb(-CASAS_DECIMAIS[transacao['moeda']]), rounding=ROUND_DOWN)
+        divergentes += Decimal(conversao['quantidade']) != esperado or conversao['moeda'] != transacao['moeda']
+    return {
+        'confirmacoes': quantidade,
+        'erros_confirmacao': sum(1 for r in resultados if r.get('status') == 'ERROR'),
+        'confirmacao_s': round(confirmado, 3),
+        'conversao_s': round(convertido, 3),
+        'convertidas': convertidas,
+        'divergentes': divergentes,
+        'consultas_provedor': consultas,
+        'consultas_apos_reentrega': servidor.estatisticas['consultas'] - antes - consultas,
+        'conversor': webhook_pix.obter_conversor().metricas(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--confirmacoes', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=32, help='confirmações simultâneas')
+    parser.add_argument('--latencia', type=float, default=0.2, help='latência do fake de cotações, em segundos')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    args = parser.parse_args()
+
+    servidor = iniciar_servidor(latencia=args.latencia)
+    os.environ.update({
+        'DATA_DIR': tempfile.mkdtemp(prefix='simular_conversao_'),
+        'LOGS_DIR': tempfile.mkdtemp(prefix='simular_conversao_logs_'),
+        'COTACAO_PROVEDOR': 'coingecko',
+        'COTACAO_URL': servidor.url,
+        'EXPIRACAO_ATIVA': '0',
+    })
+    logging.disable(logging.WARNING)
+    import webhook_pix
+
+    relatorio = {
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {'confirmacoes': args.confirmacoes, 'threads': args.threads, 'latencia': args.latencia},
+        'cache': fase_cache(servidor, args.threads),
+        'pipeline': fase_pipeline(webhook_pix, servidor, args.confirmacoes, args.threads, args.timeout),
+    }
+    servidor.shutdown()
+
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    print(texto)
+    pipeline = relatorio['pipeline']
+    falhou = (relatorio['cache']['consultas_provedor'] != 1 or pipeline['divergentes']
+              or pipeline['convertidas'] != args.confirmacoes or pipeline['consultas_provedor'] > len(IDS)
+              or pipeline['consultas_apos_reentrega'])
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Simula o agendador de expiração (utils/expiracao.py) contra o fake da OpenPix.
+
+Cria cobranças no fake com prazo curto e grava as transações como PENDENTE. Uma parte
+delas é paga no fake sem que o webhook seja entregue. Depois sobe o agendador em
+vários processos que disputam a liderança, como os workers do gunicorn, e confere:
+- as cobranças pagas foram concluídas pela reconciliação;
+- as demais expiraram;
+- o fake recebeu uma única série de consultas, e não uma por processo;
+- a taxa de consultas ficou dentro do limite.
+
+Uso:
+    python scripts/simular_expiracao.py --cobrancas 200 --pagas 0.3 --expiracao 5 --processos 3
+    python scripts/simular_expiracao.py --cobrancas 1000 --taxa 50 --latencia 0.02
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import requests
+from fake_openpix import iniciar_servidor
+from utils.openpix_client import OpenPixClient
+from utils.transacoes_store import TransacoesStoreSQLite
+from utils.armazenamento import Lideranca
+from utils.expiracao import AgendadorExpiracao
+from utils.chaves_pix_manager import _nova_transacao
+
+
+def executar_agendador(caminho_db, url, args):
+    """Processo que imita um worker: inicia o agendador e espera ser encerrado."""
+    logging.disable(logging.CRITICAL)
+    cliente = OpenPixClient(url, 'fake', max_tentativas=1)
+    agendador = AgendadorExpiracao(
+        TransacoesStoreSQLite(caminho_db), consultar=lambda txid: cliente.consultar_cobranca(txid)['charge'],
+        lideranca=Lideranca(caminho_db), expiracao=args.expiracao, reconciliar_apos=args.expiracao / 2,
+        reconciliar_intervalo=args.expiracao, tolerancia=1, intervalo=0.2, intervalo_lideranca=0.5,
+        lote=args.lote, taxa=args.taxa, concorrencia=args.concorrencia
+    )
+    agendador.iniciar()
+    while True:
+        time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cobrancas', type=int, default=200)
+    parser.add_argument('--pagas', type=float, default=0.3, help='fração paga no fake sem webhook')
+    parser.add_argument('--expiracao', type=float, default=5, help='prazo das cobranças, em segundos')
+    parser.add_argument('--processos', type=int, default=3, help='processos disputando a liderança')
+    parser.add_argument('--taxa', type=float, default=100, help='consultas por segundo à OpenPix')
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--lote', type=int, default=100)
+    parser.add_argument('--latencia', type=float, default=0.0, help='latência simulada do fake')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    servidor = iniciar_servidor(latencia=args.latencia)
+    cliente = OpenPixClient(servidor.url, 'fake')
+    caminho_db = os.path.join(tempfile.mkdtemp(prefix='simular_expiracao_'), 'transacoes.db')
+    store = TransacoesStoreSQLite(caminho_db)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        cobrancas = list(executor.map(
+            lambda i: cliente.criar_cobranca({'correlationID': f"sim-{i:06d}", 'value': 100 + i,
+                                              'expiresIn': int(max(args.expiracao, 1))})['charge'],
+            range(args.cobrancas)
+        ))
+    store.inserir_lote([_nova_transacao(c['value'] / 100, 'BTC', 'chave-sim', c['correlationID'], 'PENDENTE')
+                        for c in cobrancas])
+    pagas = {c['correlationID'] for c in cobrancas[:int(args.cobrancas * args.pagas)]}
+    for txid in pagas:
+        requests.post(f"http://{servidor.server_address[0]}:{servidor.server_address[1]}/__fake/pagar/{txid}")
+
+    inicio = time.time()
+    contexto = multiprocessing.get_context('fork')
+    processos = [contexto.Process(target=executar_agendador, args=(caminho_db, servidor.url, args), daemon=True)
+                 for _ in range(args.processos)]
+    for processo in processos:
+        processo.start()
+    while store.consultar(status='PENDENTE', limite=1)[0] and time.time() - inicio < args.timeout:
+        time.sleep(0.2)
+    duracao = time.time() - inicio
+    for processo in processos:
+        processo.terminate()
+
+    status = {}
+    erros = 0
+    for transacao in store.iterar():
+        status[transacao['status']] = status.get(transacao['status'], 0) + 1
+        esperado = 'CONCLUIDA' if transacao['txid'] in pagas else 'EXPIRADA'
+        erros += transacao['status'] != esperado
+    consultas = servidor.estatisticas['consultas']
+    relatorio = {
+        'cobrancas': args.cobrancas,
+        'processos': args.processos,
+        'duracao_s': round(duracao, 2),
+        'status': status,
+        'divergentes': erros,
+        'consultas_openpix': consultas,
+        'consultas_por_cobranca': round(consultas / args.cobrancas, 2) if args.cobrancas else None,
+        'taxa_limite': args.taxa,
+    }
+    servidor.shutdown()
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    sys.exit(1 if erros or status.get('PENDENTE') else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Teste de estresse do armazenamento com vários processos.
+Simula N workers do gunicorn gravando chaves e transações no mesmo DATA_DIR
+e verifica, ao final, que nenhuma gravação foi perdida. Com --shards, as transações
+são distribuídas entre vários bancos (TRANSACOES_SHARDS), e a duração mostra quanto
+a disputa pelo bloqueio de escrita do SQLite diminui.
+
+Uso:
+    python scripts/stress_armazenamento.py --processos 8 --operacoes 200
+    python scripts/stress_armazenamento.py --processos 8 --operacoes 500 --shards 4 --sem-chaves
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import multiprocessing
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def worker(data_dir, indice, operacoes, shards, chaves):
+    """Executa gravações concorrentes a partir de um processo independente."""
+    os.environ['DATA_DIR'] = data_dir
+    os.environ['TRANSACOES_SHARDS'] = str(shards)
+    sys.path.insert(0, RAIZ)
+    import logging
+    logging.disable(logging.CRITICAL)
+    from utils import chaves_pix_manager as m
+
+    for i in range(operacoes):
+        txid = f"w{indice}-{i}"
+        m.salvar_transacao_pix(1.0, 'BTC', 'chave', txid)
+        m.atualizar_transacao_pix(txid, 'CONCLUIDA')
+        if chaves and i % 10 == 0:
+            m.adicionar_chave_pix(f"worker {indice}", 'E-mail', f"{txid}@exemplo.com")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processos', type=int, default=8)
+    parser.add_argument('--operacoes', type=int, default=200)
+    parser.add_argument('--shards', type=int, default=1, help='bancos de transações (TRANSACOES_SHARDS)')
+    parser.add_argument('--sem-chaves', action='store_true', help='grava só transações (mede apenas os shards)')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='stress_pix_')
+    ctx = multiprocessing.get_context('spawn')
+    inicio = time.time()
+    processos = [ctx.Process(target=worker, args=(data_dir, i, args.operacoes, args.shards, not args.sem_chaves)) for i in range(args.processos)]
+    for p in processos:
+        p.start()
+    for p in processos:
+        p.join()
+    duracao = time.time() - inicio
+
+    os.environ['DATA_DIR'] = data_dir
+    os.environ['TRANSACOES_SHARDS'] = str(args.shards)
+    sys.path.insert(0, RAIZ)
+    import logging
+    logging.disable(logging.CRITICAL)
+    from utils import chaves_pix_manager as m
+
+    transacoes = m.carregar_transacoes_pix()
+    chaves = [] if args.sem_chaves else m.carregar_chaves_pix()
+    esperado_transacoes = args.processos * args.operacoes
+    esperado_chaves = 0 if args.sem_chaves else args.processos * len(range(0, args.operacoes, 10)) + 1  # + chave padrão
+    concluidas = sum(1 for t in transacoes if t['status'] == 'CONCLUIDA')
+
+    print(f"Diretório de dados: {data_dir}")
+    print(f"Duração: {duracao:.2f}s ({args.shards} shard(s), {esperado_transacoes * 2 / duracao:.0f} escritas/s)")
+    print(f"Transações: {len(transacoes)}/{esperado_transacoes} (concluídas: {concluidas})")
+    print(f"Chaves: {len(chaves)}/{esperado_chaves}")
+
+    ok = (len(transacoes) == esperado_transacoes and concluidas == esperado_transacoes
+          and len(chaves) == esperado_chaves)
+    print("OK: nenhuma gravação perdida" if ok else "FALHA: gravações perdidas")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
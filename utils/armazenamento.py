@@ -0,0 +1,123 @@
+import os
+import json
+import tempfile
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o bloqueio entre threads do mesmo processo
+    fcntl = None
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+_bloqueios = {}
+_bloqueios_lock = threading.Lock()
+
+
+class _BloqueioArquivo:
+    """Bloqueio exclusivo entre processos (flock) e reentrante dentro do processo."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho + '.lock'
+        self._rlock = threading.RLock()
+        self._profundidade = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._profundidade == 0:
+            try:
+                self._fd = os.open(self.caminho, os.O_CREAT | os.O_RDWR, 0o644)
+                if fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except Exception:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._rlock.release()
+                raise
+        self._profundidade += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._profundidade -= 1
+        if self._profundidade == 0:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+        return False
+
+
+def bloqueio_arquivo(caminho):
+    """Retorna o bloqueio associado ao arquivo, para uso com `with`.
+
+    Protege sequências de leitura-modificação-escrita entre workers do gunicorn.
+    """
+    with _bloqueios_lock:
+        bloqueio = _bloqueios.get(caminho)
+        if bloqueio is None:
+            bloqueio = _bloqueios[caminho] = _BloqueioArquivo(caminho)
+        return bloqueio
+
+
+def escrever_json_atomico(caminho, dados, fsync=True, **kwargs):
+    """Grava JSON em um arquivo temporário e o renomeia sobre o destino.
+
+    Leitores nunca veem um arquivo truncado, mesmo se o processo morrer no meio da escrita.
+    Com fsync=False a troca continua atômica, mas não resiste a uma queda de energia.
+    """
+    diretorio = os.path.dirname(caminho) or '.'
+    fd, temporario = tempfile.mkstemp(dir=diretorio, prefix='.' + os.path.basename(caminho), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, **kwargs)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+    except Exception:
+        try:
+            os.unlink(temporario)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class Lideranca:
+    """Eleição de um único processo líder entre os workers, por flock não bloqueante.
+
+    O líder mantém o arquivo travado enquanto viver; se o processo morrer, o kernel
+    libera o bloqueio e outro worker o assume na próxima tentativa.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho + '.lock'
+        self._fd = None
+        self._pid = None
+
+    def tentar(self):
+        """Retorna True se este processo é (ou acabou de se tornar) o líder."""
+        if self._fd is not None and self._pid == os.getpid():
+            return True
+        fd = os.open(self.caminho, os.O_CREAT | os.O_RDWR, 0o644)
+        if fcntl:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        self._fd = fd
+        self._pid = os.getpid()
+        return True
+
+    def liberar(self):
+        if self._fd is not None and self._pid == os.getpid():
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+        self._pid = None
@@ -0,0 +1,127 @@
+import io
+import os
+import re
+import unicodedata
+import logging
+from functools import lru_cache
+
+try:
+    import qrcode
+    from qrcode.image.pure import PyPNGImage
+    from qrcode.image.svg import SvgPathImage
+except ImportError:  # Sem qrcode, apenas o payload (copia e cola) é gerado localmente
+    qrcode = None
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Dados do recebedor exigidos pelo padrão EMV do Pix
+NOME_RECEBEDOR = os.getenv('PIX_NOME_RECEBEDOR', 'RECEBEDOR PIX')
+CIDADE_RECEBEDOR = os.getenv('PIX_CIDADE_RECEBEDOR', 'SAO PAULO')
+BRCODE_CACHE = int(os.getenv('BRCODE_CACHE', '1024'))
+
+FORMATOS_QRCODE = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+def _tabela_crc16():
+    tabela = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        tabela.append(crc & 0xFFFF)
+    return tabela
+
+
+_TABELA_CRC16 = _tabela_crc16()
+
+
+def crc16_ccitt(dados):
+    """CRC16-CCITT (polinômio 0x1021, valor inicial 0xFFFF), exigido no campo 63 do BR Code."""
+    crc = 0xFFFF
+    tabela = _TABELA_CRC16
+    for byte in dados:
+        crc = ((crc << 8) & 0xFFFF) ^ tabela[(crc >> 8) ^ byte]
+    return crc
+
+
+def _campo(identificador, valor):
+    """Monta um campo TLV do EMV: ID (2 dígitos) + tamanho (2 dígitos) + valor."""
+    if len(valor) > 99:
+        raise ValueError(f"Campo {identificador} excede 99 caracteres")
+    return f"{identificador}{len(valor):02d}{valor}"
+
+
+def _texto_emv(texto, limite):
+    """Remove acentos e caracteres fora do conjunto aceito pelos leitores de QR Pix."""
+    texto = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^A-Za-z0-9 $%*+\-./:@]', '', texto).strip()[:limite]
+
+
+def formatar_chave(tipo_chave, chave):
+    """Normaliza a chave Pix conforme o tipo cadastrado em adicionar_chave_pix."""
+    chave = (chave or '').strip()
+    if tipo_chave in ('CPF', 'CNPJ'):
+        return re.sub(r'\D', '', chave)
+    if tipo_chave == 'Telefone':
+        digitos = re.sub(r'\D', '', chave)
+        return '+' + (digitos if digitos.startswith('55') and len(digitos) > 11 else '55' + digitos)
+    if tipo_chave == 'E-mail':
+        return chave.lower()
+    return chave
+
+
+@lru_cache(maxsize=BRCODE_CACHE)
+def gerar_payload(tipo_chave, chave, valor=None, descricao='', txid='***'):
+    """Gera o payload BR Code (Pix copia e cola) de um QR estático.
+
+    `valor` é opcional (o pagador digita o valor quando ausente). A descrição é cortada
+    no espaço que sobra no campo 26. Levanta ValueError se a chave ou o valor não couberem
+    nos campos do EMV.
+    """
+    gui = _campo('00', 'br.gov.bcb.pix') + _campo('01', formatar_chave(tipo_chave, chave))
+    descricao = _texto_emv(descricao, max(0, 99 - len(gui) - 4))
+    if descricao:
+        gui += _campo('02', descricao)
+    partes = [
+        _campo('00', '01'),
+        _campo('26', gui),
+        _campo('52', '0000'),
+        _campo('53', '986'),  # BRL
+    ]
+    if valor is not None:
+        valor = f"{valor:.2f}"
+        if len(valor) > 13:
+            raise ValueError("Valor excede 13 caracteres")
+        partes.append(_campo('54', valor))
+    partes += [
+        _campo('58', 'BR'),
+        _campo('59', _texto_emv(NOME_RECEBEDOR, 25) or 'RECEBEDOR'),
+        _campo('60', _texto_emv(CIDADE_RECEBEDOR, 15) or 'SAO PAULO'),
+        _campo('62', _campo('05', _texto_emv(txid, 25) or '***')),
+        '6304'
+    ]
+    payload = ''.join(partes)
+    return f"{payload}{crc16_ccitt(payload.encode('ascii')):04X}"
+
+
+@lru_cache(maxsize=BRCODE_CACHE)
+def renderizar_qrcode(payload, formato='png'):
+    """Renderiza o QR Code do payload em PNG ou SVG (bytes), em processo e com cache LRU."""
+    if qrcode is None:
+        raise RuntimeError("Renderização local de QR Code requer o pacote qrcode[png]")
+    if formato not in FORMATOS_QRCODE:
+        raise ValueError(f"Formato de QR Code não suportado: {formato}")
+    fabrica = PyPNGImage if formato == 'png' else SvgPathImage
+    imagem = qrcode.make(payload, image_factory=fabrica, box_size=8, border=2,
+                         error_correction=qrcode.constants.ERROR_CORRECT_M)
+    saida = io.BytesIO()
+    imagem.save(saida)
+    return saida.getvalue()
+
+
+def estatisticas_cache():
+    return {
+        'payload': gerar_payload.cache_info()._asdict(),
+        'qrcode': renderizar_qrcode.cache_info()._asdict()
+    }
@@ -3,32 +3,90 @@ import json
 import uuid
 from datetime import datetime
 import logging
+import threading
+from utils.transacoes_store import criar_store
+from utils.armazenamento import bloqueio_arquivo, escrever_json_atomico
+from utils.log_estruturado import CampoLimitado
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
 # Define o diretório onde os dados serão armazenados
-if 'RENDER' in os.environ:
+if os.environ.get('DATA_DIR'):
+    DATA_DIR = os.environ['DATA_DIR']
+elif 'RENDER' in os.environ:
     DATA_DIR = '/tmp'
 else:
     DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
 
 CHAVES_FILE = os.path.join(DATA_DIR, 'chaves_pix.json')
-TRANSACOES_FILE = os.path.join(DATA_DIR, 'transacoes_pix.json')
+TRANSACOES_FILE = os.path.join(DATA_DIR, 'transacoes_pix.json')  # Formato legado, migrado para o banco
+TRANSACOES_DB = os.path.join(DATA_DIR, 'transacoes_pix.db')
 
 # Garante que o diretório de dados exista
 os.makedirs(DATA_DIR, exist_ok=True)
 logger.info(f"Diretório de dados configurado: {DATA_DIR}")
 
+_store = None
+_store_lock = threading.Lock()
+
+def obter_store_transacoes():
+    """Retorna o armazenamento de transações, migrando o JSON legado na primeira vez."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = criar_store(TRANSACOES_DB)
+                migrar_transacoes_json(store)
+                _store = store
+    return _store
+
+def migrar_transacoes_json(store=None):
+    """Migração única de transacoes_pix.json para o armazenamento indexado."""
+    store = store or obter_store_transacoes()
+    try:
+        return store.migrar_de_json(TRANSACOES_FILE)
+    except Exception as e:
+        logger.error(f"Erro ao migrar {TRANSACOES_FILE}: {str(e)}")
+        return 0
+
+# Cache em memória das chaves Pix deste processo, invalidado pela versão do arquivo
+_cache_chaves = {'versao': None, 'lista': [], 'por_id': {}}
+_cache_chaves_lock = threading.Lock()
+
+def _versao_stat(st):
+    """Versão do arquivo de chaves: muda a cada escrita atômica (novo inode/mtime)."""
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def versao_chaves_pix():
+    """Retorna a versão atual do arquivo de chaves ou None se ele não existir."""
+    try:
+        return _versao_stat(os.stat(CHAVES_FILE))
+    except FileNotFoundError:
+        return None
+
+def _atualizar_cache_chaves(versao, chaves):
+    with _cache_chaves_lock:
+        _cache_chaves['versao'] = versao
+        _cache_chaves['lista'] = chaves
+        _cache_chaves['por_id'] = {c['id']: c for c in chaves}
+
 def carregar_chaves_pix():
-    """Carrega as chaves Pix do arquivo JSON ou cria padrão se não existir."""
+    """Carrega as chaves Pix do arquivo JSON ou cria padrão se não existir.
+
+    Enquanto o arquivo não muda, a lista é servida do cache em memória sem reler o JSON.
+    """
+    versao = versao_chaves_pix()
+    if versao is not None and versao == _cache_chaves['versao']:
+        return list(_cache_chaves['lista'])
     logger.info(f"Tentando carregar chaves de {CHAVES_FILE}")
-    if os.path.exists(CHAVES_FILE):
+    if versao is not None:
         try:
             with open(CHAVES_FILE, 'r', encoding='utf-8') as f:
                 chaves = json.load(f)
-                logger.info(f"Chaves carregadas: {json.dumps(chaves, indent=4)}")
-                return chaves
+                _atualizar_cache_chaves(_versao_stat(os.fstat(f.fileno())), chaves)
+                logger.info("Chaves carregadas: %d (%s)", len(chaves), CampoLimitado(chaves))
+                return list(chaves)
         except Exception as e:
             logger.error(f"Erro ao carregar chaves_pix: {str(e)}")
             return criar_chaves_padrao()
@@ -36,12 +94,19 @@ def carregar_chaves_pix():
         logger.info(f"Arquivo {CHAVES_FILE} não existe, criando chaves padrão")
         return criar_chaves_padrao()
 
+def obter_chave_pix(chave_id):
+    """Busca uma chave Pix pelo ID usando o índice em memória."""
+    if versao_chaves_pix() != _cache_chaves['versao']:
+        carregar_chaves_pix()
+    return _cache_chaves['por_id'].get(chave_id)
+
 def salvar_chaves_pix(chaves):
     """Salva a lista de chaves Pix no arquivo JSON."""
     logger.info(f"Tentando salvar chaves em {CHAVES_FILE}")
     try:
-        with open(CHAVES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(chaves, f, indent=4, ensure_ascii=False)
+        with bloqueio_arquivo(CHAVES_FILE):
+            escrever_json_atomico(CHAVES_FILE, chaves, indent=4, ensure_ascii=False)
+            _atualizar_cache_chaves(versao_chaves_pix(), list(chaves))
         logger.info(f"Chaves salvas com sucesso em {CHAVES_FILE}")
         return True
     except Exception as e:
@@ -50,6 +115,17 @@ def salvar_chaves_pix(chaves):
 
 def criar_chaves_padrao():
     """Cria uma lista padrão de chaves Pix."""
+    with bloqueio_arquivo(CHAVES_FILE):
+        # Outro worker pode ter criado o arquivo enquanto aguardávamos o bloqueio
+        if os.path.exists(CHAVES_FILE):
+            try:
+                with open(CHAVES_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Erro ao carregar chaves_pix: {str(e)}")
+        return _criar_chaves_padrao()
+
+def _criar_chaves_padrao():
     chaves_padrao = [
         {
             'id': str(uuid.uuid4()),
@@ -59,14 +135,13 @@ def criar_chaves_padrao():
             'data_cadastro': datetime.now().strftime('%d/%m/%Y %H:%M')
         }
     ]
-    logger.info(f"Criando chaves padrão: {json.dumps(chaves_padrao, indent=4)}")
+    logger.info("Criando chaves padrão: %s", CampoLimitado(chaves_padrao))
     salvar_chaves_pix(chaves_padrao)
     return chaves_padrao
 
 def adicionar_chave_pix(descricao, tipo_chave, chave):
     """Adiciona uma nova chave Pix e salva no arquivo."""
     logger.info(f"Adicionando chave: descricao={descricao}, tipo_chave={tipo_chave}, chave={chave}")
-    chaves = carregar_chaves_pix()
     nova_chave = {
         'id': str(uuid.uuid4()),
         'descricao': descricao,
@@ -74,79 +149,132 @@ def adicionar_chave_pix(descricao, tipo_chave, chave):
         'chave': chave,
         'data_cadastro': datetime.now().strftime('%d/%m/%Y %H:%M')
     }
-    chaves.append(nova_chave)
-    if not salvar_chaves_pix(chaves):
-        logger.error("Falha ao salvar chaves Pix")
-        raise Exception("Falha ao salvar chaves Pix")
-    logger.info(f"Chave adicionada com sucesso: {json.dumps(nova_chave, indent=4)}")
+    with bloqueio_arquivo(CHAVES_FILE):
+        chaves = carregar_chaves_pix()
+        chaves.append(nova_chave)
+        if not salvar_chaves_pix(chaves):
+            logger.error("Falha ao salvar chaves Pix")
+            raise Exception("Falha ao salvar chaves Pix")
+    logger.info("Chave adicionada com sucesso: %s", CampoLimitado(nova_chave))
     return nova_chave
 
 def remover_chave_pix(chave_id):
     """Remove uma chave Pix pelo ID e salva a lista atualizada."""
     logger.info(f"Tentando remover chave com ID: {chave_id}")
-    chaves = carregar_chaves_pix()
-    chaves_filtradas = [c for c in chaves if c['id'] != chave_id]
-    if len(chaves_filtradas) != len(chaves):
-        if salvar_chaves_pix(chaves_filtradas):
-            logger.info(f"Chave com ID {chave_id} removida com sucesso")
-            return True
-        else:
-            logger.error("Falha ao salvar chaves após remoção")
-            return False
+    with bloqueio_arquivo(CHAVES_FILE):
+        chaves = carregar_chaves_pix()
+        chaves_filtradas = [c for c in chaves if c['id'] != chave_id]
+        if len(chaves_filtradas) != len(chaves):
+            if salvar_chaves_pix(chaves_filtradas):
+                logger.info(f"Chave com ID {chave_id} removida com sucesso")
+                return True
+            else:
+                logger.error("Falha ao salvar chaves após remoção")
+                return False
     logger.warning(f"Chave com ID {chave_id} não encontrada")
     return False
 
-def salvar_transacao_pix(valor, moeda, chave_id, txid, status='PENDENTE'):
-    """Salva uma transação Pix no arquivo JSON."""
-    logger.info(f"Salvando transação: valor={valor}, moeda={moeda}, chave_id={chave_id}, txid={txid}, status={status}")
-    transacoes = carregar_transacoes_pix()
-    nova_transacao = {
+def _nova_transacao(valor, moeda, chave_id, txid, status):
+    return {
         'id': str(uuid.uuid4()),
         'valor': valor,
         'moeda': moeda,
         'chave_id': chave_id,
         'txid': txid,
         'status': status,
-        'data_criacao': datetime.now().strftime('%d/%m/%Y %H:%M')
+        'data_criacao': datetime.now().isoformat(timespec='seconds')
     }
-    transacoes.append(nova_transacao)
+
+def salvar_transacao_pix(valor, moeda, chave_id, txid, status='PENDENTE'):
+    """Salva uma transação Pix no armazenamento de transações."""
+    logger.info(f"Salvando transação: valor={valor}, moeda={moeda}, chave_id={chave_id}, txid={txid}, status={status}")
+    nova_transacao = _nova_transacao(valor, moeda, chave_id, txid, status)
     try:
-        with open(TRANSACOES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(transacoes, f, indent=4, ensure_ascii=False)
-        logger.info(f"Transação salva com sucesso em {TRANSACOES_FILE}")
+        obter_store_transacoes().inserir(nova_transacao)
+        logger.info(f"Transação salva com sucesso em {TRANSACOES_DB}")
         return nova_transacao
     except Exception as e:
         logger.error(f"Erro ao salvar transação: {str(e)}")
         return None
 
+def salvar_transacoes_pix_lote(itens):
+    """Salva várias transações em uma única escrita.
+
+    `itens` é uma lista de dicts com valor, moeda, chave_id, txid e, opcionalmente, status.
+    Retorna a lista de transações salvas ou None em caso de erro.
+    """
+    logger.info(f"Salvando lote de {len(itens)} transações")
+    transacoes = [
+        _nova_transacao(item['valor'], item['moeda'], item['chave_id'], item['txid'], item.get('status', 'PENDENTE'))
+        for item in itens
+    ]
+    try:
+        obter_store_transacoes().inserir_lote(transacoes)
+        logger.info(f"Lote de {len(transacoes)} transações salvo com sucesso em {TRANSACOES_DB}")
+        return transacoes
+    except Exception as e:
+        logger.error(f"Erro ao salvar lote de transações: {str(e)}")
+        return None
+
 def carregar_transacoes_pix():
-    """Carrega as transações Pix do arquivo JSON."""
-    logger.info(f"Tentando carregar transações de {TRANSACOES_FILE}")
-    if os.path.exists(TRANSACOES_FILE):
-        try:
-            with open(TRANSACOES_FILE, 'r', encoding='utf-8') as f:
-                transacoes = json.load(f)
-                logger.info(f"Transações carregadas: {json.dumps(transacoes, indent=4)}")
-                return transacoes
-        except Exception as e:
-            logger.error(f"Erro ao carregar transações: {str(e)}")
-            return []
-    return []
+    """Carrega as transações Pix do armazenamento de transações."""
+    logger.info(f"Tentando carregar transações de {TRANSACOES_DB}")
+    try:
+        transacoes = obter_store_transacoes().listar()
+        logger.info("Transações carregadas: %d", len(transacoes))
+        return transacoes
+    except Exception as e:
+        logger.error(f"Erro ao carregar transações: {str(e)}")
+        return []
+
+def consultar_transacoes_pix(status=None, chave_id=None, moeda=None, desde=None, ate=None, limite=100, cursor=None):
+    """Consulta transações pelos índices secundários. Retorna (transacoes, proximo_cursor).
+
+    Levanta ValueError para datas ou cursor inválidos.
+    """
+    return obter_store_transacoes().consultar(status=status, chave_id=chave_id, moeda=moeda,
+                                              desde=desde, ate=ate, limite=limite, cursor=cursor)
+
+def iterar_transacoes_pix(status=None, chave_id=None, moeda=None, desde=None, ate=None):
+    """Percorre as transações filtradas em ordem cronológica, em lotes, sem carregar o histórico."""
+    return obter_store_transacoes().iterar(status=status, chave_id=chave_id, moeda=moeda, desde=desde, ate=ate)
+
+def buscar_transacao_pix(txid):
+    """Retorna a transação com o txid informado ou None."""
+    try:
+        return obter_store_transacoes().buscar_por_txid(txid)
+    except Exception as e:
+        logger.error(f"Erro ao buscar transação {txid}: {str(e)}")
+        return None
 
 def atualizar_transacao_pix(txid, status):
-    """Atualiza o status de uma transação Pix pelo txid."""
+    """Atualiza o status de uma transação Pix pelo txid.
+
+    Retorna None se a transação não existir. Erros do armazenamento (ex.: banco ocupado)
+    são propagados, para não serem confundidos com uma transação inexistente.
+    """
     logger.info(f"Atualizando transação com txid: {txid}, novo status: {status}")
-    transacoes = carregar_transacoes_pix()
-    for transacao in transacoes:
-        if transacao['txid'] == txid:
-            transacao['status'] = status
-            try:
-                with open(TRANSACOES_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(transacoes, f, indent=4, ensure_ascii=False)
-                logger.info(f"Transação atualizada com sucesso: {txid}")
-                return transacao
-            except Exception as e:
-                logger.error(f"Erro ao atualizar transação: {str(e)}")
-                return None
-    logger.warning(f"Transação com txid {txid} não encontrada")
-    return None
+    try:
+        transacao = obter_store_transacoes().atualizar_status(txid, status)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar transação: {str(e)}")
+        raise
+    if transacao is None:
+        logger.warning(f"Transação com txid {txid} não encontrada")
+        return None
+    logger.info(f"Transação atualizada com sucesso: {txid}")
+    return transacao
+
+def atualizar_transacoes_pix_lote(atualizacoes, somente_status=None):
+    """Atualiza o status de várias transações, pares (txid, status), em uma única escrita.
+
+    Retorna a lista de transações alteradas ou None em caso de erro.
+    """
+    logger.info(f"Atualizando lote de {len(atualizacoes)} transações")
+    try:
+        alteradas = obter_store_transacoes().atualizar_status_lote(atualizacoes, somente_status=somente_status)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar lote de transações: {str(e)}")
+        return None
+    logger.info(f"Lote de transações atualizado: {len(alteradas)} de {len(atualizacoes)} alteradas")
+    return alteradas
@@ -0,0 +1,386 @@
+import os
+import time
+import threading
+import logging
+from datetime import datetime
+from decimal import Decimal, ROUND_DOWN, InvalidOperation
+import requests
+from utils import metricas
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Casas decimais da quantidade creditada em cada moeda (o restante é arredondado para baixo)
+CASAS_DECIMAIS = {'BTC': 8, 'ETH': 8, 'USDT': 6}
+
+# Moedas aceitas na criação de cobranças; as demais não teriam como ser convertidas
+MOEDAS_SUPORTADAS = frozenset(CASAS_DECIMAIS)
+
+COTACOES = metricas.contador('pix_cotacao_pedidos_total',
+                             'Pedidos de cotação por moeda e origem (cache, coalescida, provedor ou erro)',
+                             ('moeda', 'origem'))
+PROVEDOR = metricas.histograma('pix_cotacao_provedor_segundos', 'Latência das consultas ao provedor de cotações',
+                               ('provedor', 'resultado'))
+CONVERSOES = metricas.contador('pix_conversoes_total', 'Conversões de pagamentos confirmados por moeda e resultado',
+                               ('moeda', 'resultado'))
+LOTES = metricas.histograma('pix_conversao_lote_segundos', 'Duração de cada lote de conversões')
+
+
+class CotacaoErro(Exception):
+    """Erro ao obter a cotação de uma moeda."""
+
+
+class ProvedorFixo:
+    """Cotações fixas em BRL, ex.: 'BTC=350000,USDT=5.40' (desenvolvimento e testes)."""
+
+    nome = 'fixo'
+
+    def __init__(self, cotacoes):
+        if isinstance(cotacoes, str):
+            pares = [par.split('=', 1) for par in cotacoes.split(',') if '=' in par]
+            cotacoes = {moeda.strip().upper(): preco.strip() for moeda, preco in pares}
+        self.cotacoes = {moeda: Decimal(str(preco)) for moeda, preco in cotacoes.items()}
+
+    def cotar(self, moedas):
+        return {moeda: self.cotacoes[moeda] for moeda in moedas if moeda in self.cotacoes}
+
+
+class ProvedorCoinGecko:
+    """Preço em BRL pela rota /simple/price da CoinGecko ou de um servidor compatível
+    (ex.: scripts/fake_cotacao.py). Todas as moedas pedidas vão em uma única requisição."""
+
+    nome = 'coingecko'
+    IDS = {'BTC': 'bitcoin', 'ETH': 'ethereum', 'USDT': 'tether'}
+
+    def __init__(self, url='https://api.coingecko.com/api/v3', chave_api=None, timeout=5):
+        self.url = url.rstrip('/')
+        self.chave_api = chave_api
+        self.timeout = timeout
+        self._sessao = None
+        self._pid = None
+
+    def _obter_sessao(self):
+        """Sessão HTTP por processo (o pool de conexões não sobrevive a um fork)."""
+        if self._sessao is None or self._pid != os.getpid():
+            self._sessao = requests.Session()
+            if self.chave_api:
+                self._sessao.headers['x-cg-demo-api-key'] = self.chave_api
+            self._pid = os.getpid()
+        return self._sessao
+
+    def cotar(self, moedas):
+        ids = {self.IDS[moeda]: moeda for moeda in moedas if moeda in self.IDS}
+        if not ids:
+            return {}
+        try:
+            resposta = self._obter_sessao().get(f"{self.url}/simple/price", timeout=self.timeout,
+                                                params={'ids': ','.join(sorted(ids)), 'vs_currencies': 'brl'})
+        except requests.RequestException as e:
+            raise CotacaoErro(f"Falha ao consultar {self.url}: {str(e)}")
+        if resposta.status_code != 200:
+            raise CotacaoErro(f"Provedor de cotações respondeu HTTP {resposta.status_code}")
+        dados = resposta.json()
+        cotacoes = {}
+        for id_moeda, moeda in ids.items():
+            preco = (dados.get(id_moeda) or {}).get('brl')
+            if preco is not None:
+                cotacoes[moeda] = Decimal(str(preco))
+        return cotacoes
+
+
+# Provedores disponíveis, selecionados pela variável de ambiente COTACAO_PROVEDOR
+PROVEDORES = {
+    'coingecko': lambda: ProvedorCoinGecko(os.getenv('COTACAO_URL', 'https://api.coingecko.com/api/v3'),
+                                           chave_api=os.getenv('COTACAO_API_KEY'),
+                                           timeout=float(os.getenv('COTACAO_TIMEOUT', '5'))),
+    'fixo': lambda: ProvedorFixo(os.getenv('COTACAO_FIXA', '')),
+}
+
+
+def criar_provedor(nome=None):
+    """Cria o provedor de cotações configurado."""
+    nome = nome or os.getenv('COTACAO_PROVEDOR', 'coingecko')
+    if nome not in PROVEDORES:
+        raise ValueError(f"Provedor de cotações desconhecido: {nome}")
+    return PROVEDORES[nome]()
+
+
+class _Consulta:
+    """Consulta ao provedor em andamento, compartilhada pelas threads que pedem as mesmas moedas."""
+
+    def __init__(self):
+        self.pronta = threading.Event()
+        self.cotacoes = {}
+        self.erro = None
+
+
+class CacheCotacoes:
+    """Cotações em memória por `ttl` segundos, com coalescência das consultas simultâneas.
+
+    Quem pede uma moeda que já está sendo consultada espera essa consulta em vez de
+    repeti-la (single-flight): N confirmações simultâneas geram uma única chamada ao
+    provedor. As moedas que faltam no cache são pedidas juntas, em uma só chamada.
+    Erros não ficam em cache; o próximo pedido tenta de novo.
+    """
+
+    def __init__(self, provedor, ttl=60, espera=10, relogio=time.monotonic):
+        self.provedor = provedor
+        self.ttl = ttl
+        self.espera = espera
+        self.relogio = relogio
+        self._cotacoes = {}
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        self._contadores = {'cache': 0, 'coalescida': 0, 'provedor': 0, 'erro': 0}
+
+    def cotar(self, moedas):
+        """Retorna {moeda: cotacao} para as moedas que puderam ser cotadas.
+
+        Cada cotação é um dict com moeda, preco_brl (Decimal), fonte e obtida_em.
+        """
+        cotacoes, aguardar, consultar = {}, {}, []
+        with self._lock:
+            agora = self.relogio()
+            for moeda in set(moedas):
+                item = self._cotacoes.get(moeda)
+                if item is not None and item[1] > agora:
+                    cotacoes[moeda] = item[0]
+                    self._registrar(moeda, 'cache')
+                elif moeda in self._em_andamento:
+                    aguardar[moeda] = self._em_andamento[moeda]
+                    self._registrar(moeda, 'coalescida')
+                else:
+                    consultar.append(moeda)
+            if consultar:
+                consulta = _Consulta()
+                for moeda in consultar:
+                    self._em_andamento[moeda] = consulta
+        if consultar:
+            self._consultar(consultar, consulta)
+            aguardar.update(dict.fromkeys(consultar, consulta))
+        for moeda, consulta in aguardar.items():
+            if not consulta.pronta.wait(self.espera):
+                logger.warning(f"Tempo esgotado aguardando a cotação de {moeda}")
+                continue
+            if moeda in consulta.cotacoes:
+                cotacoes[moeda] = consulta.cotacoes[moeda]
+        return cotacoes
+
+    def _registrar(self, moeda, origem):
+        self._contadores[origem] += 1
+        COTACOES.inc(moeda=moeda, origem=origem)
+
+    def _consultar(self, moedas, consulta):
+        inicio = time.perf_counter()
+        try:
+            precos = self.provedor.cotar(moedas)
+            resultado = 'ok'
+        except Exception as e:
+            logger.error(f"Erro ao cotar {', '.join(sorted(moedas))} em {self.provedor.nome}: {str(e)}")
+            precos, consulta.erro, resultado = {}, e, 'erro'
+        PROVEDOR.observar(time.perf_counter() - inicio, provedor=self.provedor.nome, resultado=resultado)
+        obtida_em = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            expira_em = self.relogio() + self.ttl
+            for moeda in moedas:
+                if moeda in precos:
+                    consulta.cotacoes[moeda] = {'moeda': moeda, 'preco_brl': precos[moeda],
+                                                'fonte': self.provedor.nome, 'obtida_em': obtida_em}
+                    self._cotacoes[moeda] = (consulta.cotacoes[moeda], expira_em)
+                    self._registrar(moeda, 'provedor')
+                else:
+                    self._registrar(moeda, 'erro')
+                if self._em_andamento.get(moeda) is consulta:
+                    del self._em_andamento[moeda]
+        consulta.pronta.set()
+
+    def metricas(self):
+        metricas = dict(self._contadores)
+        metricas['moedas'] = sorted(self._cotacoes)
+        return metricas
+
+
+def converter(transacao, cotacao):
+    """Conversão do valor em reais da transação pela cotação, a gravar em transacao['conversao'].
+
+    A quantidade é arredondada para baixo nas casas decimais da moeda. Valores em
+    Decimal são gravados como texto para não perder precisão no JSON.
+    """
+    moeda = cotacao['moeda']
+    passo = Decimal(1).scaleb(-CASAS_DECIMAIS.get(moeda, 8))
+    try:
+        quantidade = (Decimal(str(transacao['valor'])) / cotacao['preco_brl']).quantize(passo, rounding=ROUND_DOWN)
+    except (InvalidOperation, ZeroDivisionError, KeyError, TypeError):
+        raise CotacaoErro(f"Não foi possível converter a transação {transacao.get('txid')}")
+    return {
+        'moeda': moeda,
+        'quantidade': str(quantidade),
+        'cotacao_brl': str(cotacao['preco_brl']),
+        'fonte': cotacao['fonte'],
+        'cotada_em': cotacao['obtida_em'],
+        'convertida_em': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+class ConversorPagamentos:
+    """Converte para a moeda escolhida o valor das transações concluídas.
+
+    As confirmações chegam por `enfileirar` (webhook e reconciliação) e são agrupadas por
+    até `janela` segundos ou `lote` transações. Cada lote é cotado no cache, uma vez por
+    moeda, e gravado em uma única transação do SQLite. A gravação só acontece se a
+    transação ainda estiver CONCLUIDA e sem conversão, então confirmações repetidas não
+    convertem duas vezes.
+
+    O que fica para trás (fila em memória perdida num restart, replay, provedor fora do
+    ar) é retomado pela varredura a cada `intervalo_varredura` segundos. Com `lideranca`,
+    só o worker que detém o bloqueio varre.
+    """
+
+    def __init__(self, store, cache, ao_converter=None, lideranca=None, janela=0.2, lote=500,
+                 intervalo_varredura=60):
+        self.store = store
+        self.cache = cache
+        self.ao_converter = ao_converter
+        self.lideranca = lideranca
+        self.janela = janela
+        self.lote = lote
+        self.intervalo_varredura = intervalo_varredura
+        self._fila = []
+        self._condicao = threading.Condition()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._pid = None
+        self._contadores = {'lotes': 0, 'convertidas': 0, 'sem_cotacao': 0, 'nao_suportadas': 0, 'varreduras': 0}
+
+    # Ciclo de vida
+
+    def iniciar(self):
+        """Inicia a thread do conversor neste processo (idempotente, seguro após fork)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._fila = []
+            self._condicao = threading.Condition()
+            self._parar = threading.Event()
+        threading.Thread(target=self._executar, args=(self._pid,), name='conversao', daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
+        with self._condicao:
+            self._condicao.notify()
+        if self.lideranca and self._pid == os.getpid():
+            self.lideranca.liberar()
+
+    def enfileirar(self, transacao):
+        """Agenda a conversão de uma transação recém-concluída."""
+        if transacao.get('conversao'):
+            return
+        with self._condicao:
+            self._fila.append(transacao)
+            self._condicao.notify()
+
+    def _executar(self, pid):
+        proxima_varredura = time.monotonic()
+        while self._pid == pid and not self._parar.is_set():
+            if time.monotonic() >= proxima_varredura:
+                proxima_varredura = time.monotonic() + self.intervalo_varredura
+                if self.lideranca is None or self.lideranca.tentar():
+                    try:
+                        self.varrer()
+                    except Exception as e:
+                        logger.error(f"Erro na varredura de conversões pendentes: {str(e)}")
+            transacoes = self._coletar(max(0.0, proxima_varredura - time.monotonic()))
+            if transacoes:
+                try:
+                    self.converter_lote(transacoes)
+                except Exception as e:
+                    logger.error(f"Erro ao converter lote de {len(transacoes)} transações: {str(e)}")
+
+    def _coletar(self, espera):
+        """Espera a primeira transação e junta as que chegarem em seguida, por até `janela` segundos."""
+        with self._condicao:
+            if not self._fila:
+                self._condicao.wait(espera)
+            if not self._fila:
+                return []
+            limite = time.monotonic() + self.janela
+            while len(self._fila) < self.lote and not self._parar.is_set():
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._condicao.wait(restante)
+            transacoes, self._fila = self._fila[:self.lote], self._fila[self.lote:]
+        return transacoes
+
+    # Conversão
+
+    def varrer(self):
+        """Converte as transações concluídas que ainda estão sem conversão. Retorna quantas converteu."""
+        self._contadores['varreduras'] += 1
+        convertidas = 0
+        lote = []
+        for transacao in self.store.pendentes_conversao(lote=self.lote):
+            lote.append(transacao)
+            if len(lote) >= self.lote:
+                convertidas += self.converter_lote(lote)
+                lote = []
+        if lote:
+            convertidas += self.converter_lote(lote)
+        if convertidas:
+            logger.info(f"Varredura de conversões: {convertidas} transações convertidas")
+        return convertidas
+
+    def converter_lote(self, transacoes):
+        """Cota cada moeda do lote uma vez e grava as conversões juntas. Retorna quantas foram gravadas.
+
+        Transações sem moeda ou com moeda não suportada recebem uma conversão com `erro`,
+        para saírem das pendentes em vez de voltarem a cada varredura.
+        """
+        with LOTES.cronometrar():
+            por_txid = {t['txid']: t for t in transacoes if t.get('txid') and t.get('moeda') in MOEDAS_SUPORTADAS}
+            cotacoes = self.cache.cotar({t['moeda'] for t in por_txid.values()})
+            conversoes, adiadas = [], {}
+            for transacao in transacoes:
+                if transacao.get('txid') and transacao.get('moeda') not in MOEDAS_SUPORTADAS:
+                    conversoes.append((transacao['txid'], {
+                        'erro': 'moeda não suportada',
+                        'moeda': transacao.get('moeda'),
+                        'convertida_em': datetime.now().isoformat(timespec='seconds'),
+                    }))
+            for txid, transacao in por_txid.items():
+                cotacao = cotacoes.get(transacao['moeda'])
+                try:
+                    if cotacao is None:
+                        raise CotacaoErro(f"Sem cotação para {transacao['moeda']}")
+                    conversoes.append((txid, converter(transacao, cotacao)))
+                except CotacaoErro:
+                    adiadas[transacao['moeda']] = adiadas.get(transacao['moeda'], 0) + 1
+            for moeda, quantidade in adiadas.items():
+                logger.warning(f"Conversão de {quantidade} transações em {moeda} adiada até a próxima varredura")
+                self._contadores['sem_cotacao'] += quantidade
+                CONVERSOES.inc(quantidade, moeda=moeda, resultado='sem_cotacao')
+            alteradas = self.store.registrar_conversoes_lote(conversoes) if conversoes else []
+        nao_suportadas = [t for t in alteradas if t['conversao'].get('erro')]
+        if nao_suportadas:
+            logger.warning(f"{len(nao_suportadas)} transações sem moeda suportada marcadas como não conversíveis")
+        self._contadores['lotes'] += 1
+        self._contadores['convertidas'] += len(alteradas) - len(nao_suportadas)
+        self._contadores['nao_suportadas'] += len(nao_suportadas)
+        for transacao in alteradas:
+            CONVERSOES.inc(moeda=str(transacao.get('moeda')),
+                           resultado='nao_suportada' if transacao['conversao'].get('erro') else 'convertida')
+            if self.ao_converter:
+                try:
+                    self.ao_converter(transacao)
+                except Exception as e:
+                    logger.error(f"Erro ao notificar a conversão de {transacao.get('txid')}: {str(e)}")
+        if len(alteradas) > len(nao_suportadas):
+            logger.info(f"Conversão: {len(alteradas) - len(nao_suportadas)} de {len(transacoes)} transações convertidas")
+        return len(alteradas) - len(nao_suportadas)
+
+    def metricas(self):
+        metricas = dict(self._contadores)
+        metricas['na_fila'] = len(self._fila)
+        metricas['cotacoes'] = self.cache.metricas()
+        return metricas
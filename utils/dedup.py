@@ -0,0 +1,154 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+
+def chave_deduplicacao(payload):
+    """Gera a chave de deduplicação de uma notificação (evento, status e identificador).
+
+    Usa o primeiro identificador disponível entre e2eid, txid e correlationID, nos dois
+    formatos de payload aceitos pelo webhook. Retorna None se não houver identificador.
+    """
+    if not isinstance(payload, dict):
+        return None
+    evento = payload.get('event', payload.get('evento', 'UNKNOWN'))
+    pix = payload.get('pix') if isinstance(payload.get('pix'), dict) else {}
+    charge = payload.get('charge') if isinstance(payload.get('charge'), dict) else {}
+    identificador = (pix.get('e2eid') or charge.get('identifier') or pix.get('txid')
+                     or charge.get('transactionID') or charge.get('correlationID'))
+    if not identificador:
+        return None
+    status = pix.get('status') or charge.get('status') or ''
+    return f"{evento}|{status}|{identificador}"
+
+
+# Resultados de DeduplicadorWebhook.reservar
+NOVA = 'nova'
+DUPLICADA = 'duplicada'
+EM_ANDAMENTO = 'em_andamento'
+
+
+class DeduplicadorWebhook:
+    """LRU em memória com TTL, apoiado por um índice SQLite que sobrevive a reinícios.
+
+    Cada chave passa por dois estados: reservada (`reservar`, antes de processar) e
+    confirmada (`confirmar`, depois que o processamento termina). Só as confirmadas
+    tornam uma reentrega duplicada. Uma reserva que não é confirmada nem liberada
+    (`esquecer`), porque o worker morreu ou estourou o timeout, vence após `reserva`
+    segundos, e a próxima reentrega é processada.
+
+    Reentregas já confirmadas neste processo são respondidas pela LRU, sem acessar o disco.
+    """
+
+    def __init__(self, caminho, capacidade=100000, ttl=7 * 24 * 3600, reserva=300):
+        self.caminho = caminho
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.reserva = reserva
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._insercoes = 0
+        self._contadores = {'hits_memoria': 0, 'hits_disco': 0, 'misses': 0, 'em_andamento': 0}
+        conn = self._conexao()
+        conn.execute('CREATE TABLE IF NOT EXISTS vistos (chave TEXT PRIMARY KEY, visto_em REAL NOT NULL, '
+                     'confirmada INTEGER NOT NULL DEFAULT 1)')
+        colunas = {linha[1] for linha in conn.execute('PRAGMA table_info(vistos)')}
+        if 'confirmada' not in colunas:
+            # Índices anteriores só guardavam chaves já processadas
+            conn.execute('ALTER TABLE vistos ADD COLUMN confirmada INTEGER NOT NULL DEFAULT 1')
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _lembrar(self, chave, visto_em):
+        with self._lock:
+            self._cache[chave] = visto_em + self.ttl
+            self._cache.move_to_end(chave)
+            while len(self._cache) > self.capacidade:
+                self._cache.popitem(last=False)
+
+    def _contar(self, contador):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def reservar(self, chave):
+        """Reserva a chave antes do processamento.
+
+        Retorna NOVA se a chave foi reservada agora (inclusive no lugar de uma reserva
+        vencida), DUPLICADA se já foi confirmada dentro do TTL, ou EM_ANDAMENTO se outra
+        reserva ainda está valendo.
+        """
+        agora = time.time()
+        with self._lock:
+            expira_em = self._cache.get(chave)
+            if expira_em is not None:
+                if expira_em > agora:
+                    self._cache.move_to_end(chave)
+                    self._contadores['hits_memoria'] += 1
+                    return DUPLICADA
+                del self._cache[chave]
+
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            linha = conn.execute('SELECT visto_em, confirmada FROM vistos WHERE chave = ?', (chave,)).fetchone()
+            if linha is None or linha[0] < agora - (self.ttl if linha[1] else self.reserva):
+                conn.execute('INSERT OR REPLACE INTO vistos (chave, visto_em, confirmada) VALUES (?, ?, 0)',
+                             (chave, agora))
+                resultado = NOVA
+            else:
+                resultado = DUPLICADA if linha[1] else EM_ANDAMENTO
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        if resultado == DUPLICADA:
+            self._lembrar(chave, linha[0])
+            self._contar('hits_disco')
+        else:
+            self._contar('misses' if resultado == NOVA else 'em_andamento')
+        return resultado
+
+    def confirmar(self, chave):
+        """Marca a chave como processada: reentregas dentro do TTL passam a ser duplicadas."""
+        agora = time.time()
+        self._conexao().execute('INSERT OR REPLACE INTO vistos (chave, visto_em, confirmada) VALUES (?, ?, 1)',
+                                (chave, agora))
+        self._lembrar(chave, agora)
+        self._insercoes += 1
+        if self._insercoes % 1000 == 0:
+            self._expurgar(agora)
+
+    def esquecer(self, chave):
+        """Remove a chave, para que uma reentrega seja processada (ex.: após uma falha)."""
+        with self._lock:
+            self._cache.pop(chave, None)
+        self._conexao().execute('DELETE FROM vistos WHERE chave = ?', (chave,))
+
+    def _expurgar(self, agora):
+        try:
+            self._conexao().execute('DELETE FROM vistos WHERE visto_em < ? OR (confirmada = 0 AND visto_em < ?)',
+                                    (agora - self.ttl, agora - self.reserva))
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao expurgar índice de deduplicação: {str(e)}")
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._contadores)
+            metricas['tamanho_cache'] = len(self._cache)
+        return metricas
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from itertools import count
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+
+class BarramentoEventos:
+    """Pub/sub em processo, por txid, com ponte opcional entre workers via SQLite.
+
+    `publicar` entrega o evento aos assinantes do próprio processo e, com a ponte
+    ativa, grava-o na tabela `eventos`. Uma thread por processo (criada na primeira
+    assinatura) lê as linhas novas gravadas por outros workers e as entrega aos
+    assinantes locais, fazendo papel de um broker (Redis, NATS...) em uma única máquina.
+    """
+
+    def __init__(self, caminho=None, intervalo=0.5, retencao=3600):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.retencao = retencao
+        self._assinantes = {}
+        self._tokens = count(1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._leitor_pid = None
+        self._publicados = 0
+
+    def _conexao(self):
+        """Retorna uma conexão por thread (e por processo, após um fork); o banco é criado no primeiro uso."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS eventos (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origem INTEGER NOT NULL,
+                    txid TEXT NOT NULL,
+                    dados TEXT NOT NULL,
+                    criado_em REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def assinar(self, txid, callback):
+        """Registra `callback(evento)` para os eventos do txid. Retorna o token para `cancelar`.
+
+        O callback roda na thread de quem publica (ou na thread da ponte) e não deve bloquear.
+        """
+        if self.caminho and self._leitor_pid != os.getpid():
+            self._iniciar_leitor()
+        token = next(self._tokens)
+        with self._lock:
+            self._assinantes.setdefault(txid, {})[token] = callback
+        return (txid, token)
+
+    def cancelar(self, assinatura):
+        txid, token = assinatura
+        with self._lock:
+            callbacks = self._assinantes.get(txid)
+            if callbacks is not None:
+                callbacks.pop(token, None)
+                if not callbacks:
+                    del self._assinantes[txid]
+
+    def aguardar(self, txid, timeout, verificar=None):
+        """Bloqueia até um evento do txid ou o timeout. Retorna o evento ou None.
+
+        `verificar()` é chamado depois da assinatura: se retornar um evento (ex.: o
+        pagamento já tinha sido confirmado), ele é devolvido sem esperar.
+        """
+        recebido = []
+        pronto = threading.Event()
+
+        def entregar(evento):
+            recebido.append(evento)
+            pronto.set()
+
+        assinatura = self.assinar(txid, entregar)
+        try:
+            evento = verificar() if verificar else None
+            if evento is not None:
+                return evento
+            pronto.wait(timeout)
+            return recebido[0] if recebido else None
+        finally:
+            self.cancelar(assinatura)
+
+    def publicar(self, txid, evento):
+        """Entrega o evento aos assinantes locais e, com a ponte ativa, aos dos outros workers."""
+        self._entregar(txid, evento)
+        if not self.caminho:
+            return
+        agora = time.time()
+        conn = self._conexao()
+        conn.execute('INSERT INTO eventos (origem, txid, dados, criado_em) VALUES (?, ?, ?, ?)',
+                     (os.getpid(), txid, json.dumps(evento, ensure_ascii=False), agora))
+        self._publicados += 1
+        if self._publicados % 1000 == 0:
+            conn.execute('DELETE FROM eventos WHERE criado_em < ?', (agora - self.retencao,))
+
+    def _entregar(self, txid, evento):
+        with self._lock:
+            callbacks = list(self._assinantes.get(txid, {}).values())
+        for callback in callbacks:
+            try:
+                callback(evento)
+            except Exception as e:
+                logger.error(f"Erro ao entregar evento de {txid}: {str(e)}")
+
+    def _iniciar_leitor(self):
+        with self._lock:
+            if self._leitor_pid == os.getpid():
+                return
+            self._leitor_pid = os.getpid()
+        ultimo = self._conexao().execute('SELECT COALESCE(MAX(seq), 0) FROM eventos').fetchone()[0]
+        threading.Thread(target=self._ler_ponte, args=(ultimo,), daemon=True).start()
+
+    def _ler_ponte(self, ultimo):
+        """Entrega aos assinantes locais os eventos publicados por outros processos."""
+        pid = os.getpid()
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                if not self._assinantes:
+                    ultimo = self._conexao().execute('SELECT COALESCE(MAX(seq), ?) FROM eventos', (ultimo,)).fetchone()[0]
+                    continue
+                linhas = self._conexao().execute(
+                    'SELECT seq, origem, txid, dados FROM eventos WHERE seq > ? ORDER BY seq', (ultimo,)
+                ).fetchall()
+                for seq, origem, txid, dados in linhas:
+                    ultimo = seq
+                    if origem != pid and txid in self._assinantes:
+                        self._entregar(txid, json.loads(dados))
+            except Exception as e:
+                logger.error(f"Erro ao ler a ponte de eventos: {str(e)}")
+
+    def assinantes(self):
+        with self._lock:
+            return sum(len(callbacks) for callbacks in self._assinantes.values())
+
+
+def formatar_sse(evento, nome='pagamento'):
+    """Formata um evento no protocolo Server-Sent Events."""
+    return f"event: {nome}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
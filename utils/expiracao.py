@@ -0,0 +1,260 @@
+import os
+import time
+import heapq
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils.transacoes_store import instante
+from utils import metricas
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Status da cobrança na OpenPix que encerram a transação local
+STATUS_OPENPIX = {'COMPLETED': 'CONCLUIDA', 'EXPIRED': 'EXPIRADA'}
+
+# Volta alguns segundos na varredura incremental para pegar transações gravadas
+# por outros workers com criado_em um pouco anterior ao da última varredura
+MARGEM_VARREDURA = 5
+
+VERIFICACOES = metricas.contador('pix_expiracao_verificacoes_total',
+                                 'Verificações de transações pendentes pelo agendador, por resultado', ('resultado',))
+LOTES = metricas.histograma('pix_expiracao_lote_segundos', 'Duração de cada lote do agendador de expiração')
+
+
+class LimitadorTaxa:
+    """Token bucket: até `taxa` aquisições por segundo, com rajadas de até `rajada`."""
+
+    def __init__(self, taxa, rajada=None):
+        self.taxa = taxa
+        self.rajada = rajada or max(1, int(taxa))
+        self._fichas = float(self.rajada)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        """Bloqueia até haver uma ficha disponível."""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.rajada, self._fichas + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+
+class AgendadorExpiracao:
+    """Expira transações PENDENTE no prazo e as reconcilia com a OpenPix quando o webhook não chega.
+
+    As transações pendentes ficam em um heap ordenado pelo horário da próxima verificação,
+    então cada ciclo custa O(k log n) para as k vencidas. A varredura do banco é incremental
+    (pelo índice de status e data), e as cobranças vencidas são consultadas em lotes, com
+    concorrência limitada e no máximo `taxa` consultas por segundo; o resultado do lote é
+    gravado em uma única transação do SQLite.
+
+    Cada transação é consultada `reconciliar_apos` segundos depois de criada (webhook
+    possivelmente perdido), depois a cada `reconciliar_intervalo` e no vencimento. Sem
+    `consultar` (OpenPix não configurada), apenas expira no prazo. Com `lideranca`, só o
+    worker que detém o bloqueio trabalha; os demais tentam assumir a cada `intervalo_lideranca`.
+    """
+
+    def __init__(self, store, consultar=None, ao_alterar=None, lideranca=None, expiracao=900,
+                 reconciliar_apos=120, reconciliar_intervalo=300, tolerancia=60, intervalo=1.0,
+                 intervalo_lideranca=10, lote=100, taxa=5, concorrencia=4, relogio=time.time):
+        self.store = store
+        self.consultar = consultar
+        self.ao_alterar = ao_alterar
+        self.lideranca = lideranca
+        self.expiracao = expiracao
+        self.reconciliar_apos = reconciliar_apos
+        self.reconciliar_intervalo = reconciliar_intervalo
+        self.tolerancia = tolerancia if consultar else 0
+        self.intervalo = intervalo
+        self.intervalo_lideranca = intervalo_lideranca
+        self.lote = lote
+        self.concorrencia = concorrencia
+        self.relogio = relogio
+        self.limitador = LimitadorTaxa(taxa)
+        self._heap = []
+        self._pendentes = {}
+        self._ultimo_criado = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._pid = None
+        self._lider = False
+        self._contadores = {'ciclos': 0, 'consultas': 0, 'concluidas': 0, 'expiradas': 0, 'erros': 0}
+
+    # Ciclo de vida
+
+    def iniciar(self):
+        """Inicia a thread do agendador neste processo (idempotente, seguro após fork)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._heap, self._pendentes, self._ultimo_criado = [], {}, None
+            self._executor = None
+            self._lider = False
+            self._parar = threading.Event()
+        threading.Thread(target=self._executar, args=(self._pid,), name='expiracao', daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
+        if self.lideranca and self._pid == os.getpid():
+            self.lideranca.liberar()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _executar(self, pid):
+        while self._pid == pid and not self._parar.is_set():
+            if self.lideranca and not self.lideranca.tentar():
+                self._parar.wait(self.intervalo_lideranca)
+                continue
+            if not self._lider:
+                self._lider = True
+                logger.info(f"Agendador de expiração ativo no processo {pid}")
+            try:
+                processadas = self.executar_ciclo()
+            except Exception as e:
+                logger.error(f"Erro no agendador de expiração: {str(e)}")
+                processadas = 0
+            if processadas < self.lote:  # Lote cheio: há mais vencidas, segue sem esperar
+                self._parar.wait(self.intervalo)
+
+    # Agenda
+
+    def _agendar(self, txid, quando):
+        self._pendentes[txid]['proxima'] = quando
+        heapq.heappush(self._heap, (quando, txid))
+
+    def _primeira_verificacao(self, criado_em, vence_em):
+        if self.consultar:
+            return min(criado_em + self.reconciliar_apos, vence_em)
+        return vence_em
+
+    def _proxima_verificacao(self, item, agora):
+        if agora >= item['vence_em']:
+            return item['vence_em'] + self.tolerancia
+        if self.consultar:
+            return min(agora + self.reconciliar_intervalo, item['vence_em'])
+        return item['vence_em']
+
+    def _carregar_novas(self):
+        """Acrescenta ao heap as transações pendentes criadas desde a última varredura."""
+        desde = None if self._ultimo_criado is None else self._ultimo_criado - MARGEM_VARREDURA
+        for transacao in self.store.iterar(status='PENDENTE', desde=desde):
+            txid = transacao.get('txid')
+            if not txid or txid in self._pendentes:
+                continue
+            try:
+                criado_em = instante(transacao.get('data_criacao')) or 0.0
+            except ValueError:
+                criado_em = 0.0
+            if self._ultimo_criado is None or criado_em > self._ultimo_criado:
+                self._ultimo_criado = criado_em
+            vence_em = criado_em + self.expiracao
+            self._pendentes[txid] = {'vence_em': vence_em}
+            self._agendar(txid, self._primeira_verificacao(criado_em, vence_em))
+        if self._ultimo_criado is None:
+            self._ultimo_criado = self.relogio()
+
+    def executar_ciclo(self):
+        """Processa um lote de até `lote` transações vencidas. Retorna quantas foram verificadas."""
+        self._carregar_novas()
+        agora = self.relogio()
+        vencidas = []
+        while self._heap and self._heap[0][0] <= agora and len(vencidas) < self.lote:
+            quando, txid = heapq.heappop(self._heap)
+            item = self._pendentes.get(txid)
+            if item is not None and item['proxima'] == quando:  # Ignora entradas substituídas
+                vencidas.append(txid)
+        if vencidas:
+            with LOTES.cronometrar():
+                self._processar(vencidas, agora)
+        self._contadores['ciclos'] += 1
+        return len(vencidas)
+
+    # Verificação
+
+    def _processar(self, vencidas, agora):
+        ativas = []
+        for txid in vencidas:
+            transacao = self.store.buscar_por_txid(txid)
+            if transacao is None or transacao.get('status') != 'PENDENTE':
+                del self._pendentes[txid]  # Resolvida pelo webhook
+                VERIFICACOES.inc(resultado='resolvida')
+                continue
+            ativas.append(txid)
+
+        if self.consultar and ativas:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concorrencia, thread_name_prefix='expiracao-consulta')
+            resultados = list(self._executor.map(self._consultar, ativas))
+        else:
+            resultados = [(None, None)] * len(ativas)
+
+        atualizacoes = []
+        for txid, (cobranca, erro) in zip(ativas, resultados):
+            status = self._decidir(txid, cobranca, erro, agora)
+            if status:
+                atualizacoes.append((txid, status))
+        if not atualizacoes:
+            return
+
+        alteradas = self.store.atualizar_status_lote(atualizacoes, somente_status='PENDENTE')
+        for txid, _ in atualizacoes:
+            self._pendentes.pop(txid, None)
+        for transacao in alteradas:
+            chave = 'concluidas' if transacao['status'] == 'CONCLUIDA' else 'expiradas'
+            self._contadores[chave] += 1
+            if self.ao_alterar:
+                try:
+                    self.ao_alterar(transacao)
+                except Exception as e:
+                    logger.error(f"Erro ao notificar a alteração de {transacao.get('txid')}: {str(e)}")
+        logger.info(f"Agendador de expiração: {len(alteradas)} transações atualizadas de {len(vencidas)} verificadas")
+
+    def _consultar(self, txid):
+        """Consulta a cobrança na OpenPix respeitando o limite de taxa. Retorna (cobranca, erro)."""
+        self.limitador.adquirir()
+        self._contadores['consultas'] += 1
+        try:
+            return self.consultar(txid), None
+        except Exception as e:
+            logger.warning(f"Erro ao consultar a cobrança {txid} na OpenPix: {str(e)}")
+            self._contadores['erros'] += 1
+            return None, e
+
+    def _decidir(self, txid, cobranca, erro, agora):
+        """Retorna o novo status da transação ou None, reagendando a próxima verificação."""
+        item = self._pendentes[txid]
+        if cobranca is not None:
+            status = STATUS_OPENPIX.get(cobranca.get('status'))
+            if status:
+                VERIFICACOES.inc(resultado=status.lower())
+                return status
+            try:
+                expira_em = instante(cobranca.get('expiresDate'))
+            except ValueError:
+                expira_em = None
+            if expira_em:
+                item['vence_em'] = expira_em  # O prazo da própria cobrança prevalece
+        if agora >= item['vence_em'] + self.tolerancia:
+            VERIFICACOES.inc(resultado='expirada')
+            return 'EXPIRADA'
+        VERIFICACOES.inc(resultado='erro' if erro else 'pendente')
+        self._agendar(txid, self._proxima_verificacao(item, agora))
+        return None
+
+    def metricas(self):
+        metricas = dict(self._contadores)
+        metricas.update({
+            'lider': self._lider,
+            'pendentes': len(self._pendentes),
+            'proxima_verificacao': self._heap[0][0] if self._heap else None
+        })
+        return metricas
@@ -0,0 +1,121 @@
+import io
+import csv
+import json
+import zlib
+import logging
+from datetime import datetime
+from utils.transacoes_store import instante
+from utils.normalizador import normalizar
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+FORMATOS_EXPORTACAO = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+CAMPOS_TRANSACOES = ('id', 'txid', 'status', 'valor', 'moeda', 'chave_id', 'data_criacao')
+CAMPOS_NOTIFICACOES = ('seq', 'id', 'recebido_em', 'evento', 'status', 'txid', 'e2eid', 'valor', 'payload')
+
+# Tamanho aproximado de cada bloco enviado ao cliente (e ao compressor)
+TAMANHO_BLOCO = 64 * 1024
+
+
+def iterar_notificacoes(journal, desde=None, ate=None):
+    """Percorre o diário em ordem de chegada, filtrando por recebido_em (`desde` inclusivo, `ate` exclusivo)."""
+    inicio = _iso(desde)
+    fim = _iso(ate)
+    for entrada in journal.iterar():
+        recebido_em = entrada.get('recebido_em') or ''
+        if inicio and recebido_em < inicio:
+            continue
+        if fim and recebido_em >= fim:
+            continue
+        yield entrada
+
+
+def _iso(valor):
+    """Converte epoch ou ISO 8601 no formato ISO local usado em recebido_em (comparável como texto)."""
+    epoch = instante(valor)
+    return datetime.fromtimestamp(epoch).isoformat() if epoch is not None else None
+
+
+def linha_notificacao(entrada):
+    """Achata uma entrada do diário para exportação, com txid e valor extraídos pelo normalizador.
+
+    Uma entrada que o normalizador não entende sai com txid, e2eid e valor vazios, sem interromper a exportação.
+    """
+    payload = entrada.get('payload')
+    try:
+        notificacao = normalizar(payload) if isinstance(payload, dict) else None
+    except Exception as e:
+        logger.warning(f"Notificação {entrada.get('seq')} exportada sem normalização: {str(e)}")
+        notificacao = None
+    return {
+        'seq': entrada.get('seq'),
+        'id': entrada.get('id'),
+        'recebido_em': entrada.get('recebido_em'),
+        'evento': entrada.get('evento'),
+        'status': entrada.get('status'),
+        'txid': notificacao.txid if notificacao else None,
+        'e2eid': notificacao.e2eid if notificacao else None,
+        'valor': notificacao.valor if notificacao else None,
+        'payload': payload
+    }
+
+
+def gerar_jsonl(registros):
+    for registro in registros:
+        yield json.dumps(registro, ensure_ascii=False) + '\n'
+
+
+def gerar_csv(registros, campos):
+    """Gera o CSV linha a linha; valores aninhados (dicts e listas) viram JSON na célula."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(campos)
+    yield buffer.getvalue()
+    for registro in registros:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerow([
+            json.dumps(valor, ensure_ascii=False) if isinstance(valor, (dict, list)) else valor
+            for valor in (registro.get(campo) for campo in campos)
+        ])
+        yield buffer.getvalue()
+
+
+def agrupar(linhas, tamanho=TAMANHO_BLOCO):
+    """Junta linhas de texto em blocos de bytes de ~`tamanho`, para não emitir um chunk por registro."""
+    partes = []
+    acumulado = 0
+    for linha in linhas:
+        dados = linha.encode('utf-8')
+        partes.append(dados)
+        acumulado += len(dados)
+        if acumulado >= tamanho:
+            yield b''.join(partes)
+            partes = []
+            acumulado = 0
+    if partes:
+        yield b''.join(partes)
+
+
+def compactar(blocos, nivel=6):
+    """Compacta os blocos em um fluxo gzip incremental."""
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+    for bloco in blocos:
+        dados = compressor.compress(bloco)
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def exportar(registros, formato, campos, gzip_saida=False):
+    """Gera os bytes da exportação em `formato` ('csv' ou 'jsonl'), opcionalmente em gzip.
+
+    Tudo é um gerador: só um bloco fica em memória por vez.
+    """
+    if formato not in FORMATOS_EXPORTACAO:
+        raise ValueError(f"Formato de exportação não suportado: {formato}")
+    linhas = gerar_csv(registros, campos) if formato == 'csv' else gerar_jsonl(registros)
+    blocos = agrupar(linhas)
+    return compactar(blocos) if gzip_saida else blocos
@@ -0,0 +1,239 @@
+import os
+import uuid
+import time
+import queue
+import threading
+import logging
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+
+class FilaCheia(Exception):
+    """A fila atingiu a capacidade máxima; o chamador deve pedir para reenviar depois."""
+
+
+class FilaWebhook:
+    """Fila durável de notificações com um pool limitado de workers.
+
+    O corpo bruto é gravado (com fsync) em `diretorio/pendentes` antes de ser aceito,
+    então uma notificação aceita sobrevive a um reinício do processo. Cada worker
+    reivindica o arquivo com um rename atômico para `diretorio/processando`, o que
+    impede que dois processos do gunicorn tratem a mesma notificação.
+
+    O arquivo só é apagado depois que `processar` termina sem erro. Se falhar, volta
+    para `pendentes` com o número da tentativa no nome (`<id>.<n>.json`) e o mtime no
+    futuro, que marca quando pode ser tentado de novo (espera exponencial). Depois de
+    `tentativas` falhas, vai para `diretorio/falhas`. Uma varredura a cada
+    `intervalo_varredura` segundos enfileira os pendentes vencidos e devolve os
+    arquivos em processamento de processos que morreram.
+    """
+
+    def __init__(self, diretorio, processar, workers=4, capacidade=1000, tentativas=5, espera=5,
+                 espera_max=300, intervalo_varredura=5):
+        self.diretorio = diretorio
+        self.pendentes_dir = os.path.join(diretorio, 'pendentes')
+        self.processando_dir = os.path.join(diretorio, 'processando')
+        self.falhas_dir = os.path.join(diretorio, 'falhas')
+        os.makedirs(self.pendentes_dir, exist_ok=True)
+        os.makedirs(self.processando_dir, exist_ok=True)
+        os.makedirs(self.falhas_dir, exist_ok=True)
+        self.processar = processar
+        self.num_workers = workers
+        self.capacidade = capacidade
+        self.tentativas = tentativas
+        self.espera = espera
+        self.espera_max = espera_max
+        self.intervalo_varredura = intervalo_varredura
+        self._fila = queue.Queue(maxsize=capacidade)
+        self._na_fila = set()
+        self._threads = []
+        self._aceitando = False
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._contadores = {'aceitas': 0, 'rejeitadas': 0, 'processadas': 0, 'falhas': 0, 'reagendadas': 0,
+                            'descartadas': 0, 'em_processamento': 0}
+
+    def iniciar(self):
+        """Inicia os workers e reenfileira notificações que ficaram no disco."""
+        with self._lock:
+            if self._aceitando:
+                return
+            self._aceitando = True
+            for i in range(self.num_workers):
+                t = threading.Thread(target=self._worker, name=f"fila-webhook-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._parar.clear()
+            threading.Thread(target=self._varredura, name="fila-webhook-varredura", daemon=True).start()
+        self._recuperar()
+
+    def _varredura(self):
+        while not self._parar.wait(self.intervalo_varredura):
+            try:
+                self._recuperar()
+            except Exception as e:
+                logger.error(f"Erro na varredura da fila {self.diretorio}: {str(e)}")
+
+    def _recuperar(self):
+        # Arquivos em processamento de um processo que morreu voltam para pendentes;
+        # os de processos vivos (inclusive este) continuam com o dono
+        for nome in os.listdir(self.processando_dir):
+            original, _, dono = nome.rpartition('.proc')[0].rpartition('.')
+            if not dono.isdigit() or int(dono) == os.getpid() or _processo_vivo(int(dono)):
+                continue
+            try:
+                os.replace(os.path.join(self.processando_dir, nome), os.path.join(self.pendentes_dir, original))
+            except FileNotFoundError:
+                pass
+        agora = time.time()
+        recuperadas = 0
+        for nome in sorted(os.listdir(self.pendentes_dir)):
+            caminho = os.path.join(self.pendentes_dir, nome)
+            if not nome.endswith('.json') or not self._aceitando:
+                continue
+            with self._lock:
+                if caminho in self._na_fila:
+                    continue
+            try:
+                if os.stat(caminho).st_mtime > agora:
+                    continue  # Aguardando a próxima tentativa
+            except FileNotFoundError:
+                continue
+            if not self._colocar(caminho):
+                break
+            recuperadas += 1
+        if recuperadas:
+            logger.info(f"{recuperadas} notificações pendentes recuperadas de {self.pendentes_dir}")
+
+    def _colocar(self, caminho):
+        with self._lock:
+            if caminho in self._na_fila:
+                return True
+            try:
+                self._fila.put_nowait(caminho)
+            except queue.Full:
+                return False
+            self._na_fila.add(caminho)
+        return True
+
+    def enfileirar(self, corpo):
+        """Grava o corpo bruto no disco e o coloca na fila. Retorna o ID da notificação."""
+        if not self._aceitando:
+            raise FilaCheia("Fila não está aceitando notificações")
+        if self._fila.full():
+            self._incrementar('rejeitadas')
+            raise FilaCheia(f"Fila cheia ({self.capacidade} notificações)")
+        notificacao_id = f"{time.time_ns():020d}_{uuid.uuid4().hex[:8]}"
+        caminho = os.path.join(self.pendentes_dir, notificacao_id + '.json')
+        temporario = caminho + '.tmp'
+        with open(temporario, 'wb') as f:
+            f.write(corpo)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+        if not self._colocar(caminho):
+            os.unlink(caminho)
+            self._incrementar('rejeitadas')
+            raise FilaCheia(f"Fila cheia ({self.capacidade} notificações)")
+        self._incrementar('aceitas')
+        return notificacao_id
+
+    def _worker(self):
+        while True:
+            caminho = self._fila.get()
+            try:
+                if caminho is None:
+                    return
+                with self._lock:
+                    self._na_fila.discard(caminho)
+                self._tratar(caminho)
+            finally:
+                self._fila.task_done()
+
+    def _tratar(self, caminho):
+        nome = os.path.basename(caminho)
+        reivindicado = os.path.join(self.processando_dir, f"{nome}.{os.getpid()}.proc")
+        try:
+            os.rename(caminho, reivindicado)
+        except FileNotFoundError:
+            return  # Outro processo já reivindicou esta notificação
+        self._incrementar('em_processamento')
+        try:
+            with open(reivindicado, 'rb') as f:
+                corpo = f.read()
+            self.processar(corpo)
+        except Exception as e:
+            self._incrementar('falhas')
+            self._reagendar(nome, reivindicado, e)
+        else:
+            os.unlink(reivindicado)
+            self._incrementar('processadas')
+        finally:
+            self._incrementar('em_processamento', -1)
+
+    def _reagendar(self, nome, reivindicado, erro):
+        """Devolve a notificação que falhou para pendentes, com espera, ou a move para falhas."""
+        partes = nome.split('.')
+        notificacao_id = partes[0]
+        tentativa = (int(partes[1]) if len(partes) == 3 and partes[1].isdigit() else 0) + 1
+        if tentativa >= self.tentativas:
+            os.replace(reivindicado, os.path.join(self.falhas_dir, nome))
+            self._incrementar('descartadas')
+            logger.error(f"Notificação {notificacao_id} falhou {tentativa} vezes e foi movida para "
+                         f"{self.falhas_dir}: {str(erro)}")
+            return
+        atraso = min(self.espera_max, self.espera * 2 ** (tentativa - 1))
+        agora = time.time()
+        os.utime(reivindicado, (agora, agora + atraso))
+        os.replace(reivindicado, os.path.join(self.pendentes_dir, f"{notificacao_id}.{tentativa}.json"))
+        self._incrementar('reagendadas')
+        logger.warning(f"Erro ao processar notificação {notificacao_id} da fila (tentativa {tentativa} de "
+                       f"{self.tentativas}), nova tentativa em {atraso}s: {str(erro)}")
+
+    def _incrementar(self, contador, valor=1):
+        with self._lock:
+            self._contadores[contador] += valor
+
+    def drenar(self, timeout=30):
+        """Para de aceitar notificações e aguarda a fila esvaziar (usado no desligamento)."""
+        with self._lock:
+            if not self._aceitando:
+                return True
+            self._aceitando = False
+        self._parar.set()
+        limite = time.time() + timeout
+        while self._fila.unfinished_tasks and time.time() < limite:
+            time.sleep(0.05)
+        drenada = not self._fila.unfinished_tasks
+        for _ in self._threads:
+            try:
+                self._fila.put_nowait(None)
+            except queue.Full:
+                break
+        if not drenada:
+            logger.warning(f"Fila não drenada em {timeout}s; {self._fila.qsize()} notificações ficam no disco")
+        return drenada
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._contadores)
+        metricas.update({
+            'profundidade': self._fila.qsize(),
+            'capacidade': self.capacidade,
+            'workers': self.num_workers,
+            'aceitando': self._aceitando,
+            'aguardando_nova_tentativa': sum(1 for nome in os.listdir(self.pendentes_dir) if nome.count('.') == 2),
+            'em_falhas': len(os.listdir(self.falhas_dir))
+        })
+        return metricas
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
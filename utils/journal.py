@@ -0,0 +1,366 @@
+import os
+import re
+import json
+import gzip
+import time
+import shutil
+import threading
+import logging
+from datetime import datetime
+from utils.armazenamento import bloqueio_arquivo, escrever_json_atomico
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+PADRAO_LEGADO = re.compile(r'^pix_notification_(\d{8}_\d{6})_\w+\.json$')
+
+
+class JournalNotificacoes:
+    """Diário de notificações em segmentos JSONL somente-anexação.
+
+    Cada notificação vira uma linha no segmento ativo. O segmento é rotacionado por
+    tamanho ou idade e, opcionalmente, compactado com gzip depois de fechado. O índice
+    (total, segmentos com contagens e offsets, contagens por evento e por status e um
+    buffer das últimas notificações) fica na memória de cada processo, então o status
+    não precisa listar o diretório.
+
+    Os segmentos são a fonte da verdade. Antes de usar o índice, o processo lê só a
+    cauda do segmento ativo a partir do último offset que conhece, o que inclui as
+    linhas anexadas por outros workers. `indice.json` é um checkpoint, gravado a cada
+    `intervalo_indice` segundos e nas rotações, de onde um processo novo parte sem
+    varrer o diário inteiro.
+    """
+
+    def __init__(self, diretorio, max_bytes=64 * 1024 * 1024, max_segundos=24 * 3600,
+                 gzip_fechados=False, num_ultimas=100, fsync=False, legado_dir=None, intervalo_indice=5):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.max_segundos = max_segundos
+        self.gzip_fechados = gzip_fechados
+        self.num_ultimas = num_ultimas
+        self.fsync = fsync
+        self.legado_dir = legado_dir
+        self.intervalo_indice = intervalo_indice
+        self.indice_path = os.path.join(diretorio, 'indice.json')
+        self._indice = None
+        self._gravado_em = 0.0
+        self._lock = threading.RLock()
+        os.makedirs(diretorio, exist_ok=True)
+
+    # Índice lateral
+
+    def _indice_vazio(self):
+        return {'total': 0, 'segmentos': [], 'ultimas': [], 'por_evento': {}, 'por_status': {}}
+
+    def _carregar_indice(self):
+        """Lê o checkpoint do disco ou, na primeira execução, o reconstrói a partir dos segmentos."""
+        try:
+            with open(self.indice_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            with bloqueio_arquivo(self.indice_path):
+                if os.path.exists(self.indice_path):
+                    return self._carregar_indice()
+                indice = self._reconstruir_indice()
+                if not indice['segmentos']:
+                    self._importar_legado(indice)
+                self._gravar_indice(indice)
+                return indice
+        except ValueError:
+            logger.warning(f"Índice {self.indice_path} corrompido, reconstruindo a partir dos segmentos")
+            with bloqueio_arquivo(self.indice_path):
+                indice = self._reconstruir_indice()
+                self._gravar_indice(indice)
+                return indice
+
+    def _ler_indice(self):
+        """Índice em memória, já com as linhas que outros processos anexaram depois dele."""
+        with self._lock:
+            if self._indice is None:
+                self._indice = self._carregar_indice()
+            self._alcancar(self._indice)
+            return self._indice
+
+    def _alcancar(self, indice):
+        """Contabiliza as linhas gravadas depois do último offset conhecido do segmento ativo.
+
+        Segue para os segmentos abertos depois dele por outros processos. Uma linha sem
+        quebra no fim ainda está sendo gravada e fica para a próxima leitura.
+        """
+        if not indice['segmentos']:
+            if not self._existe(_nome_segmento(1)):
+                return
+            indice['segmentos'].append(self._novo_segmento(1, indice['total'] + 1))
+        while True:
+            segmento = indice['segmentos'][-1]
+            offset = segmento['bytes']
+            for linha in self._ler_cauda(segmento['nome'], offset):
+                if not linha.endswith(b'\n'):
+                    break
+                entrada = _decodificar(linha)
+                if entrada is not None:
+                    self._contabilizar(indice, self._referencia(entrada, segmento['nome'], offset))
+                    segmento['contagem'] += 1
+                offset += len(linha)
+            segmento['bytes'] = offset
+            numero = len(indice['segmentos']) + 1
+            if not self._existe(_nome_segmento(numero)):
+                return
+            segmento['fechado'] = True
+            indice['segmentos'].append(self._novo_segmento(numero, indice['total'] + 1))
+
+    def _existe(self, nome):
+        caminho = os.path.join(self.diretorio, nome)
+        return os.path.exists(caminho) or os.path.exists(caminho + '.gz')
+
+    def _novo_segmento(self, numero, inicio_seq):
+        """Entrada do índice para um segmento aberto por outro processo; a idade vem do arquivo."""
+        caminho = os.path.join(self.diretorio, _nome_segmento(numero))
+        try:
+            aberto_em = os.stat(caminho).st_mtime
+        except FileNotFoundError:
+            aberto_em = time.time()
+        return {'nome': _nome_segmento(numero), 'inicio_seq': inicio_seq, 'contagem': 0, 'bytes': 0,
+                'aberto_em': aberto_em, 'fechado': False}
+
+    def _ler_cauda(self, nome, offset):
+        caminho = os.path.join(self.diretorio, nome)
+        try:
+            f = open(caminho, 'rb')
+        except FileNotFoundError:
+            try:
+                f = gzip.open(caminho + '.gz', 'rb')  # Fechado e compactado depois do último offset lido
+            except FileNotFoundError:
+                return
+        with f:
+            f.seek(offset)
+            yield from f
+
+    def _gravar_indice(self, indice):
+        escrever_json_atomico(self.indice_path, indice, fsync=self.fsync, ensure_ascii=False)
+        self._gravado_em = time.monotonic()
+
+    def _reconstruir_indice(self):
+        """Recria o índice varrendo os segmentos existentes (caminho raro, O(N))."""
+        indice = self._indice_vazio()
+        for nome in self.nomes_segmentos():
+            segmento = {'nome': nome, 'inicio_seq': indice['total'] + 1, 'contagem': 0, 'bytes': 0,
+                        'aberto_em': time.time(), 'fechado': True}
+            offset = 0
+            for linha in self._abrir_segmento(nome):
+                entrada = _decodificar(linha)
+                if entrada is not None:
+                    self._contabilizar(indice, self._referencia(entrada, nome, offset))
+                    segmento['contagem'] += 1
+                offset += len(linha)
+            segmento['bytes'] = offset
+            indice['segmentos'].append(segmento)
+        if indice['segmentos']:
+            indice['segmentos'][-1]['fechado'] = False
+        return indice
+
+    def nomes_segmentos(self):
+        """Nomes dos segmentos em disco (sem o sufixo .gz), em ordem de criação."""
+        return sorted({n[:-3] if n.endswith('.gz') else n
+                       for n in os.listdir(self.diretorio)
+                       if n.startswith('notificacoes-') and (n.endswith('.jsonl') or n.endswith('.jsonl.gz'))})
+
+    def _importar_legado(self, indice):
+        """Importa, uma única vez, os arquivos pix_notification_*.json do formato antigo."""
+        if not self.legado_dir or not os.path.isdir(self.legado_dir):
+            return
+        arquivos = sorted(n for n in os.listdir(self.legado_dir) if PADRAO_LEGADO.match(n))
+        for nome in arquivos:
+            try:
+                with open(os.path.join(self.legado_dir, nome), 'r', encoding='utf-8') as f:
+                    payload = json.load(f)
+            except Exception as e:
+                logger.error(f"Erro ao importar notificação legada {nome}: {str(e)}")
+                continue
+            recebido_em = datetime.strptime(PADRAO_LEGADO.match(nome).group(1), '%Y%m%d_%H%M%S').isoformat()
+            evento, status = resumir_payload(payload)
+            self._anexar(indice, payload, nome[:-len('.json')], recebido_em, evento, status)
+        if arquivos:
+            logger.info(f"{len(arquivos)} notificações legadas importadas para {self.diretorio}")
+
+    # Escrita
+
+    def _referencia(self, entrada, segmento, offset):
+        return {'seq': entrada['seq'], 'id': entrada['id'], 'recebido_em': entrada['recebido_em'],
+                'evento': entrada.get('evento'), 'status': entrada.get('status'),
+                'segmento': segmento, 'offset': offset}
+
+    def _contabilizar(self, indice, ref):
+        indice['total'] = ref['seq']
+        indice['ultimas'].insert(0, ref)
+        del indice['ultimas'][self.num_ultimas:]
+        for campo, chave in (('por_evento', ref['evento']), ('por_status', ref['status'])):
+            chave = chave if chave and isinstance(chave, str) else 'DESCONHECIDO'
+            indice[campo][chave] = indice[campo].get(chave, 0) + 1
+
+    def _rotacionar(self, indice):
+        if indice['segmentos']:
+            anterior = indice['segmentos'][-1]
+            anterior['fechado'] = True
+            if self.gzip_fechados:
+                caminho = os.path.join(self.diretorio, anterior['nome'])
+                threading.Thread(target=_compactar, args=(caminho,), daemon=True).start()
+        numero = len(indice['segmentos']) + 1
+        segmento = {'nome': _nome_segmento(numero), 'inicio_seq': indice['total'] + 1,
+                    'contagem': 0, 'bytes': 0, 'aberto_em': time.time(), 'fechado': False}
+        indice['segmentos'].append(segmento)
+        return segmento
+
+    def _anexar(self, indice, payload, identificador, recebido_em, evento, status):
+        segmento = indice['segmentos'][-1] if indice['segmentos'] else None
+        if (segmento is None or segmento['fechado'] or segmento['bytes'] >= self.max_bytes
+                or time.time() - segmento['aberto_em'] >= self.max_segundos):
+            segmento = self._rotacionar(indice)
+        entrada = {'seq': indice['total'] + 1, 'id': identificador, 'recebido_em': recebido_em,
+                   'evento': evento, 'status': status, 'payload': payload}
+        dados = (json.dumps(entrada, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with open(os.path.join(self.diretorio, segmento['nome']), 'ab') as f:
+            offset = f.tell()
+            if offset != segmento['bytes']:
+                # Um processo morreu no meio de uma linha: termina a linha antes de anexar
+                dados = b'\n' + dados
+                offset += 1
+            f.write(dados)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        segmento['contagem'] += 1
+        segmento['bytes'] = offset + len(dados)
+        ref = self._referencia(entrada, segmento['nome'], offset)
+        self._contabilizar(indice, ref)
+        return ref
+
+    def anexar(self, payload, identificador, recebido_em=None):
+        """Anexa uma notificação ao segmento ativo e retorna sua referência (seq, segmento, offset)."""
+        recebido_em = recebido_em or datetime.now().isoformat()
+        evento, status = resumir_payload(payload)
+        # O bloqueio só ordena os seq entre os processos: o índice não é regravado a cada linha
+        with self._lock, bloqueio_arquivo(self.indice_path):
+            indice = self._ler_indice()
+            segmentos = len(indice['segmentos'])
+            try:
+                ref = self._anexar(indice, payload, identificador, recebido_em, evento, status)
+                if len(indice['segmentos']) != segmentos or time.monotonic() - self._gravado_em >= self.intervalo_indice:
+                    self._gravar_indice(indice)
+            except Exception:
+                self._indice = None  # O índice em memória pode ter ficado à frente do disco
+                raise
+        return ref
+
+    # Leitura
+
+    def resumo(self, desde=None, limite=10):
+        """Retorna total, contagens e últimas notificações a partir do índice em memória.
+
+        Sem `desde`, traz as `limite` notificações mais recentes. Com `desde`, traz em
+        ordem crescente as notificações com seq maior que o cursor; só percorre os
+        segmentos quando o cursor é mais antigo que o buffer do índice.
+        """
+        with self._lock:
+            indice = self._ler_indice()
+            ultimas = list(indice['ultimas'])
+            resumo = {
+                'total': indice['total'],
+                'por_evento': dict(indice.get('por_evento', {})),
+                'por_status': dict(indice.get('por_status', {})),
+                'segmentos': len(indice['segmentos']),
+            }
+        if desde is None:
+            notificacoes = ultimas[:limite]
+        elif not ultimas or desde + 1 >= ultimas[-1]['seq']:
+            notificacoes = [ref for ref in reversed(ultimas) if ref['seq'] > desde][:limite]
+        else:
+            notificacoes = []
+            for entrada in self.iterar(desde):
+                notificacoes.append({campo: entrada.get(campo) for campo in ('seq', 'id', 'recebido_em', 'evento', 'status')})
+                if len(notificacoes) >= limite:
+                    break
+        resumo['ultimas'] = notificacoes
+        return resumo
+
+    def _abrir_segmento(self, nome):
+        caminho = os.path.join(self.diretorio, nome)
+        try:
+            f = open(caminho, 'rb')
+        except FileNotFoundError:
+            f = gzip.open(caminho + '.gz', 'rb')
+        with f:
+            for linha in f:
+                yield linha
+
+    def ler(self, ref):
+        """Lê uma notificação a partir da referência retornada por `anexar`."""
+        caminho = os.path.join(self.diretorio, ref['segmento'])
+        if os.path.exists(caminho):
+            with open(caminho, 'rb') as f:
+                f.seek(ref['offset'])
+                return json.loads(f.readline())
+        for linha in self._abrir_segmento(ref['segmento']):
+            entrada = _decodificar(linha)
+            if entrada is not None and entrada['seq'] == ref['seq']:
+                return entrada
+        return None
+
+    def iterar_linhas(self):
+        """Percorre as linhas brutas (bytes) de todos os segmentos em disco, sem ler o índice.
+
+        Usado na recuperação (scripts/replay_notificacoes.py), que funciona mesmo com o
+        índice perdido e deixa a decodificação do JSON para um pool de processos.
+        """
+        for nome in self.nomes_segmentos():
+            yield from self._abrir_segmento(nome)
+
+    def iterar(self, desde_seq=0):
+        """Percorre as notificações em ordem de chegada, segmento a segmento."""
+        with self._lock:
+            segmentos = [dict(segmento) for segmento in self._ler_indice()['segmentos']]
+        for segmento in segmentos:
+            if segmento['inicio_seq'] + segmento['contagem'] <= desde_seq:
+                continue
+            for linha in self._abrir_segmento(segmento['nome']):
+                entrada = _decodificar(linha)
+                if entrada is not None and entrada['seq'] > desde_seq:
+                    yield entrada
+
+
+def _decodificar(linha):
+    """Decodifica uma linha do diário; o resto de uma gravação interrompida vira None."""
+    try:
+        return json.loads(linha)
+    except ValueError:
+        logger.warning(f"Linha inválida ignorada no diário: {linha[:80]!r}")
+        return None
+
+
+def _nome_segmento(numero):
+    return f"notificacoes-{numero:06d}.jsonl"
+
+
+def resumir_payload(payload):
+    """Extrai o evento e o status de uma notificação para as contagens do índice."""
+    if not isinstance(payload, dict):
+        return 'UNKNOWN', None
+    evento = payload.get('event', payload.get('evento', 'UNKNOWN'))
+    status = None
+    for campo in ('pix', 'charge'):
+        if isinstance(payload.get(campo), dict) and isinstance(payload[campo].get('status'), str):
+            status = payload[campo]['status']
+            break
+    return (evento if isinstance(evento, str) else 'UNKNOWN'), status
+
+
+def _compactar(caminho):
+    """Compacta um segmento fechado em segundo plano (segmento.jsonl -> segmento.jsonl.gz)."""
+    try:
+        temporario = caminho + '.gz.tmp'
+        with open(caminho, 'rb') as origem, gzip.open(temporario, 'wb') as destino:
+            shutil.copyfileobj(origem, destino)
+        os.replace(temporario, caminho + '.gz')
+        os.unlink(caminho)
+    except Exception as e:
+        logger.error(f"Erro ao compactar segmento {caminho}: {str(e)}")
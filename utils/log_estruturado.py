@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Configuração por variáveis de ambiente
+LOG_NIVEL = os.getenv('LOG_NIVEL', 'INFO').upper()
+LOG_FORMATO = os.getenv('LOG_FORMATO', 'json')  # 'json' ou 'texto'
+LOG_FILA = os.getenv('LOG_FILA', '1') == '1'
+LOG_FILA_CAPACIDADE = int(os.getenv('LOG_FILA_CAPACIDADE', '10000'))
+LOG_PAYLOAD_MAX = int(os.getenv('LOG_PAYLOAD_MAX', '2048'))
+LOG_AMOSTRAGEM = os.getenv('LOG_AMOSTRAGEM', '')  # ex.: "webhook=0.1,cobranca=0.5"
+
+# Atributos padrão de um LogRecord, que não entram como campos extras no JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'amostra'}
+
+_configurado = False
+_handler_fila = None
+_listener = None
+
+
+class CampoLimitado:
+    """Valor de log serializado só quando o registro é emitido, limitado a `limite` caracteres.
+
+    Listas são serializadas item a item até o limite, então o custo não cresce com o
+    tamanho da coleção: `logger.info("Payload: %s", CampoLimitado(payload))`.
+    """
+
+    __slots__ = ('valor', 'limite')
+
+    def __init__(self, valor, limite=None):
+        self.valor = valor
+        self.limite = limite or LOG_PAYLOAD_MAX
+
+    def __str__(self):
+        valor, limite = self.valor, self.limite
+        if isinstance(valor, (list, tuple)):
+            partes = []
+            tamanho = 0
+            for i, item in enumerate(valor):
+                texto = json.dumps(item, ensure_ascii=False, default=str)
+                tamanho += len(texto) + 2
+                partes.append(texto)
+                if tamanho > limite:
+                    return f"[{', '.join(partes)[:limite]} ...(+{len(valor) - i - 1} itens)]"
+            return '[' + ', '.join(partes) + ']'
+        texto = valor if isinstance(valor, str) else json.dumps(valor, ensure_ascii=False, default=str)
+        return _truncar(texto, limite)
+
+    __repr__ = __str__
+
+
+def _truncar(texto, limite):
+    if len(texto) <= limite:
+        return texto
+    return f"{texto[:limite]}...(+{len(texto) - limite} caracteres)"
+
+
+def _interpretar_amostragem(texto):
+    """Converte "evento=0.1,outro=0.5" em {evento: 10, outro: 2} (emitir 1 a cada N)."""
+    intervalos = {}
+    for parte in filter(None, (p.strip() for p in texto.split(','))):
+        nome, _, taxa = parte.partition('=')
+        taxa = float(taxa or 1)
+        intervalos[nome.strip()] = max(int(round(1 / taxa)), 1) if taxa > 0 else 0
+    return intervalos
+
+
+class FiltroAmostragem(logging.Filter):
+    """Emite 1 a cada N registros marcados com `extra={'amostra': '<evento>'}`.
+
+    Avisos e erros nunca são descartados; registros sem a marca passam sempre.
+    """
+
+    def __init__(self, taxas=None):
+        super().__init__()
+        self.intervalos = _interpretar_amostragem(LOG_AMOSTRAGEM if taxas is None else taxas)
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        evento = getattr(record, 'amostra', None)
+        if evento is None or record.levelno >= logging.WARNING:
+            return True
+        intervalo = self.intervalos.get(evento, 1)
+        if intervalo <= 1:
+            return intervalo == 1
+        with self._lock:
+            contador = self._contadores.get(evento, 0)
+            self._contadores[evento] = contador + 1
+        if contador % intervalo:
+            return False
+        record.amostragem = intervalo
+        return True
+
+
+class FormatadorJSON(logging.Formatter):
+    """Formata cada registro como uma linha JSON (campos extras entram no objeto)."""
+
+    def format(self, record):
+        dados = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for chave, valor in record.__dict__.items():
+            if chave not in _ATRIBUTOS_PADRAO:
+                dados[chave] = str(valor) if isinstance(valor, CampoLimitado) else valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dados['exc'] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class HandlerFila(QueueHandler):
+    """QueueHandler que não bloqueia a requisição: com a fila cheia, o registro é descartado."""
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record):
+        # Resolve a mensagem (e os CampoLimitado) ainda nesta thread, pois o payload pode mudar depois
+        record = super().prepare(record)
+        for chave, valor in list(record.__dict__.items()):
+            if isinstance(valor, CampoLimitado):
+                setattr(record, chave, str(valor))
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+def _parar_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _reiniciar_listener():
+    """Após um fork (ex.: gunicorn com preload), a thread do listener não existe no filho.
+
+    O filho recebe uma fila nova para não reemitir os registros pendentes do pai.
+    """
+    global _listener
+    if _listener is not None:
+        _handler_fila.queue = queue.Queue(LOG_FILA_CAPACIDADE)
+        _listener = QueueListener(_handler_fila.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def configurar_logging(nivel=None, formato=None, fila=None):
+    """Configura o logger raiz uma única vez por processo.
+
+    A formatação JSON e a escrita em stderr rodam na thread do QueueListener, fora da
+    thread da requisição. Retorna o logger raiz.
+    """
+    global _configurado, _handler_fila, _listener
+    raiz = logging.getLogger()
+    if _configurado:
+        return raiz
+    _configurado = True
+
+    destino = logging.StreamHandler(sys.stderr)
+    if (formato or LOG_FORMATO) == 'json':
+        destino.setFormatter(FormatadorJSON())
+    else:
+        destino.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+
+    if fila if fila is not None else LOG_FILA:
+        handler = _handler_fila = HandlerFila(queue.Queue(LOG_FILA_CAPACIDADE))
+        _listener = QueueListener(handler.queue, destino, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_parar_listener)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_reiniciar_listener)
+    else:
+        handler = destino
+    handler.addFilter(FiltroAmostragem())
+
+    for antigo in list(raiz.handlers):
+        raiz.removeHandler(antigo)
+    raiz.addHandler(handler)
+    raiz.setLevel(nivel or LOG_NIVEL)
+    return raiz
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from utils.armazenamento import bloqueio_arquivo, escrever_json_atomico
+from utils.fila_webhook import _processo_vivo
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+METRICAS_INTERVALO = float(os.getenv('METRICAS_INTERVALO', '5'))
+METRICAS_MAX_SERIES = int(os.getenv('METRICAS_MAX_SERIES', '200'))
+
+# Limites (segundos) dos buckets dos histogramas de latência
+BUCKETS_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ACUMULADO = 'acumulado.json'
+
+
+class _Metrica:
+    def __init__(self, registro, nome, ajuda, rotulos):
+        self.registro = registro
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._series = 0
+
+    def _chave(self, rotulos):
+        return tuple('' if rotulos.get(nome) is None else str(rotulos[nome]) for nome in self.rotulos)
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, valor=1, **rotulos):
+        self.registro._atualizar(self, self._chave(rotulos), valor)
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, registro, nome, ajuda, rotulos, buckets):
+        super().__init__(registro, nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor, **rotulos):
+        self.registro._atualizar(self, self._chave(rotulos), valor)
+
+    @contextmanager
+    def cronometrar(self, **rotulos):
+        """Observa a duração do bloco `with`, mesmo se ele levantar exceção."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+
+class Medidor:
+    """Valor calculado no momento da coleta (ex.: tamanho de arquivos), não agregado entre workers.
+
+    `coletar()` retorna um número ou um dict {valor do rótulo: número}.
+    """
+    tipo = 'gauge'
+
+    def __init__(self, nome, ajuda, coletar, rotulo=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.coletar = coletar
+        self.rotulo = rotulo
+
+
+class RegistroMetricas:
+    """Contadores e histogramas por processo, agregados entre os workers do gunicorn.
+
+    Cada processo mantém suas séries em memória e as grava periodicamente em
+    `<diretorio>/proc-<pid>-<token>.json`. A coleta soma os arquivos de todos os processos;
+    os de processos que já terminaram são incorporados a `acumulado.json`, para que os
+    contadores continuem crescentes quando um worker é reciclado.
+    """
+
+    def __init__(self):
+        self._metricas = {}
+        self._medidores = {}
+        self._series = {}
+        self._lock = threading.Lock()
+        self.diretorio = None
+        self.intervalo = METRICAS_INTERVALO
+        self._pid = None
+        self._arquivo = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._apos_fork)
+
+    def _apos_fork(self):
+        # O lock pode ter sido copiado travado por outra thread do processo pai
+        self._lock = threading.Lock()
+
+    # Definição das métricas
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(self, nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        return self._registrar(Histograma(self, nome, ajuda, rotulos, buckets))
+
+    def medidor(self, nome, ajuda, coletar, rotulo=None):
+        medidor = Medidor(nome, ajuda, coletar, rotulo)
+        self._medidores[nome] = medidor
+        return medidor
+
+    def _registrar(self, metrica):
+        existente = self._metricas.get(metrica.nome)
+        if existente is not None:
+            return existente
+        self._metricas[metrica.nome] = metrica
+        return metrica
+
+    def configurar(self, diretorio, intervalo=None):
+        """Ativa a agregação entre processos usando o diretório compartilhado informado."""
+        os.makedirs(diretorio, exist_ok=True)
+        self.diretorio = diretorio
+        if intervalo is not None:
+            self.intervalo = intervalo
+
+    # Atualização (caminho quente)
+
+    def _atualizar(self, metrica, valores, valor):
+        if self._pid != os.getpid():
+            self._iniciar_processo()
+        chave = (metrica.nome, valores)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                if metrica._series >= METRICAS_MAX_SERIES:
+                    # Protege contra rótulos de alta cardinalidade vindos de payloads externos
+                    chave = (metrica.nome, ('outro',) * len(valores))
+                    serie = self._series.get(chave)
+                if serie is None:
+                    metrica._series += 1
+                    serie = self._series[chave] = (
+                        [0] * (len(metrica.buckets) + 1) + [0.0, 0] if metrica.tipo == 'histogram' else [0]
+                    )
+            if metrica.tipo == 'counter':
+                serie[0] += valor
+                return
+            buckets = metrica.buckets
+            indice = len(buckets)
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    indice = i
+                    break
+            serie[indice] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def _iniciar_processo(self):
+        """Primeira métrica do processo (ou do filho após um fork): zera as séries herdadas."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            primeiro = self._pid is None
+            self._pid = os.getpid()
+            self._series = {}
+            for metrica in self._metricas.values():
+                metrica._series = 0
+            self._arquivo = f"proc-{self._pid}-{uuid.uuid4().hex[:8]}.json"
+        if primeiro:
+            atexit.register(self.descarregar)
+        threading.Thread(target=self._descarregar_periodicamente, args=(self._pid,), daemon=True).start()
+
+    def _descarregar_periodicamente(self, pid):
+        while self._pid == pid:
+            time.sleep(self.intervalo)
+            try:
+                self.descarregar()
+            except Exception as e:
+                logger.error(f"Erro ao gravar métricas do processo: {str(e)}")
+
+    def _foto(self):
+        with self._lock:
+            return [[nome, list(valores), list(serie)] for (nome, valores), serie in self._series.items()]
+
+    def descarregar(self):
+        """Grava as séries deste processo no diretório compartilhado."""
+        if not self.diretorio or self._pid != os.getpid():
+            return
+        escrever_json_atomico(os.path.join(self.diretorio, self._arquivo),
+                              {'pid': self._pid, 'series': self._foto()}, fsync=False)
+
+    # Coleta
+
+    def _ler(self, nome):
+        try:
+            with open(os.path.join(self.diretorio, nome), 'r', encoding='utf-8') as f:
+                return json.load(f).get('series', [])
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def _agregar(self):
+        if not self.diretorio:
+            return self._foto()
+        self.descarregar()
+        caminho_acumulado = os.path.join(self.diretorio, ACUMULADO)
+        with bloqueio_arquivo(caminho_acumulado):
+            vivos, mortos = [], []
+            for nome in os.listdir(self.diretorio):
+                if nome.startswith('proc-') and nome.endswith('.json'):
+                    pid = int(nome.split('-')[1])
+                    vivo = pid == os.getpid() or _processo_vivo(pid)
+                    (vivos if vivo else mortos).append(nome)
+            acumulado = self._ler(ACUMULADO)
+            if mortos:
+                soma = {}
+                _somar(soma, acumulado)
+                for nome in mortos:
+                    _somar(soma, self._ler(nome))
+                acumulado = [[nome, list(valores), serie] for (nome, valores), serie in soma.items()]
+                escrever_json_atomico(caminho_acumulado, {'series': acumulado}, fsync=False)
+                for nome in mortos:
+                    os.unlink(os.path.join(self.diretorio, nome))
+            total = {}
+            _somar(total, acumulado)
+            for nome in vivos:
+                _somar(total, self._ler(nome))
+        return [[nome, list(valores), serie] for (nome, valores), serie in total.items()]
+
+    def exportar(self):
+        """Retorna todas as métricas no formato de texto do Prometheus."""
+        por_metrica = {}
+        for nome, valores, serie in self._agregar():
+            por_metrica.setdefault(nome, []).append((valores, serie))
+        linhas = []
+        for nome in sorted(self._metricas):
+            metrica = self._metricas[nome]
+            linhas.append(f"# HELP {nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {nome} {metrica.tipo}")
+            for valores, serie in sorted(por_metrica.get(nome, [])):
+                rotulos = list(zip(metrica.rotulos, valores))
+                if metrica.tipo == 'counter':
+                    linhas.append(f"{nome}{_rotulos(rotulos)} {_numero(serie[0])}")
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(metrica.buckets + (float('inf'),), serie):
+                    acumulado += contagem
+                    le = '+Inf' if limite == float('inf') else _numero(limite)
+                    linhas.append(f"{nome}_bucket{_rotulos(rotulos + [('le', le)])} {acumulado}")
+                linhas.append(f"{nome}_sum{_rotulos(rotulos)} {_numero(serie[-2])}")
+                linhas.append(f"{nome}_count{_rotulos(rotulos)} {serie[-1]}")
+        for nome in sorted(self._medidores):
+            medidor = self._medidores[nome]
+            try:
+                valor = medidor.coletar()
+            except Exception as e:
+                logger.error(f"Erro ao coletar a métrica {nome}: {str(e)}")
+                continue
+            linhas.append(f"# HELP {nome} {medidor.ajuda}")
+            linhas.append(f"# TYPE {nome} gauge")
+            if isinstance(valor, dict):
+                for rotulo, numero in sorted(valor.items()):
+                    linhas.append(f"{nome}{_rotulos([(medidor.rotulo, rotulo)])} {_numero(numero)}")
+            else:
+                linhas.append(f"{nome} {_numero(valor)}")
+        return '\n'.join(linhas) + '\n'
+
+
+def _somar(total, series):
+    for nome, valores, serie in series:
+        chave = (nome, tuple(valores))
+        atual = total.get(chave)
+        if atual is None or len(atual) != len(serie):
+            total[chave] = list(serie)
+        else:
+            for i, valor in enumerate(serie):
+                atual[i] += valor
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _rotulos(pares):
+    if not pares:
+        return ''
+    texto = ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for nome, valor in pares
+    )
+    return '{' + texto + '}'
+
+
+def tamanho_arquivos(*caminhos):
+    """Soma o tamanho dos arquivos existentes (ex.: banco SQLite e seu -wal)."""
+    total = 0
+    for caminho in caminhos:
+        try:
+            total += os.path.getsize(caminho)
+        except OSError:
+            pass
+    return total
+
+
+def tamanho_diretorio(diretorio):
+    total = 0
+    try:
+        with os.scandir(diretorio) as entradas:
+            for entrada in entradas:
+                if entrada.is_file():
+                    total += entrada.stat().st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+# Registro padrão do processo
+registro = RegistroMetricas()
+contador = registro.contador
+histograma = registro.histograma
+medidor = registro.medidor
@@ -0,0 +1,146 @@
+import logging
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+STATUS_CONCLUIDO = frozenset(('COMPLETED', 'CONCLUIDA'))
+
+_VAZIO = {}
+
+
+class NotificacaoPix:
+    """Registro compacto de uma notificação normalizada (valor em centavos inteiros)."""
+
+    __slots__ = ('evento', 'status', 'valor_centavos', 'txid', 'correlation_id', 'e2eid', 'pagador', 'tipo', 'payload')
+
+    def __init__(self, evento, status, valor_centavos, txid, e2eid, pagador, tipo, correlation_id=None, payload=None):
+        self.evento = evento
+        self.status = status
+        self.valor_centavos = valor_centavos
+        self.txid = txid
+        self.correlation_id = correlation_id
+        self.e2eid = e2eid
+        self.pagador = pagador
+        self.tipo = tipo
+        self.payload = payload
+
+    @property
+    def valor(self):
+        return self.valor_centavos / 100 if self.valor_centavos is not None else None
+
+    @property
+    def concluida(self):
+        return self.status in STATUS_CONCLUIDO
+
+    def como_dict(self):
+        """Formato devolvido pelo webhook (o payload bruto só entra se foi pedido na normalização)."""
+        dados = {
+            'event': self.evento,
+            'status': self.status,
+            'valor': self.valor,
+            'valor_centavos': self.valor_centavos,
+            'txid': self.txid,
+            'e2eid': self.e2eid,
+            'infoPagador': self.pagador,
+            'type': self.tipo
+        }
+        if self.payload is not None:
+            dados['raw_payload'] = self.payload
+        return dados
+
+
+# Normalizadores registrados por evento
+NORMALIZADORES = {}
+
+
+def registrar_normalizador(*eventos):
+    """Registra uma função `(payload, evento) -> NotificacaoPix` para os eventos informados."""
+    def decorador(funcao):
+        for evento in eventos:
+            NORMALIZADORES[evento] = funcao
+        return funcao
+    return decorador
+
+
+def _inteiro(valor, escala=0):
+    """Converte número ou texto (`"1.00"`) para inteiro × 10**escala; None se não for um valor finito."""
+    if valor is None or isinstance(valor, bool):
+        return None
+    try:
+        numero = Decimal(str(valor)).scaleb(escala)
+        return int(numero.to_integral_value(rounding=ROUND_HALF_UP)) if numero.is_finite() else None
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _centavos(valor_reais):
+    return _inteiro(valor_reais, 2)
+
+
+def _objeto(valor):
+    """O próprio valor se for um objeto JSON; senão, um dict vazio."""
+    return valor if isinstance(valor, dict) else _VAZIO
+
+
+def _texto(valor):
+    return valor if isinstance(valor, str) else None
+
+
+def _identificador(valor):
+    return str(valor) if isinstance(valor, (str, int)) and not isinstance(valor, bool) else None
+
+
+@registrar_normalizador('OPENPIX:PIX_RECEIVED', 'pix')
+def normalizar_pix(payload, evento):
+    """Formato com o objeto `pix` (valor em reais). Sem o objeto, o formato é desconhecido."""
+    pix = payload.get('pix')
+    if not isinstance(pix, dict):
+        return None
+    return NotificacaoPix(
+        evento,
+        _texto(pix.get('status')),
+        _centavos(pix.get('valor')),
+        _identificador(pix.get('txid')),
+        _identificador(pix.get('e2eid')),
+        _objeto(pix.get('infoPagador')),
+        pix.get('type', payload.get('type'))
+    )
+
+
+@registrar_normalizador('OPENPIX:TRANSACTION_RECEIVED')
+def normalizar_transacao_openpix(payload, evento):
+    """Formato OPENPIX:TRANSACTION_RECEIVED, centrado no objeto `charge` (valor em centavos)."""
+    charge = _objeto(payload.get('charge'))
+    pm_pix = _objeto(_objeto(charge.get('paymentMethods')).get('pix', charge.get('customer')))
+    return NotificacaoPix(
+        evento,
+        _texto(charge.get('status') or pm_pix.get('status')),
+        _inteiro(charge.get('value') or pm_pix.get('value', 0)),
+        _identificador(charge.get('transactionID') or pm_pix.get('transactionID') or charge.get('correlationID')),
+        _identificador(charge.get('identifier') or pm_pix.get('identifier')),
+        _objeto(charge.get('customer') or pm_pix.get('payer')),
+        charge.get('type'),
+        correlation_id=_identificador(charge.get('correlationID'))
+    )
+
+
+def normalizar(payload, incluir_payload=False):
+    """Normaliza um payload de webhook ou retorna None se o formato for desconhecido.
+
+    O normalizador é escolhido pelo `event`; eventos não registrados que tragam o objeto
+    `pix` usam o normalizador do formato `pix`. Payloads que não são objetos JSON, ou com
+    campos de tipos inesperados, nunca levantam exceção: viram None ou campos vazios.
+    """
+    if not isinstance(payload, dict):
+        return None
+    evento = payload.get('event', payload.get('evento', 'UNKNOWN'))
+    normalizador = NORMALIZADORES.get(evento) if isinstance(evento, str) else None
+    if normalizador is None:
+        if not isinstance(payload.get('pix'), dict):
+            return None
+        normalizador = normalizar_pix
+    notificacao = normalizador(payload, evento)
+    if notificacao is not None and incluir_payload:
+        notificacao.payload = payload
+    return notificacao
@@ -0,0 +1,342 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from utils import metricas
+
+# Importado sob demanda: só o cliente assíncrono (asgi_pix.py) precisa dele, e o app
+# síncrono não paga o custo do import na partida
+httpx = None
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Status HTTP que indicam falha transitória do lado da OpenPix
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+# Faz a OpenPix devolver a cobrança existente quando o correlationID se repete
+PARAMETROS_CRIACAO = {'return_existing': 'true'}
+
+# Métricas de cada tentativa de chamada (resultado: status HTTP, 'timeout' ou 'conexao')
+TENTATIVAS = metricas.histograma('pix_openpix_tentativa_segundos', 'Latência de cada tentativa de chamada à OpenPix',
+                                 ('metodo', 'operacao', 'resultado'))
+RECUSAS_CIRCUITO = metricas.contador('pix_openpix_circuito_aberto_total',
+                                     'Chamadas recusadas pelo circuit breaker sem contatar a OpenPix', ('operacao',))
+
+
+def _operacao(caminho):
+    """Rótulo de baixa cardinalidade para o caminho (ex.: /charge/<id> -> charge)."""
+    return caminho.strip('/').split('/', 1)[0]
+
+
+def _antes_do_envio(erro):
+    """Indica se a ConnectionError do requests ocorreu ao abrir a conexão, antes do envio.
+
+    Outras falhas de conexão (ex.: RemoteDisconnected) podem acontecer depois que a
+    OpenPix recebeu a requisição.
+    """
+    if isinstance(erro, requests.exceptions.ConnectTimeout):
+        return True
+    motivo = getattr(erro.args[0], 'reason', None) if erro.args else None
+    return isinstance(motivo, NewConnectionError)
+
+
+def _importar_httpx():
+    global httpx
+    if httpx is None:
+        try:
+            import httpx as modulo
+        except ImportError:
+            raise ImportError("O cliente assíncrono da OpenPix requer o pacote httpx")
+        httpx = modulo
+    return httpx
+
+
+class OpenPixErro(Exception):
+    """Erro ao chamar a API da OpenPix."""
+
+
+class CircuitoAberto(OpenPixErro):
+    """O circuit breaker está aberto: a OpenPix falhou repetidamente e as chamadas são recusadas."""
+
+
+class CircuitBreaker:
+    """Circuit breaker simples (fechado -> aberto -> meio-aberto) protegido por lock.
+
+    Se a chamada de teste do estado meio-aberto não terminar com `sucesso()` nem
+    `falha()` em `tempo_reabertura` segundos, outra chamada de teste é liberada.
+    """
+
+    def __init__(self, limite_falhas=5, tempo_reabertura=30):
+        self.limite_falhas = limite_falhas
+        self.tempo_reabertura = tempo_reabertura
+        self.estado = 'fechado'
+        self._falhas = 0
+        self._aberto_em = 0
+        self._teste_em = 0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == 'fechado':
+                return True
+            agora = time.monotonic()
+            if ((self.estado == 'aberto' and agora - self._aberto_em >= self.tempo_reabertura)
+                    or (self.estado == 'meio_aberto' and agora - self._teste_em >= self.tempo_reabertura)):
+                self.estado = 'meio_aberto'  # Deixa passar uma única chamada de teste
+                self._teste_em = agora
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            self.estado = 'fechado'
+            self._falhas = 0
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            if self.estado == 'meio_aberto' or self._falhas >= self.limite_falhas:
+                if self.estado != 'aberto':
+                    logger.warning(f"Circuit breaker da OpenPix aberto após {self._falhas} falhas")
+                self.estado = 'aberto'
+                self._aberto_em = time.monotonic()
+
+
+class OpenPixClient:
+    """Cliente HTTP da OpenPix com pool de conexões, timeouts, retentativas e circuit breaker.
+
+    Só repete requisições idempotentes. A criação de cobrança é idempotente porque a
+    OpenPix devolve a cobrança existente quando o mesmo correlationID é reenviado.
+    """
+
+    def __init__(self, api_url, api_key, pool_connections=2, pool_maxsize=10,
+                 timeout_conexao=3.05, timeout_leitura=10, max_tentativas=3,
+                 backoff_base=0.25, backoff_max=4, breaker=None):
+        self.api_url = api_url.rstrip('/')
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _espera(self, tentativa, resposta=None):
+        """Backoff exponencial com jitter completo, respeitando Retry-After quando presente."""
+        if resposta is not None and resposta.headers.get('Retry-After', '').isdigit():
+            return min(float(resposta.headers['Retry-After']), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** tentativa)))
+
+    def requisitar(self, metodo, caminho, idempotente=False, **kwargs):
+        """Executa a requisição e retorna o JSON da resposta."""
+        if not self.breaker.permitir():
+            RECUSAS_CIRCUITO.inc(operacao=_operacao(caminho))
+            raise CircuitoAberto("OpenPix indisponível (circuit breaker aberto)")
+        url = f"{self.api_url}{caminho}"
+        for tentativa in range(self.max_tentativas):
+            ultima = tentativa == self.max_tentativas - 1
+            try:
+                resposta = self._enviar(metodo, caminho, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                # Só é seguro repetir uma requisição não idempotente se a conexão nem chegou a
+                # ser aberta. ReadTimeout não é ConnectionError e cai no bloco seguinte.
+                erro = e
+                if not idempotente and not _antes_do_envio(e):
+                    self.breaker.falha()
+                    raise OpenPixErro(f"Falha ao chamar {metodo} {caminho}: {str(e)}") from e
+            except requests.exceptions.Timeout as e:
+                erro = e
+                if not idempotente:
+                    self.breaker.falha()
+                    raise OpenPixErro(f"Timeout ao chamar {metodo} {caminho}: {str(e)}") from e
+            except Exception:
+                # Ex.: ChunkedEncodingError, ContentDecodingError, TooManyRedirects. Sem isso, uma
+                # chamada de teste do estado meio-aberto não o encerraria.
+                self.breaker.falha()
+                raise
+            else:
+                if resposta.status_code not in STATUS_TRANSITORIOS:
+                    if resposta.status_code >= 400:
+                        self.breaker.sucesso()  # A OpenPix respondeu; erro do cliente não abre o circuito
+                        raise OpenPixErro(f"OpenPix respondeu {resposta.status_code}: {resposta.text[:500]}")
+                    self.breaker.sucesso()
+                    return resposta.json()
+                erro = OpenPixErro(f"OpenPix respondeu {resposta.status_code}: {resposta.text[:500]}")
+                if not idempotente or ultima:
+                    self.breaker.falha()
+                    raise erro
+                logger.warning(f"{metodo} {caminho} falhou ({resposta.status_code}), tentativa {tentativa + 1}")
+                time.sleep(self._espera(tentativa, resposta))
+                continue
+            if ultima:
+                break
+            logger.warning(f"{metodo} {caminho} falhou ({str(erro)}), tentativa {tentativa + 1}")
+            time.sleep(self._espera(tentativa))
+        self.breaker.falha()
+        raise OpenPixErro(f"Falha ao chamar {metodo} {caminho}: {str(erro)}")
+
+    def _enviar(self, metodo, caminho, url, **kwargs):
+        """Uma tentativa de requisição, com a latência registrada em TENTATIVAS."""
+        inicio = time.perf_counter()
+        resultado = 'erro'
+        try:
+            resposta = self.session.request(metodo, url, timeout=self.timeout, **kwargs)
+            resultado = str(resposta.status_code)
+            return resposta
+        except requests.exceptions.Timeout:
+            resultado = 'timeout'
+            raise
+        except requests.exceptions.ConnectionError:
+            resultado = 'conexao'
+            raise
+        finally:
+            TENTATIVAS.observar(time.perf_counter() - inicio, metodo=metodo, operacao=_operacao(caminho), resultado=resultado)
+
+    def criar_cobranca(self, payload):
+        """Cria uma cobrança Pix; repetível com segurança graças ao correlationID.
+
+        Com `return_existing=true`, a OpenPix devolve a cobrança já criada com o mesmo
+        correlationID em vez de responder 400. Sem o parâmetro, a repetição não seria idempotente.
+        """
+        return self.requisitar('POST', '/charge', idempotente=bool(payload.get('correlationID')),
+                               params=PARAMETROS_CRIACAO, json=payload)
+
+    def consultar_cobranca(self, correlation_id):
+        """Consulta uma cobrança pelo correlationID."""
+        return self.requisitar('GET', f'/charge/{correlation_id}', idempotente=True)
+
+
+class OpenPixClientAsync:
+    """Versão assíncrona do OpenPixClient (httpx), com a mesma política de retentativas.
+
+    Uma única instância por event loop atende centenas de cobranças simultâneas sem
+    ocupar um worker por requisição.
+    """
+
+    def __init__(self, api_url, api_key, max_conexoes=100, max_keepalive=20,
+                 timeout_conexao=3.05, timeout_leitura=10, max_tentativas=3,
+                 backoff_base=0.25, backoff_max=4, breaker=None):
+        _importar_httpx()
+        self.api_url = api_url.rstrip('/')
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.client = httpx.AsyncClient(
+            headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
+            timeout=httpx.Timeout(timeout_leitura, connect=timeout_conexao),
+            limits=httpx.Limits(max_connections=max_conexoes, max_keepalive_connections=max_keepalive)
+        )
+
+    _espera = OpenPixClient._espera
+
+    async def requisitar(self, metodo, caminho, idempotente=False, **kwargs):
+        """Executa a requisição e retorna o JSON da resposta."""
+        if not self.breaker.permitir():
+            RECUSAS_CIRCUITO.inc(operacao=_operacao(caminho))
+            raise CircuitoAberto("OpenPix indisponível (circuit breaker aberto)")
+        url = f"{self.api_url}{caminho}"
+        for tentativa in range(self.max_tentativas):
+            ultima = tentativa == self.max_tentativas - 1
+            try:
+                resposta = await self._enviar(metodo, caminho, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                erro = e  # A requisição não chegou à OpenPix
+            except httpx.TransportError as e:
+                erro = e
+                if not idempotente:
+                    self.breaker.falha()
+                    raise OpenPixErro(f"Falha ao chamar {metodo} {caminho}: {str(e)}") from e
+            except Exception:
+                self.breaker.falha()  # Ex.: DecodingError, TooManyRedirects
+                raise
+            else:
+                if resposta.status_code not in STATUS_TRANSITORIOS:
+                    self.breaker.sucesso()
+                    if resposta.status_code >= 400:
+                        raise OpenPixErro(f"OpenPix respondeu {resposta.status_code}: {resposta.text[:500]}")
+                    return resposta.json()
+                erro = OpenPixErro(f"OpenPix respondeu {resposta.status_code}: {resposta.text[:500]}")
+                if not idempotente or ultima:
+                    self.breaker.falha()
+                    raise erro
+                logger.warning(f"{metodo} {caminho} falhou ({resposta.status_code}), tentativa {tentativa + 1}")
+                await asyncio.sleep(self._espera(tentativa, resposta))
+                continue
+            if ultima:
+                break
+            logger.warning(f"{metodo} {caminho} falhou ({str(erro)}), tentativa {tentativa + 1}")
+            await asyncio.sleep(self._espera(tentativa))
+        self.breaker.falha()
+        raise OpenPixErro(f"Falha ao chamar {metodo} {caminho}: {str(erro)}")
+
+    async def _enviar(self, metodo, caminho, url, **kwargs):
+        """Uma tentativa de requisição, com a latência registrada em TENTATIVAS."""
+        inicio = time.perf_counter()
+        resultado = 'erro'
+        try:
+            resposta = await self.client.request(metodo, url, **kwargs)
+            resultado = str(resposta.status_code)
+            return resposta
+        except httpx.TimeoutException:
+            resultado = 'timeout'
+            raise
+        except httpx.TransportError:
+            resultado = 'conexao'
+            raise
+        finally:
+            TENTATIVAS.observar(time.perf_counter() - inicio, metodo=metodo, operacao=_operacao(caminho), resultado=resultado)
+
+    async def criar_cobranca(self, payload):
+        return await self.requisitar('POST', '/charge', idempotente=bool(payload.get('correlationID')),
+                                     params=PARAMETROS_CRIACAO, json=payload)
+
+    async def consultar_cobranca(self, correlation_id):
+        return await self.requisitar('GET', f'/charge/{correlation_id}', idempotente=True)
+
+    async def fechar(self):
+        await self.client.aclose()
+
+
+def _config_openpix():
+    return {
+        'api_url': os.getenv('OPENPIX_API_URL', 'https://api.sandbox.openpix.com.br/openpix/v1'),
+        'api_key': os.getenv('OPENPIX_API_KEY'),
+        'timeout_conexao': float(os.getenv('OPENPIX_TIMEOUT_CONEXAO', '3.05')),
+        'timeout_leitura': float(os.getenv('OPENPIX_TIMEOUT_LEITURA', '10')),
+        'max_tentativas': int(os.getenv('OPENPIX_MAX_TENTATIVAS', '3')),
+        'breaker': CircuitBreaker(
+            limite_falhas=int(os.getenv('OPENPIX_CB_FALHAS', '5')),
+            tempo_reabertura=float(os.getenv('OPENPIX_CB_REABERTURA', '30'))
+        )
+    }
+
+
+def criar_cliente_openpix():
+    """Cria o cliente da OpenPix a partir das variáveis de ambiente."""
+    return OpenPixClient(
+        pool_connections=int(os.getenv('OPENPIX_POOL_CONNECTIONS', '2')),
+        pool_maxsize=int(os.getenv('OPENPIX_POOL_MAXSIZE', '10')),
+        **_config_openpix()
+    )
+
+
+def criar_cliente_openpix_async():
+    """Cria o cliente assíncrono da OpenPix a partir das variáveis de ambiente."""
+    return OpenPixClientAsync(
+        max_conexoes=int(os.getenv('OPENPIX_ASYNC_MAX_CONEXOES', '100')),
+        max_keepalive=int(os.getenv('OPENPIX_ASYNC_MAX_KEEPALIVE', '20')),
+        **_config_openpix()
+    )
@@ -0,0 +1,187 @@
+import os
+import json
+import logging
+from datetime import datetime
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from utils.journal import PADRAO_LEGADO
+from utils.normalizador import normalizar
+from utils.transacoes_store import instante
+from utils.expiracao import STATUS_OPENPIX
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Notificações por tarefa enviada ao pool
+TAMANHO_BLOCO = 5000
+
+# Pares (txid, status) por transação do SQLite na aplicação do resultado
+LOTE_ESCRITA = 50000
+
+
+def status_resultante(notificacao):
+    """Status que a notificação deixa na transação, como em processar_notificacao_pix.
+
+    Notificações concluídas concluem a transação. Também entram as cobranças expiradas
+    (mesmo mapeamento do agendador de expiração). As demais não alteram nada.
+    """
+    if notificacao.concluida:
+        return 'CONCLUIDA'
+    return STATUS_OPENPIX.get(notificacao.status)
+
+
+def horario_evento(payload, recebido_em=None):
+    """Epoch do evento: horário do Pix, pagamento ou atualização da cobrança, ou a chegada ao webhook."""
+    pix = payload.get('pix')
+    charge = payload.get('charge')
+    candidatos = (
+        pix.get('horario') if isinstance(pix, dict) else None,
+        charge.get('paidAt') if isinstance(charge, dict) else None,
+        charge.get('updatedAt') if isinstance(charge, dict) else None,
+        recebido_em,
+    )
+    for candidato in candidatos:
+        if not candidato:
+            continue
+        try:
+            return instante(candidato.replace('Z', '+00:00') if isinstance(candidato, str) else candidato)
+        except ValueError:
+            continue
+    return 0.0
+
+
+def _resultado(payload, recebido_em, ordem):
+    notificacao = normalizar(payload) if isinstance(payload, dict) else None
+    if notificacao is None:
+        return None
+    status = status_resultante(notificacao)
+    if status is None or not (notificacao.txid or notificacao.correlation_id):
+        return None
+    alternativa = notificacao.correlation_id if notificacao.correlation_id != notificacao.txid else None
+    return (horario_evento(payload, recebido_em), ordem, notificacao.txid or notificacao.correlation_id,
+            alternativa, status)
+
+
+def processar_bloco(bloco):
+    """Decodifica e normaliza um bloco no processo do pool.
+
+    `bloco` é (inicio, tipo, itens): linhas do diário (tipo 'diario') ou caminhos de
+    arquivos legados (tipo 'legado'). Retorna (resultados, ignoradas, invalidas), com
+    resultados no formato (horario, ordem, txid, correlation_id, status).
+    """
+    inicio, tipo, itens = bloco
+    resultados = []
+    ignoradas = invalidas = 0
+    for i, item in enumerate(itens):
+        try:
+            if tipo == 'diario':
+                entrada = json.loads(item)
+                payload, recebido_em = entrada.get('payload'), entrada.get('recebido_em')
+            else:
+                with open(item, 'r', encoding='utf-8') as f:
+                    payload = json.load(f)
+                recebido_em = datetime.strptime(PADRAO_LEGADO.match(os.path.basename(item)).group(1),
+                                                '%Y%m%d_%H%M%S').isoformat()
+            resultado = _resultado(payload, recebido_em, inicio + i)
+        except Exception:
+            invalidas += 1
+            continue
+        if resultado is None:
+            ignoradas += 1
+        else:
+            resultados.append(resultado)
+    return resultados, ignoradas, invalidas
+
+
+def gerar_blocos(journal, legado_dir=None, tamanho=TAMANHO_BLOCO):
+    """Agrupa as linhas do diário (em ordem de chegada) e, depois, os arquivos legados (por data no nome)."""
+    inicio = 0
+    itens = []
+    for linha in journal.iterar_linhas():
+        itens.append(linha)
+        if len(itens) >= tamanho:
+            yield (inicio, 'diario', itens)
+            inicio += len(itens)
+            itens = []
+    if itens:
+        yield (inicio, 'diario', itens)
+        inicio += len(itens)
+        itens = []
+    if legado_dir and os.path.isdir(legado_dir):
+        nomes = sorted(n for n in os.listdir(legado_dir) if PADRAO_LEGADO.match(n))
+        for posicao in range(0, len(nomes), tamanho):
+            caminhos = [os.path.join(legado_dir, n) for n in nomes[posicao:posicao + tamanho]]
+            yield (inicio, 'legado', caminhos)
+            inicio += len(caminhos)
+
+
+def _mapear_em_ordem(funcao, blocos, processos):
+    """Como `executor.map`, mas com no máximo 2 blocos por processo em andamento.
+
+    Assim as linhas lidas do disco não se acumulam em memória à frente do pool.
+    """
+    if processos <= 1:
+        for bloco in blocos:
+            yield len(bloco[2]), funcao(bloco)
+        return
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        pendentes = deque()
+        for bloco in blocos:
+            pendentes.append((len(bloco[2]), executor.submit(funcao, bloco)))
+            if len(pendentes) >= processos * 2:
+                quantidade, futuro = pendentes.popleft()
+                yield quantidade, futuro.result()
+        while pendentes:
+            quantidade, futuro = pendentes.popleft()
+            yield quantidade, futuro.result()
+
+
+def reprocessar(journal, legado_dir=None, processos=None, tamanho_bloco=TAMANHO_BLOCO):
+    """Reprocessa as notificações arquivadas e retorna (estado, estatisticas).
+
+    `estado` mapeia cada txid ao último status pelo horário do evento (last-write-wins),
+    com a posição no arquivo como desempate. O resultado não depende da ordem em que
+    o pool devolve os blocos nem de notificações repetidas.
+    """
+    processos = processos if processos is not None else (os.cpu_count() or 1)
+    estado = {}
+    estatisticas = {'lidas': 0, 'aplicaveis': 0, 'ignoradas': 0, 'invalidas': 0}
+    for quantidade, (resultados, ignoradas, invalidas) in _mapear_em_ordem(
+            processar_bloco, gerar_blocos(journal, legado_dir, tamanho_bloco), processos):
+        estatisticas['lidas'] += quantidade
+        estatisticas['ignoradas'] += ignoradas
+        estatisticas['invalidas'] += invalidas
+        estatisticas['aplicaveis'] += len(resultados)
+        for horario, ordem, txid, alternativa, status in resultados:
+            atual = estado.get(txid)
+            if atual is None or (horario, ordem) > (atual[0], atual[1]):
+                estado[txid] = (horario, ordem, alternativa, status)
+    estatisticas['transacoes'] = len(estado)
+    return estado, estatisticas
+
+
+def aplicar(store, estado, lote=LOTE_ESCRITA):
+    """Grava o estado reconstruído em lotes de `lote` pares por transação do SQLite.
+
+    Como em processar_notificacao_pix, o txid que não existir é tentado pelo correlationID.
+    Retorna {'atualizadas': n, 'nao_encontradas': n}.
+    """
+    atualizadas = nao_encontradas = aplicadas = 0
+    itens = iter(estado.items())
+    while True:
+        parte = list(islice(itens, lote))
+        if not parte:
+            break
+        alteradas = store.atualizar_status_lote([(txid, valor[3]) for txid, valor in parte])
+        encontradas = {transacao.get('txid') for transacao in alteradas}
+        faltantes = [(valor[2], valor[3]) for txid, valor in parte if txid not in encontradas and valor[2]]
+        if faltantes:
+            alteradas_alternativa = store.atualizar_status_lote(faltantes)
+            encontradas.update(transacao.get('txid') for transacao in alteradas_alternativa)
+            atualizadas += len(alteradas_alternativa)
+        atualizadas += len(alteradas)
+        nao_encontradas += sum(1 for txid, valor in parte if txid not in encontradas and valor[2] not in encontradas)
+        aplicadas += len(parte)
+        logger.info(f"Replay: {aplicadas} de {len(estado)} transações aplicadas")
+    return {'atualizadas': atualizadas, 'nao_encontradas': nao_encontradas}
@@ -0,0 +1,655 @@
+import os
+import json
+import base64
+import sqlite3
+import hashlib
+import heapq
+import threading
+import logging
+from datetime import datetime
+from itertools import chain
+from utils.armazenamento import bloqueio_arquivo, escrever_json_atomico
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+# Colunas indexadas, extraídas do JSON de cada transação
+COLUNAS = ('id', 'txid', 'status', 'chave_id', 'moeda', 'criado_em', 'dados')
+
+# Formato de data gravado até a adoção do ISO 8601
+FORMATO_DATA_LEGADO = '%d/%m/%Y %H:%M'
+
+
+def instante(valor):
+    """Converte epoch (número ou texto numérico) ou data ISO 8601 em epoch (float)."""
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(valor).timestamp()
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(valor, FORMATO_DATA_LEGADO).timestamp()
+    except ValueError:
+        raise ValueError(f"Data inválida (use ISO 8601 ou epoch): {valor}")
+
+
+def _normalizar_data(transacao):
+    """Garante `data_criacao` em ISO 8601 e retorna o epoch correspondente (0 se ausente ou inválida)."""
+    data = transacao.get('data_criacao')
+    try:
+        epoch = instante(data)
+    except ValueError:
+        logger.warning(f"Data de criação inválida na transação {transacao.get('id')}: {data}")
+        return 0.0
+    if epoch is None:
+        return 0.0
+    transacao['data_criacao'] = datetime.fromtimestamp(epoch).isoformat(timespec='seconds')
+    return epoch
+
+
+def _linha(transacao):
+    criado_em = _normalizar_data(transacao)
+    return (transacao['id'], transacao.get('txid'), transacao.get('status'), transacao.get('chave_id'),
+            transacao.get('moeda'), criado_em, json.dumps(transacao, ensure_ascii=False))
+
+
+def _codificar_cursor(criado_em, *posicao):
+    return base64.urlsafe_b64encode(json.dumps([criado_em, *posicao]).encode('ascii')).decode('ascii')
+
+
+def _decodificar_cursor(cursor, campos=2):
+    """Decodifica (criado_em, seq) ou, com campos=3, a posição (criado_em, shard, seq) dos shards."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(valores, list) or len(valores) != campos:
+            raise ValueError
+        return (float(valores[0]),) + tuple(int(v) for v in valores[1:])
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+
+class TransacoesStoreSQLite:
+    """Armazena transações Pix em SQLite (modo WAL) com índices por txid, status, chave, moeda e data.
+
+    Cada transação é gravada como uma linha, então inserir ou atualizar o status
+    custa O(log N) em vez de reescrever o histórico inteiro. Os campos filtráveis
+    ficam em colunas próprias, mantidas pelo SQLite nos índices secundários a cada escrita.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._criar_esquema()
+
+    def _conexao(self):
+        """Retorna uma conexão por thread (e por processo, após um fork)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _criar_esquema(self):
+        conn = self._conexao()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transacoes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                txid TEXT,
+                status TEXT,
+                dados TEXT NOT NULL
+            )
+        """)
+        colunas = {linha[1] for linha in conn.execute('PRAGMA table_info(transacoes)')}
+        for coluna, tipo in (('chave_id', 'TEXT'), ('moeda', 'TEXT'), ('criado_em', 'REAL')):
+            if coluna not in colunas:
+                try:
+                    conn.execute(f'ALTER TABLE transacoes ADD COLUMN {coluna} {tipo}')
+                except sqlite3.OperationalError as e:
+                    if 'duplicate column' not in str(e):  # Outro worker migrou ao mesmo tempo
+                        raise
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transacoes_txid ON transacoes(txid)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transacoes_criado ON transacoes(criado_em, seq)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transacoes_status ON transacoes(status, criado_em, seq)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transacoes_chave ON transacoes(chave_id, criado_em, seq)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transacoes_moeda ON transacoes(moeda, criado_em, seq)')
+        # Índice parcial: só as transações concluídas que aguardam a conversão para a moeda escolhida
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transacoes_conversao ON transacoes(seq) "
+                     f"WHERE {_SEM_CONVERSAO}")
+        self._preencher_colunas()
+
+    def _preencher_colunas(self):
+        """Migra linhas antigas: extrai as colunas indexadas do JSON e converte a data para ISO 8601."""
+        conn = self._conexao()
+        if conn.execute('SELECT 1 FROM transacoes WHERE criado_em IS NULL LIMIT 1').fetchone() is None:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            linhas = conn.execute('SELECT seq, dados FROM transacoes WHERE criado_em IS NULL').fetchall()
+            atualizacoes = []
+            for seq, dados in linhas:
+                transacao = json.loads(dados)
+                _, _, _, chave_id, moeda, criado_em, dados = _linha(transacao)
+                atualizacoes.append((chave_id, moeda, criado_em, dados, seq))
+            conn.executemany(
+                'UPDATE transacoes SET chave_id = ?, moeda = ?, criado_em = ?, dados = ? WHERE seq = ?', atualizacoes
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if atualizacoes:
+            logger.info(f"{len(atualizacoes)} transações migradas para as colunas indexadas")
+
+    def inserir(self, transacao):
+        """Insere uma nova transação."""
+        self._conexao().execute(_INSERIR, _linha(transacao))
+        return transacao
+
+    def inserir_lote(self, transacoes):
+        """Insere várias transações em uma única transação do SQLite."""
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(_INSERIR, [_linha(t) for t in transacoes])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return transacoes
+
+    def atualizar_status(self, txid, status):
+        """Atualiza o status da primeira transação com o txid informado."""
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            linha = conn.execute(
+                'SELECT seq, dados FROM transacoes WHERE txid = ? ORDER BY seq LIMIT 1', (txid,)
+            ).fetchone()
+            if linha is None:
+                conn.execute('COMMIT')
+                return None
+            transacao = json.loads(linha[1])
+            transacao['status'] = status
+            conn.execute(
+                'UPDATE transacoes SET status = ?, dados = ? WHERE seq = ?',
+                (status, json.dumps(transacao, ensure_ascii=False), linha[0])
+            )
+            conn.execute('COMMIT')
+            return transacao
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def atualizar_status_lote(self, atualizacoes, somente_status=None):
+        """Aplica vários pares (txid, status) em uma única transação do SQLite.
+
+        Com `somente_status`, só altera transações que ainda estão nesse status (ex.: não
+        sobrescreve uma confirmação que chegou pelo webhook enquanto o lote era montado).
+        Retorna as transações alteradas.
+        """
+        conn = self._conexao()
+        alteradas = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for txid, status in atualizacoes:
+                linha = conn.execute(
+                    'SELECT seq, status, dados FROM transacoes WHERE txid = ? ORDER BY seq LIMIT 1', (txid,)
+                ).fetchone()
+                if linha is None or (somente_status is not None and linha[1] != somente_status):
+                    continue
+                transacao = json.loads(linha[2])
+                transacao['status'] = status
+                conn.execute(
+                    'UPDATE transacoes SET status = ?, dados = ? WHERE seq = ?',
+                    (status, json.dumps(transacao, ensure_ascii=False), linha[0])
+                )
+                alteradas.append(transacao)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return alteradas
+
+    def registrar_conversoes_lote(self, conversoes):
+        """Grava pares (txid, conversao) em uma única transação do SQLite.
+
+        Só altera transações CONCLUIDA que ainda não têm conversão, então gravar a mesma
+        conversão de novo (confirmação repetida, dois workers) não tem efeito.
+        Retorna as transações alteradas.
+        """
+        conn = self._conexao()
+        alteradas = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for txid, conversao in conversoes:
+                linha = conn.execute(
+                    'SELECT seq, status, dados FROM transacoes WHERE txid = ? ORDER BY seq LIMIT 1', (txid,)
+                ).fetchone()
+                if linha is None or linha[1] != 'CONCLUIDA':
+                    continue
+                transacao = json.loads(linha[2])
+                if transacao.get('conversao'):
+                    continue
+                transacao['conversao'] = conversao
+                conn.execute('UPDATE transacoes SET dados = ? WHERE seq = ?',
+                             (json.dumps(transacao, ensure_ascii=False), linha[0]))
+                alteradas.append(transacao)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return alteradas
+
+    def pendentes_conversao(self, lote=1000):
+        """Percorre as transações concluídas sem conversão, em ordem de inserção, `lote` por consulta.
+
+        A consulta é forçada no índice parcial (o planejador preferiria o de status), que só
+        contém essas linhas: o custo não cresce com o histórico de transações já convertidas.
+        """
+        seq = 0
+        while True:
+            linhas = self._conexao().execute(
+                'SELECT seq, dados FROM transacoes INDEXED BY idx_transacoes_conversao '
+                f'WHERE {_SEM_CONVERSAO} AND seq > ? ORDER BY seq LIMIT ?',
+                (seq, lote)
+            ).fetchall()
+            for linha in linhas:
+                yield json.loads(linha[1])
+            if len(linhas) < lote:
+                return
+            seq = linhas[-1][0]
+
+    def buscar_por_txid(self, txid):
+        """Retorna a transação com o txid informado ou None."""
+        linha = self._conexao().execute(
+            'SELECT dados FROM transacoes WHERE txid = ? ORDER BY seq LIMIT 1', (txid,)
+        ).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def listar(self):
+        """Retorna todas as transações na ordem de inserção."""
+        linhas = self._conexao().execute('SELECT dados FROM transacoes ORDER BY seq').fetchall()
+        return [json.loads(linha[0]) for linha in linhas]
+
+    @staticmethod
+    def _filtros(status, chave_id, moeda, desde, ate):
+        condicoes, parametros = [], []
+        for coluna, valor in (('status', status), ('chave_id', chave_id), ('moeda', moeda)):
+            if valor is not None:
+                condicoes.append(f'{coluna} = ?')
+                parametros.append(valor)
+        if desde is not None:
+            condicoes.append('criado_em >= ?')
+            parametros.append(instante(desde))
+        if ate is not None:
+            condicoes.append('criado_em < ?')
+            parametros.append(instante(ate))
+        return condicoes, parametros
+
+    def _pagina(self, condicoes, parametros, ordem, limite):
+        sql = 'SELECT seq, criado_em, dados FROM transacoes'
+        if condicoes:
+            sql += ' WHERE ' + ' AND '.join(condicoes)
+        sql += f' ORDER BY criado_em {ordem}, seq {ordem} LIMIT ?'
+        return self._conexao().execute(sql, parametros + [limite]).fetchall()
+
+    def consultar(self, status=None, chave_id=None, moeda=None, desde=None, ate=None, limite=100, cursor=None):
+        """Lista transações filtradas, da mais recente para a mais antiga, com paginação por cursor.
+
+        `desde` (inclusivo) e `ate` (exclusivo) são epoch ou ISO 8601. Retorna
+        (transacoes, proximo_cursor), com proximo_cursor None na última página.
+        A paginação usa a posição (criado_em, seq) da última linha, então cada página
+        custa O(log N + limite), independentemente do tamanho do histórico.
+        """
+        condicoes, parametros = self._filtros(status, chave_id, moeda, desde, ate)
+        if cursor:
+            condicoes.append('(criado_em, seq) < (?, ?)')
+            parametros.extend(_decodificar_cursor(cursor))
+        linhas = self._pagina(condicoes, parametros, 'DESC', limite + 1)
+        proximo = None
+        if len(linhas) > limite:
+            linhas = linhas[:limite]
+            proximo = _codificar_cursor(linhas[-1][1], linhas[-1][0])
+        return [json.loads(linha[2]) for linha in linhas], proximo
+
+    def iterar(self, status=None, chave_id=None, moeda=None, desde=None, ate=None, lote=1000):
+        """Percorre as transações filtradas em ordem cronológica, `lote` linhas por consulta.
+
+        Só um lote fica em memória por vez, qualquer que seja o tamanho do histórico.
+        """
+        for linha in self._iterar_linhas(status, chave_id, moeda, desde, ate, lote):
+            yield json.loads(linha[2])
+
+    def _iterar_linhas(self, status=None, chave_id=None, moeda=None, desde=None, ate=None, lote=1000):
+        """Como `iterar`, mas produz as linhas (seq, criado_em, dados) sem decodificar o JSON."""
+        condicoes, parametros = self._filtros(status, chave_id, moeda, desde, ate)
+        posicao = None
+        while True:
+            if posicao is None:
+                linhas = self._pagina(condicoes, parametros, 'ASC', lote)
+            else:
+                linhas = self._pagina(condicoes + ['(criado_em, seq) > (?, ?)'], parametros + list(posicao), 'ASC', lote)
+            yield from linhas
+            if len(linhas) < lote:
+                return
+            posicao = (linhas[-1][1], linhas[-1][0])
+
+    def contar(self):
+        return self._conexao().execute('SELECT COUNT(*) FROM transacoes').fetchone()[0]
+
+    def arquivos(self):
+        """Arquivos em disco do banco (para a métrica de armazenamento)."""
+        return [self.caminho, self.caminho + '-wal']
+
+    def importar_lote(self, transacoes):
+        """Insere transações ignorando os ids já existentes, em uma única transação do SQLite.
+
+        Retorna quantas foram inseridas. Usado nas migrações, que podem ser repetidas.
+        """
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            importadas = 0
+            for transacao in transacoes:
+                cursor = conn.execute(_INSERIR.replace('INSERT', 'INSERT OR IGNORE', 1), _linha(transacao))
+                importadas += cursor.rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return importadas
+
+    def remover_lote(self, ids):
+        """Remove as transações com os ids informados, em uma única transação do SQLite."""
+        conn = self._conexao()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('DELETE FROM transacoes WHERE id = ?', [(i,) for i in ids])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def migrar_de_json(self, caminho_json):
+        """Importa uma única vez o arquivo JSON legado e o renomeia para *.migrado.
+
+        Retorna a quantidade de transações importadas.
+        """
+        if not os.path.exists(caminho_json):
+            return 0
+        with open(caminho_json, 'r', encoding='utf-8') as f:
+            transacoes = json.load(f)
+        importadas = self.importar_lote(transacoes)
+        try:
+            os.replace(caminho_json, caminho_json + '.migrado')
+        except FileNotFoundError:
+            pass
+        logger.info(f"{importadas} transações migradas de {caminho_json} para {self.caminho}")
+        return importadas
+
+
+# Mesma expressão no índice parcial e na consulta, para que o SQLite use o índice
+_SEM_CONVERSAO = "status = 'CONCLUIDA' AND json_extract(dados, '$.conversao') IS NULL"
+
+_INSERIR = f"INSERT INTO transacoes ({', '.join(COLUNAS)}) VALUES ({', '.join('?' * len(COLUNAS))})"
+
+
+def shard_de(chave, shards):
+    """Shard da chave entre `shards`, por jump consistent hash (Lamping e Veach).
+
+    O resultado é estável entre processos e reinícios. Ao passar de N para N+1 shards,
+    só ~1/(N+1) das chaves mudam de lugar, todas para o shard novo.
+    """
+    h = int.from_bytes(hashlib.blake2b(chave.encode('utf-8'), digest_size=8).digest(), 'big')
+    b, j = -1, 0
+    while j < shards:
+        b = j
+        h = (h * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (2 ** 31 / ((h >> 33) + 1)))
+    return b
+
+
+def caminho_shard(caminho, indice):
+    """Arquivo do shard: o shard 0 é o próprio `caminho`, então 1 shard é o banco de sempre."""
+    if indice == 0:
+        return caminho
+    raiz, extensao = os.path.splitext(caminho)
+    return f"{raiz}-{indice}{extensao}"
+
+
+def _chave_shard(transacao):
+    return transacao.get('txid') or transacao['id']
+
+
+class TransacoesStoreShards:
+    """Transações distribuídas entre vários bancos SQLite pelo hash do txid.
+
+    Escritas e buscas por txid vão direto ao shard da transação, então notificações de
+    transações em shards diferentes não disputam o mesmo arquivo nem o mesmo bloqueio
+    de escrita do SQLite. Consultas e varreduras leem todos os shards e intercalam os
+    resultados na ordem (criado_em, shard, seq). O cursor de paginação guarda essa posição.
+
+    Lotes que tocam vários shards são gravados em uma transação por shard, e não de
+    forma atômica entre eles.
+    """
+
+    def __init__(self, caminho, shards, backend=TransacoesStoreSQLite):
+        self.caminho = caminho
+        self.shards = [backend(caminho_shard(caminho, indice)) for indice in range(shards)]
+
+    def _shard(self, chave):
+        return self.shards[shard_de(chave, len(self.shards))]
+
+    def _agrupar(self, itens, chave):
+        grupos = {}
+        for item in itens:
+            grupos.setdefault(shard_de(chave(item), len(self.shards)), []).append(item)
+        return grupos
+
+    # Escritas e buscas por txid: um shard
+
+    def inserir(self, transacao):
+        return self._shard(_chave_shard(transacao)).inserir(transacao)
+
+    def inserir_lote(self, transacoes):
+        for indice, grupo in self._agrupar(transacoes, _chave_shard).items():
+            self.shards[indice].inserir_lote(grupo)
+        return transacoes
+
+    def importar_lote(self, transacoes):
+        return sum(self.shards[indice].importar_lote(grupo)
+                   for indice, grupo in self._agrupar(transacoes, _chave_shard).items())
+
+    def atualizar_status(self, txid, status):
+        return self._shard(txid).atualizar_status(txid, status)
+
+    def atualizar_status_lote(self, atualizacoes, somente_status=None):
+        alteradas = []
+        for indice, grupo in self._agrupar(atualizacoes, lambda par: par[0]).items():
+            alteradas.extend(self.shards[indice].atualizar_status_lote(grupo, somente_status=somente_status))
+        return alteradas
+
+    def registrar_conversoes_lote(self, conversoes):
+        alteradas = []
+        for indice, grupo in self._agrupar(conversoes, lambda par: par[0]).items():
+            alteradas.extend(self.shards[indice].registrar_conversoes_lote(grupo))
+        return alteradas
+
+    def buscar_por_txid(self, txid):
+        return self._shard(txid).buscar_por_txid(txid)
+
+    # Leituras agregadas: todos os shards
+
+    def pendentes_conversao(self, lote=1000):
+        return chain.from_iterable(shard.pendentes_conversao(lote=lote) for shard in self.shards)
+
+    def consultar(self, status=None, chave_id=None, moeda=None, desde=None, ate=None, limite=100, cursor=None):
+        """Como TransacoesStoreSQLite.consultar: pede `limite` + 1 linhas a cada shard e intercala."""
+        condicoes, parametros = TransacoesStoreSQLite._filtros(status, chave_id, moeda, desde, ate)
+        posicao = _decodificar_cursor(cursor, 3) if cursor else None
+        linhas = []
+        for indice, shard in enumerate(self.shards):
+            extra, valores = [], []
+            if posicao:
+                criado_em, shard_cursor, seq = posicao
+                if indice < shard_cursor:
+                    extra, valores = ['criado_em <= ?'], [criado_em]
+                elif indice == shard_cursor:
+                    extra, valores = ['(criado_em, seq) < (?, ?)'], [criado_em, seq]
+                else:
+                    extra, valores = ['criado_em < ?'], [criado_em]
+            linhas.extend((linha[1], indice, linha[0], linha[2])
+                          for linha in shard._pagina(condicoes + extra, parametros + valores, 'DESC', limite + 1))
+        linhas.sort(reverse=True, key=lambda linha: linha[:3])
+        proximo = None
+        if len(linhas) > limite:
+            linhas = linhas[:limite]
+            proximo = _codificar_cursor(*linhas[-1][:3])
+        return [json.loads(linha[3]) for linha in linhas[:limite]], proximo
+
+    def iterar(self, status=None, chave_id=None, moeda=None, desde=None, ate=None, lote=1000):
+        """Intercala as varreduras dos shards em ordem cronológica; um lote por shard em memória."""
+        def linhas(indice, shard):
+            for seq, criado_em, dados in shard._iterar_linhas(status, chave_id, moeda, desde, ate, lote):
+                yield criado_em, indice, seq, dados
+
+        for linha in heapq.merge(*(linhas(indice, shard) for indice, shard in enumerate(self.shards)),
+                                 key=lambda linha: linha[:3]):
+            yield json.loads(linha[3])
+
+    def listar(self):
+        return list(self.iterar())
+
+    def contar(self):
+        return sum(shard.contar() for shard in self.shards)
+
+    def arquivos(self):
+        return [arquivo for shard in self.shards for arquivo in shard.arquivos()]
+
+    def migrar_de_json(self, caminho_json):
+        """Importa uma única vez o arquivo JSON legado, distribuindo as transações pelos shards."""
+        if not os.path.exists(caminho_json):
+            return 0
+        with open(caminho_json, 'r', encoding='utf-8') as f:
+            transacoes = json.load(f)
+        importadas = self.importar_lote(transacoes)
+        try:
+            os.replace(caminho_json, caminho_json + '.migrado')
+        except FileNotFoundError:
+            pass
+        logger.info(f"{importadas} transações migradas de {caminho_json} para {len(self.shards)} shards")
+        return importadas
+
+
+# Backends disponíveis, selecionados pela variável de ambiente TRANSACOES_BACKEND
+BACKENDS = {
+    'sqlite': TransacoesStoreSQLite,
+}
+
+
+def _arquivo_shards(caminho):
+    return caminho + '.shards.json'
+
+
+def ler_shards(caminho):
+    """Estado registrado dos shards: {'shards': n} e, durante um rebalanceamento, 'destino'."""
+    try:
+        with open(_arquivo_shards(caminho), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'shards': 1}
+
+
+def _shards_existentes(caminho, shards):
+    return [indice for indice in range(shards) if os.path.exists(caminho_shard(caminho, indice))]
+
+
+def criar_store(caminho, backend=None, shards=None):
+    """Cria o backend de armazenamento de transações configurado.
+
+    Com mais de um shard (TRANSACOES_SHARDS), as transações são distribuídas pelo hash do
+    txid. Mudar o número de shards exige rebalancear os dados antes
+    (scripts/rebalancear_transacoes.py); até lá, o store não é criado.
+    """
+    backend = backend or os.environ.get('TRANSACOES_BACKEND', 'sqlite')
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de transações desconhecido: {backend}")
+    shards = shards or int(os.environ.get('TRANSACOES_SHARDS', '1'))
+    estado = ler_shards(caminho)
+    if 'destino' in estado:
+        raise ValueError(f"Rebalanceamento de {caminho} para {estado['destino']} shards interrompido; "
+                         f"rode scripts/rebalancear_transacoes.py --shards {estado['destino']}")
+    if estado['shards'] != shards:
+        with bloqueio_arquivo(_arquivo_shards(caminho)):
+            estado = ler_shards(caminho)
+            if estado['shards'] != shards:
+                existentes = _shards_existentes(caminho, estado['shards'])
+                if any(BACKENDS[backend](caminho_shard(caminho, indice)).contar() for indice in existentes):
+                    raise ValueError(f"{caminho} tem dados em {estado['shards']} shards, e não em {shards}; "
+                                     f"rode scripts/rebalancear_transacoes.py --shards {shards}")
+                escrever_json_atomico(_arquivo_shards(caminho), {'shards': shards})
+    if shards == 1:
+        return BACKENDS[backend](caminho)
+    return TransacoesStoreShards(caminho, shards, BACKENDS[backend])
+
+
+def rebalancear(caminho, shards, backend=None, lote=5000, progresso=None):
+    """Redistribui as transações de `caminho` para `shards` shards. Retorna as contagens.
+
+    Cada lote é copiado para o shard de destino (ignorando ids que já estão lá) antes de
+    ser removido da origem, então uma interrupção não perde dados. O estado registra o
+    destino até o fim, e rodar de novo com o mesmo número completa o trabalho. Deve rodar
+    com o serviço parado: enquanto o estado tiver um destino, criar_store recusa o banco.
+    """
+    classe = BACKENDS[backend or os.environ.get('TRANSACOES_BACKEND', 'sqlite')]
+    with bloqueio_arquivo(_arquivo_shards(caminho)):
+        estado = ler_shards(caminho)
+        anteriores = max(estado['shards'], estado.get('destino', 0))
+        escrever_json_atomico(_arquivo_shards(caminho), {'shards': estado['shards'], 'destino': shards})
+        destinos = [classe(caminho_shard(caminho, indice)) for indice in range(shards)]
+        resultado = {'anteriores': estado['shards'], 'shards': shards, 'lidas': 0, 'movidas': 0,
+                     'por_shard': {}}
+        for indice in _shards_existentes(caminho, max(anteriores, shards)):
+            origem = destinos[indice] if indice < shards else classe(caminho_shard(caminho, indice))
+            seq = 0
+            while True:
+                linhas = origem._conexao().execute(
+                    'SELECT seq, dados FROM transacoes WHERE seq > ? ORDER BY seq LIMIT ?', (seq, lote)
+                ).fetchall()
+                if not linhas:
+                    break
+                seq = linhas[-1][0]
+                resultado['lidas'] += len(linhas)
+                mover = {}
+                for _, dados in linhas:
+                    transacao = json.loads(dados)
+                    destino = shard_de(_chave_shard(transacao), shards)
+                    if destino != indice:
+                        mover.setdefault(destino, []).append(transacao)
+                for destino, transacoes in mover.items():
+                    destinos[destino].importar_lote(transacoes)
+                    origem.remover_lote([t['id'] for t in transacoes])
+                    resultado['movidas'] += len(transacoes)
+                if progresso:
+                    progresso(resultado)
+            if indice >= shards and origem.contar() == 0:
+                origem._conexao().close()
+                for arquivo in (origem.caminho, origem.caminho + '-wal', origem.caminho + '-shm'):
+                    if os.path.exists(arquivo):
+                        os.remove(arquivo)
+        resultado['por_shard'] = {indice: destino.contar() for indice, destino in enumerate(destinos)}
+        escrever_json_atomico(_arquivo_shards(caminho), {'shards': shards})
+    logger.info(f"Transações de {caminho} rebalanceadas de {resultado['anteriores']} para {shards} shards: "
+                f"{resultado['movidas']} movidas de {resultado['lidas']}")
+    return resultado
@@ -1,103 +1,451 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, stream_with_context, render_template, request, redirect, url_for, flash, jsonify, session, current_app
+from werkzeug.security import safe_join
 import os
 import json
 import uuid
+import math
+import hashlib
+import time
+from decimal import Decimal
 from datetime import datetime
 import logging
-import requests
-from utils.chaves_pix_manager import carregar_chaves_pix, adicionar_chave_pix, remover_chave_pix, salvar_transacao_pix, atualizar_transacao_pix
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.chaves_pix_manager import carregar_chaves_pix, versao_chaves_pix, obter_chave_pix, adicionar_chave_pix, remover_chave_pix, salvar_transacao_pix, salvar_transacoes_pix_lote, atualizar_transacao_pix, carregar_transacoes_pix, consultar_transacoes_pix, iterar_transacoes_pix, buscar_transacao_pix, obter_store_transacoes, TRANSACOES_DB, CHAVES_FILE, DATA_DIR
+from utils.fila_webhook import FilaWebhook, FilaCheia
+from utils.dedup import DeduplicadorWebhook, chave_deduplicacao, NOVA, DUPLICADA
+from utils.journal import JournalNotificacoes
+from utils.openpix_client import criar_cliente_openpix, CircuitoAberto
+from utils.brcode import gerar_payload, renderizar_qrcode, FORMATOS_QRCODE
+from utils.normalizador import normalizar
+from utils.log_estruturado import configurar_logging, CampoLimitado
+from utils.journal import resumir_payload
+from utils.exportacao import exportar, iterar_notificacoes, linha_notificacao, FORMATOS_EXPORTACAO, CAMPOS_TRANSACOES, CAMPOS_NOTIFICACOES
+from utils.transacoes_store import instante
+from utils.eventos import BarramentoEventos, formatar_sse
+from utils.expiracao import AgendadorExpiracao
+from utils.conversao import ConversorPagamentos, CacheCotacoes, criar_provedor, MOEDAS_SUPORTADAS
+from utils.armazenamento import Lideranca
+from utils import metricas
 from dotenv import load_dotenv
 
-# Carregar variáveis de ambiente
+# Carregar variáveis de ambiente (lidas pelas constantes de configuração abaixo)
 load_dotenv()
 
-# Configuração de logging
-logging.basicConfig(level=logging.INFO)
+# Configuração de logging (os handlers são instalados por create_app)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.secret_key = 'segredo_simples'  # Necessário para usar flash()
+SECRET_KEY = os.getenv('SECRET_KEY', 'segredo_simples')  # Necessário para usar flash()
 
-# Configuração da OpenPix (sandbox para testes)
-OPENPIX_API_KEY = os.getenv('OPENPIX_API_KEY')
-OPENPIX_API_URL = 'https://api.sandbox.openpix.com.br/openpix/v1'  # URL do sandbox
-OPENPIX_HEADERS = {
-    'Authorization': f'Bearer {OPENPIX_API_KEY}',
-    'Content-Type': 'application/json'
-}
-
-# Configurar sessão sem forçar versão SSL específica
-session = requests.Session()
-session.mount('https://', requests.adapters.HTTPAdapter(max_retries=3))
+# Cliente da OpenPix (sandbox por padrão; pool, timeouts e retentativas via variáveis OPENPIX_*)
+_openpix = None
+_openpix_pid = None
 
 # Logs de notificações Pix
-LOGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-os.makedirs(LOGS_DIR, exist_ok=True)
+LOGS_DIR = os.getenv('LOGS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs'))
+
+# Criação de cobranças em lote
+LOTE_MAX_ITENS = int(os.getenv('LOTE_MAX_ITENS', '1000'))
+LOTE_CONCORRENCIA = int(os.getenv('LOTE_CONCORRENCIA', '8'))
+LOTE_CONCORRENCIA_MAX = int(os.getenv('LOTE_CONCORRENCIA_MAX', '32'))
+
+# QR Codes estáticos gerados localmente (sem chamada à OpenPix)
+BRCODE_MAX_AGE = int(os.getenv('BRCODE_MAX_AGE', '86400'))
+
+# Cache HTTP: páginas renderizadas por versão do arquivo de chaves e arquivos de static/ versionados pelo conteúdo
+ESTATICOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ESTATICOS_MAX_AGE = int(os.getenv('ESTATICOS_MAX_AGE', str(365 * 24 * 3600)))
+
+_paginas = {}  # (template, script_root) -> (versão das chaves, corpo, etag)
+_hashes_estaticos = {}  # arquivo -> ((mtime, tamanho), hash)
+
+# Diário segmentado de notificações (substitui um arquivo JSON por notificação)
+JOURNAL_DIR = os.path.join(LOGS_DIR, 'journal')
+JOURNAL_SEGMENTO_BYTES = int(os.getenv('JOURNAL_SEGMENTO_BYTES', str(64 * 1024 * 1024)))
+JOURNAL_SEGMENTO_SEGUNDOS = int(os.getenv('JOURNAL_SEGMENTO_SEGUNDOS', str(24 * 3600)))
+JOURNAL_GZIP = os.getenv('JOURNAL_GZIP', '0') == '1'
+JOURNAL_ULTIMAS = int(os.getenv('JOURNAL_ULTIMAS', '100'))
+JOURNAL_INDICE_INTERVALO = float(os.getenv('JOURNAL_INDICE_INTERVALO', '5'))  # Intervalo entre checkpoints do índice
+
+_journal = None
+
+# Ingestão assíncrona: com WEBHOOK_ASYNC=1 o webhook só grava o corpo na fila e responde 202
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', '0') == '1'
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+WEBHOOK_FILA_CAPACIDADE = int(os.getenv('WEBHOOK_FILA_CAPACIDADE', '1000'))
+WEBHOOK_FILA_TENTATIVAS = int(os.getenv('WEBHOOK_FILA_TENTATIVAS', '5'))  # Depois disso, vai para DATA_DIR/fila/falhas
+WEBHOOK_FILA_ESPERA = float(os.getenv('WEBHOOK_FILA_ESPERA', '5'))  # Espera antes da 2ª tentativa; dobra a cada falha
+FILA_DIR = os.path.join(DATA_DIR, 'fila')
+
+# O payload bruto já fica no diário; só é repetido na resposta com WEBHOOK_INCLUIR_PAYLOAD=1
+WEBHOOK_INCLUIR_PAYLOAD = os.getenv('WEBHOOK_INCLUIR_PAYLOAD', '0') == '1'
+
+# Erro de processar_notificacao_pix que não adianta tentar de novo (eventos sem transação, como CHARGE_CREATED)
+FORMATO_DESCONHECIDO = 'Formato de payload desconhecido'
+
+_fila = None
+_fila_lock = threading.Lock()
+
+# Deduplicação de reentregas da OpenPix
+DEDUP_DB = os.path.join(DATA_DIR, 'dedup.db')
+DEDUP_CAPACIDADE = int(os.getenv('DEDUP_CAPACIDADE', '100000'))
+DEDUP_TTL = int(os.getenv('DEDUP_TTL', str(7 * 24 * 3600)))
+DEDUP_RESERVA = int(os.getenv('DEDUP_RESERVA', '300'))  # Validade da reserva de uma notificação em processamento
+
+_deduplicador = None
+
+# Consulta de transações
+TRANSACOES_LIMITE_PADRAO = int(os.getenv('TRANSACOES_LIMITE_PADRAO', '100'))
+TRANSACOES_LIMITE_MAX = int(os.getenv('TRANSACOES_LIMITE_MAX', '1000'))
+
+# Confirmação de pagamento em tempo real (SSE em /eventos/<txid>)
+EVENTOS_DB = os.path.join(DATA_DIR, 'eventos.db')
+EVENTOS_PONTE = os.getenv('EVENTOS_PONTE', '1') == '1'  # Ponte entre workers via SQLite
+EVENTOS_TIMEOUT = int(os.getenv('EVENTOS_TIMEOUT', '900'))  # Duração máxima de um stream SSE (ASGI)
+EVENTOS_LONGPOLL = int(os.getenv('EVENTOS_LONGPOLL', '25'))  # Espera máxima no Flask, que ocupa um worker
+eventos = BarramentoEventos(EVENTOS_DB if EVENTOS_PONTE else None)
+
+# Expiração de cobranças pendentes e reconciliação com a OpenPix, em um único worker eleito
+EXPIRACAO_ATIVA = os.getenv('EXPIRACAO_ATIVA', '1') == '1'
+EXPIRACAO_SEGUNDOS = int(os.getenv('EXPIRACAO_SEGUNDOS', '900'))  # Também enviado à OpenPix como expiresIn
+EXPIRACAO_RECONCILIAR_APOS = int(os.getenv('EXPIRACAO_RECONCILIAR_APOS', '120'))
+EXPIRACAO_RECONCILIAR_INTERVALO = int(os.getenv('EXPIRACAO_RECONCILIAR_INTERVALO', '300'))
+EXPIRACAO_TOLERANCIA = int(os.getenv('EXPIRACAO_TOLERANCIA', '60'))
+EXPIRACAO_LOTE = int(os.getenv('EXPIRACAO_LOTE', '100'))
+EXPIRACAO_TAXA = float(os.getenv('EXPIRACAO_TAXA', '5'))  # Consultas por segundo à OpenPix
+EXPIRACAO_CONCORRENCIA = int(os.getenv('EXPIRACAO_CONCORRENCIA', '4'))
+
+_agendador = None
+
+# Conversão dos pagamentos confirmados para a moeda escolhida (provedor em COTACAO_PROVEDOR, ver utils/conversao.py)
+CONVERSAO_ATIVA = os.getenv('CONVERSAO_ATIVA', '1') == '1'
+CONVERSAO_JANELA = float(os.getenv('CONVERSAO_JANELA', '0.2'))  # Espera para agrupar confirmações em um lote
+CONVERSAO_LOTE = int(os.getenv('CONVERSAO_LOTE', '500'))
+CONVERSAO_VARREDURA = int(os.getenv('CONVERSAO_VARREDURA', '60'))
+COTACAO_TTL = int(os.getenv('COTACAO_TTL', '60'))
+
+_conversor = None
+
+# Métricas do pipeline, agregadas entre os workers em DATA_DIR/metricas e expostas em /metrics
+METRICAS_DIR = os.path.join(DATA_DIR, 'metricas')
+ETAPA_WEBHOOK = metricas.histograma('pix_webhook_etapa_segundos', 'Duração de cada etapa do processamento de webhooks', ('etapa',))
+NOTIFICACOES = metricas.contador('pix_webhook_notificacoes_total', 'Notificações recebidas por evento, status e resultado',
+                                 ('evento', 'status', 'resultado'))
+ETAPA_COBRANCA = metricas.histograma('pix_cobranca_etapa_segundos', 'Duração de cada etapa da criação de cobranças', ('etapa',))
+COBRANCAS = metricas.contador('pix_cobrancas_total', 'Cobranças solicitadas por resultado', ('resultado',))
+metricas.medidor('pix_armazenamento_bytes', 'Tamanho em disco de cada armazenamento', lambda: {
+    'transacoes': metricas.tamanho_arquivos(*obter_store_transacoes().arquivos()),
+    'chaves': metricas.tamanho_arquivos(CHAVES_FILE),
+    'dedup': metricas.tamanho_arquivos(DEDUP_DB, DEDUP_DB + '-wal'),
+    'diario': metricas.tamanho_diretorio(JOURNAL_DIR),
+    'fila': metricas.tamanho_diretorio(os.path.join(FILA_DIR, 'pendentes')),
+}, rotulo='armazenamento')
+metricas.medidor('pix_webhook_fila_pendentes', 'Notificações aguardando processamento na fila em disco',
+                 lambda: len(os.listdir(os.path.join(FILA_DIR, 'pendentes'))) if os.path.isdir(os.path.join(FILA_DIR, 'pendentes')) else 0)
+
+# Rotas registradas em cada app criado por create_app
+_ROTAS = []
+
+def rota(regra, **opcoes):
+    """Equivalente a `@app.route`, mas adiado: create_app registra a rota no app que criar."""
+    def decorador(funcao):
+        _ROTAS.append((regra, funcao, opcoes))
+        return funcao
+    return decorador
+
+def create_app(aquecer=True):
+    """Cria o app Flask com todas as rotas.
+
+    Só configura logging, diretórios e métricas. Cliente HTTP, bancos SQLite, fila e
+    agendador são criados no primeiro uso, por processo. Por isso o app pode ser
+    carregado no processo mestre do gunicorn (`preload_app`) e compartilhado por
+    copy-on-write entre os workers. Com `aquecer`, os templates já são compilados
+    no mestre.
+    """
+    configurar_logging()
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    metricas.registro.configurar(METRICAS_DIR)
+
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+    for regra, funcao, opcoes in _ROTAS:
+        app.add_url_rule(regra, view_func=funcao, **opcoes)
+    app.before_request(iniciar_agendador)
+    app.before_request(iniciar_conversor)
+    app.url_defaults(versionar_estatico)
+    app.view_functions['static'] = servir_estatico
+    if aquecer:
+        for template in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(template)
+        for raiz, _, arquivos in os.walk(ESTATICOS_DIR):
+            for arquivo in arquivos:
+                hash_estatico(os.path.relpath(os.path.join(raiz, arquivo), ESTATICOS_DIR).replace(os.sep, '/'))
+    return app
+
+def __getattr__(nome):
+    """`webhook_pix.app`: app padrão, criado no primeiro acesso (ex.: `gunicorn webhook_pix:app`)."""
+    global app
+    if nome == 'app':
+        with _fila_lock:
+            if 'app' not in globals():
+                app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
+def obter_openpix():
+    """Cliente da OpenPix deste processo: a sessão HTTP e seu pool não são compartilhados após um fork."""
+    global _openpix, _openpix_pid
+    if _openpix is None or _openpix_pid != os.getpid():
+        with _fila_lock:
+            if _openpix is None or _openpix_pid != os.getpid():
+                _openpix = criar_cliente_openpix()
+                _openpix_pid = os.getpid()
+    return _openpix
+
+def obter_journal():
+    global _journal
+    if _journal is None:
+        with _fila_lock:
+            if _journal is None:
+                _journal = JournalNotificacoes(JOURNAL_DIR, max_bytes=JOURNAL_SEGMENTO_BYTES,
+                                               max_segundos=JOURNAL_SEGMENTO_SEGUNDOS,
+                                               gzip_fechados=JOURNAL_GZIP, num_ultimas=JOURNAL_ULTIMAS,
+                                               legado_dir=LOGS_DIR, intervalo_indice=JOURNAL_INDICE_INTERVALO)
+    return _journal
+
+def obter_deduplicador():
+    global _deduplicador
+    if _deduplicador is None:
+        with _fila_lock:
+            if _deduplicador is None:
+                _deduplicador = DeduplicadorWebhook(DEDUP_DB, capacidade=DEDUP_CAPACIDADE, ttl=DEDUP_TTL,
+                                                    reserva=DEDUP_RESERVA)
+    return _deduplicador
+
+def obter_fila():
+    """Cria a fila (e seus workers) no primeiro uso, já dentro do worker do gunicorn."""
+    global _fila
+    if _fila is None:
+        with _fila_lock:
+            if _fila is None:
+                fila = FilaWebhook(FILA_DIR, processar_corpo_webhook,
+                                   workers=WEBHOOK_WORKERS, capacidade=WEBHOOK_FILA_CAPACIDADE,
+                                   tentativas=WEBHOOK_FILA_TENTATIVAS, espera=WEBHOOK_FILA_ESPERA)
+                fila.iniciar()
+                atexit.register(fila.drenar)
+                _fila = fila
+    return _fila
+
+def obter_agendador():
+    """Cria o agendador de expiração no primeiro uso, já dentro do worker do gunicorn.
+
+    Todos os workers iniciam o agendador, mas só o que obtém o bloqueio em
+    DATA_DIR/expiracao.lock trabalha; se ele morrer, outro assume.
+    """
+    global _agendador
+    if _agendador is None:
+        with _fila_lock:
+            if _agendador is None:
+                consultar = None
+                if os.getenv('OPENPIX_API_KEY'):
+                    consultar = lambda txid: obter_openpix().consultar_cobranca(txid)['charge']
+                agendador = AgendadorExpiracao(
+                    obter_store_transacoes(), consultar=consultar, ao_alterar=publicar_alteracao,
+                    lideranca=Lideranca(os.path.join(DATA_DIR, 'expiracao')), expiracao=EXPIRACAO_SEGUNDOS,
+                    reconciliar_apos=EXPIRACAO_RECONCILIAR_APOS, reconciliar_intervalo=EXPIRACAO_RECONCILIAR_INTERVALO,
+                    tolerancia=EXPIRACAO_TOLERANCIA, lote=EXPIRACAO_LOTE, taxa=EXPIRACAO_TAXA,
+                    concorrencia=EXPIRACAO_CONCORRENCIA
+                )
+                atexit.register(agendador.parar)
+                _agendador = agendador
+    _agendador.iniciar()
+    return _agendador
+
+def iniciar_agendador():
+    if EXPIRACAO_ATIVA:
+        obter_agendador()
+
+def obter_conversor():
+    """Cria o conversor de pagamentos no primeiro uso, já dentro do worker do gunicorn.
+
+    Cada worker converte as confirmações que recebe; a varredura das que ficaram
+    sem conversão roda só no worker que obtém o bloqueio em DATA_DIR/conversao.lock.
+    """
+    global _conversor
+    if _conversor is None:
+        with _fila_lock:
+            if _conversor is None:
+                conversor = ConversorPagamentos(
+                    obter_store_transacoes(), CacheCotacoes(criar_provedor(), ttl=COTACAO_TTL),
+                    ao_converter=publicar_alteracao, lideranca=Lideranca(os.path.join(DATA_DIR, 'conversao')),
+                    janela=CONVERSAO_JANELA, lote=CONVERSAO_LOTE, intervalo_varredura=CONVERSAO_VARREDURA
+                )
+                atexit.register(conversor.parar)
+                _conversor = conversor
+    _conversor.iniciar()
+    return _conversor
+
+def iniciar_conversor():
+    if CONVERSAO_ATIVA:
+        obter_conversor()
+
+def encaminhar_conversao(transacao):
+    """Agenda a conversão de uma transação que acabou de ser concluída."""
+    if CONVERSAO_ATIVA and transacao.get('status') == 'CONCLUIDA':
+        try:
+            obter_conversor().enfileirar(transacao)
+        except Exception as e:
+            logger.error(f"Erro ao agendar a conversão de {transacao.get('txid')}: {str(e)}")
+
+def hash_estatico(arquivo):
+    """Hash curto do conteúdo de um arquivo de static/, recalculado só quando o arquivo muda."""
+    caminho = safe_join(ESTATICOS_DIR, arquivo)
+    try:
+        st = os.stat(caminho) if caminho else None
+    except OSError:
+        return None
+    if st is None or not os.path.isfile(caminho):
+        return None
+    versao = (st.st_mtime_ns, st.st_size)
+    item = _hashes_estaticos.get(arquivo)
+    if item is None or item[0] != versao:
+        with open(caminho, 'rb') as f:
+            item = (versao, hashlib.sha256(f.read()).hexdigest()[:12])
+        _hashes_estaticos[arquivo] = item
+    return item[1]
+
+def versionar_estatico(endpoint, valores):
+    """`url_for('static', ...)` ganha `?v=<hash do conteúdo>`: a URL muda junto com o arquivo."""
+    if endpoint == 'static' and 'filename' in valores and 'v' not in valores:
+        versao = hash_estatico(valores['filename'])
+        if versao:
+            valores['v'] = versao
+
+def servir_estatico(filename):
+    """Serve static/. Com `?v` igual ao hash atual, o navegador guarda o arquivo por ESTATICOS_MAX_AGE sem revalidar."""
+    resposta = current_app.send_static_file(filename)
+    versao = request.args.get('v')
+    if versao and versao == hash_estatico(filename):
+        resposta.headers['Cache-Control'] = f'public, max-age={ESTATICOS_MAX_AGE}, immutable'
+    return resposta
+
+def renderizar_pagina_chaves(template):
+    """Renderiza uma página que só depende das chaves Pix, com ETag forte e 304.
+
+    O corpo e o ETag ficam em memória até o arquivo de chaves mudar (versao_chaves_pix),
+    então repetir a página não relê o JSON nem renderiza o template. Com mensagens flash
+    pendentes na sessão, a página é renderizada na hora e fica fora do cache.
+    """
+    if '_flashes' in session:
+        resposta = Response(render_template(template, chaves=carregar_chaves_pix()), mimetype='text/html')
+        resposta.headers['Cache-Control'] = 'no-store'
+        return resposta
+    chave = (template, request.script_root)
+    versao = versao_chaves_pix()
+    item = _paginas.get(chave)
+    if item is None or versao is None or item[0] != versao:
+        chaves_pix = carregar_chaves_pix()
+        logger.debug("Chaves Pix carregadas para %s: %d", template, len(chaves_pix))
+        corpo = render_template(template, chaves=chaves_pix).encode('utf-8')
+        item = (versao, corpo, hashlib.sha256(corpo).hexdigest())
+        # Só guarda se o arquivo não mudou durante a renderização (ou foi criado com as chaves padrão)
+        if versao is not None and versao_chaves_pix() == versao:
+            _paginas[chave] = item
+    if request.if_none_match.contains(item[2]):
+        resposta = Response(status=304)
+    else:
+        resposta = Response(item[1], mimetype='text/html')
+    resposta.set_etag(item[2])
+    resposta.headers['Cache-Control'] = 'no-cache'  # Sempre revalida; sem mudança, a resposta é um 304 vazio
+    return resposta
 
 # ROTAS DO FRONT-END
-@app.route('/')
+@rota('/')
 def index():
-    chaves_pix = carregar_chaves_pix()
-    logger.info(f"Chaves Pix carregadas para a página inicial: {json.dumps(chaves_pix, indent=4)}")
-    return render_template('index.html', chaves=chaves_pix)
+    return renderizar_pagina_chaves('index.html')
 
-@app.route('/gerar_qrcode', methods=['POST'])
+@rota('/gerar_qrcode', methods=['POST'])
 def gerar_qrcode():
-    valor = request.form.get('valor')
-    chave_id = request.form.get('chave_pix_id')
-    moeda = request.form.get('moeda')
-
-    chaves_pix = carregar_chaves_pix()
-    chave_pix = next((ch for ch in chaves_pix if ch['id'] == chave_id), None)
-
-    if not chave_pix:
-        flash("Chave Pix não encontrada.")
+    try:
+        chave_pix, valor_float, payload = preparar_cobranca(request.form.get('valor'), request.form.get('chave_pix_id'),
+                                                            request.form.get('moeda'))
+    except ValueError as e:
+        flash(str(e))
         return redirect(url_for('index'))
 
     try:
-        # Validar valor
-        valor_float = float(valor.replace(',', '.'))
-        if valor_float <= 0:
-            flash("O valor deve ser maior que zero.")
-            return redirect(url_for('index'))
-
-        # Criar cobrança Pix na OpenPix
-        payload = {
-            'value': int(valor_float * 100),  # OpenPix usa centavos
-            'correlationID': str(uuid.uuid4()),
-            'destination': {
-                'pixKey': chave_pix['chave'],
-                'type': chave_pix['tipo_chave']
-            },
-            'comment': f"Pagamento de R${valor_float:.2f} para {chave_pix['descricao']}"
-        }
-        logger.info(f"Payload enviado para OpenPix: {json.dumps(payload, indent=4)}")
-        response = session.post(f'{OPENPIX_API_URL}/charge', headers=OPENPIX_HEADERS, json=payload, timeout=10)
-        response.raise_for_status()
-        charge = response.json()
-
-        # Salvar transação
-        transacao = salvar_transacao_pix(valor_float, moeda, chave_id, charge['charge']['correlationID'])
-
-        return render_template('qrcode.html',
-                             valor=valor_float,
-                             chave=chave_pix['chave'],
-                             moeda=moeda,
-                             txid=charge['charge']['correlationID'],
-                             payload=charge['charge']['brCode'],
-                             qrcode_url=charge['charge']['qrCodeImage'])
+        with ETAPA_COBRANCA.cronometrar(etapa='openpix'):
+            charge = obter_openpix().criar_cobranca(payload)
+        contexto = concluir_cobranca(valor_float, chave_pix, request.form.get('moeda'), charge)
+        COBRANCAS.inc(resultado='criada')
+        return render_template('qrcode.html', **contexto)
+    except CircuitoAberto:
+        COBRANCAS.inc(resultado='circuito_aberto')
+        logger.warning("Cobrança recusada: circuit breaker da OpenPix aberto")
+        flash("OpenPix temporariamente indisponível. Tente novamente em alguns instantes.")
+        return redirect(url_for('index'))
     except Exception as e:
+        COBRANCAS.inc(resultado='erro')
         logger.error(f"Erro ao gerar QR Code: {str(e)}")
         flash(f"Erro ao gerar QR Code: {str(e)}")
         return redirect(url_for('index'))
 
-@app.route('/chaves')
+@rota('/api/cobrancas/lote', methods=['POST'])
+def gerar_cobrancas_lote():
+    """Cria várias cobranças em paralelo e devolve os resultados em NDJSON, na ordem em que ficam prontos."""
+    dados = request.get_json(silent=True)
+    itens = dados.get('cobrancas') if isinstance(dados, dict) else dados
+    if not isinstance(itens, list) or not itens:
+        return jsonify({'status': 'error', 'message': 'Envie uma lista de cobranças {valor, chave_pix_id, moeda}'}), 400
+    if len(itens) > LOTE_MAX_ITENS:
+        return jsonify({'status': 'error', 'message': f'Máximo de {LOTE_MAX_ITENS} cobranças por lote'}), 413
+    concorrencia = request.args.get('concorrencia')
+    if concorrencia is None and isinstance(dados, dict):
+        concorrencia = dados.get('concorrencia')
+    try:
+        concorrencia = max(1, min(int(concorrencia or LOTE_CONCORRENCIA), LOTE_CONCORRENCIA_MAX))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'concorrencia deve ser um número inteiro'}), 400
+    linhas = (json.dumps(resultado, ensure_ascii=False) + '\n' for resultado in criar_cobrancas_lote(itens, concorrencia))
+    return Response(stream_with_context(linhas), mimetype='application/x-ndjson')
+
+@rota('/qrcode/estatico/<chave_id>.<formato>')
+def qrcode_estatico(chave_id, formato):
+    """QR Code estático de uma chave cadastrada, gerado localmente (png, svg ou txt para o copia e cola)."""
+    chave_pix = obter_chave_pix(chave_id)
+    if not chave_pix or (formato not in FORMATOS_QRCODE and formato != 'txt'):
+        return jsonify({'status': 'error', 'message': 'QR Code não encontrado'}), 404
+    valor = request.args.get('valor')
+    try:
+        valor = round(float(valor.replace(',', '.')), 2) if valor else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': f'Valor inválido: {valor}'}), 400
+    if valor is not None and not math.isfinite(valor):
+        return jsonify({'status': 'error', 'message': f'Valor inválido: {request.args.get("valor")}'}), 400
+    if valor is not None and valor <= 0:
+        return jsonify({'status': 'error', 'message': 'O valor deve ser maior que zero.'}), 400
+    try:
+        payload = gerar_payload(chave_pix['tipo_chave'], chave_pix['chave'], valor, request.args.get('descricao', ''))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Não foi possível gerar o BR Code: {str(e)}'}), 422
+
+    etag = hashlib.sha1(f"{formato}:{payload}".encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        resposta = Response(status=304)
+    elif formato == 'txt':
+        resposta = Response(payload, mimetype='text/plain')
+    else:
+        resposta = Response(renderizar_qrcode(payload, formato), mimetype=FORMATOS_QRCODE[formato])
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = f'public, max-age={BRCODE_MAX_AGE}'
+    return resposta
+
+@rota('/chaves')
 def listar_chaves():
-    chaves_pix = carregar_chaves_pix()
-    logger.info(f"Chaves Pix carregadas para a lista: {json.dumps(chaves_pix, indent=4)}")
-    return render_template('chaves_pix.html', chaves=chaves_pix)
+    return renderizar_pagina_chaves('chaves_pix.html')
 
-@app.route('/adicionar', methods=['GET', 'POST'])
+@rota('/adicionar', methods=['GET', 'POST'])
 def adicionar_chave_pix_route():
     if request.method == 'POST':
         descricao = request.form.get('descricao')
@@ -115,7 +463,7 @@ def adicionar_chave_pix_route():
         return redirect(url_for('listar_chaves'))
     return render_template('adicionar_chave_pix.html')
 
-@app.route('/remover/<chave_id>', methods=['POST'])
+@rota('/remover/<chave_id>', methods=['POST'])
 def remover_chave(chave_id):
     sucesso = remover_chave_pix(chave_id)
     if sucesso:
@@ -125,40 +473,86 @@ def remover_chave(chave_id):
     return redirect(url_for('listar_chaves'))
 
 # ROTAS PARA WEBHOOK PIX
-@app.route('/webhook/pix', methods=['POST'])
+@rota('/webhook/pix', methods=['POST'])
 def webhook_pix():
-    try:
-        payload = request.json
-        logger.info(f"Notificação Pix recebida: {json.dumps(payload, indent=4)}")
-        log_path = salvar_notificacao(payload)
-        logger.info(f"Notificação salva em: {log_path}")
-        resultado = processar_notificacao_pix(payload)
-        return jsonify({
-            'status': 'success',
-            'message': 'Notificação recebida com sucesso',
-            'processamento': resultado
-        }), 200
-    except Exception as e:
-        logger.error(f"Erro ao processar webhook: {str(e)}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    resposta, status, headers = receber_notificacao(request.get_data())
+    return jsonify(resposta), status, headers
+
+@rota('/webhook/pix/fila', methods=['GET'])
+def webhook_fila():
+    if not WEBHOOK_ASYNC:
+        return jsonify({'status': 'disabled', 'message': 'Ingestão assíncrona desativada (WEBHOOK_ASYNC=0)'}), 200
+    return jsonify(obter_fila().metricas()), 200
 
-@app.route('/webhook/pix/status', methods=['GET'])
+@rota('/webhook/pix/status', methods=['GET'])
 def webhook_status():
-    try:
-        arquivos = os.listdir(LOGS_DIR)
-        arquivos.sort(reverse=True)
-        ultimas_notificacoes = arquivos[:10]
-        return jsonify({
-            'status': 'online',
-            'message': 'Serviço de webhook Pix está ativo',
-            'ultimas_notificacoes': ultimas_notificacoes,
-            'total_notificacoes': len(arquivos)
-        }), 200
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    resposta, status = montar_status(request.args.get('since', type=int), request.args.get('limit', 10, type=int))
+    return jsonify(resposta), status
+
 
 # ROTAS DE DEPURAÇÃO
-@app.route('/debug/chaves')
+@rota('/transacoes', methods=['GET'])
+def listar_transacoes():
+    """Consulta transações por status, chave_id, moeda e período (desde/ate), paginando por cursor."""
+    limite = request.args.get('limite', TRANSACOES_LIMITE_PADRAO, type=int)
+    if limite < 1 or limite > TRANSACOES_LIMITE_MAX:
+        return jsonify({'status': 'error', 'message': f'limite deve estar entre 1 e {TRANSACOES_LIMITE_MAX}'}), 400
+    try:
+        transacoes, proximo_cursor = consultar_transacoes_pix(
+            status=request.args.get('status'),
+            chave_id=request.args.get('chave_id'),
+            moeda=request.args.get('moeda'),
+            desde=request.args.get('desde'),
+            ate=request.args.get('ate'),
+            limite=limite,
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'transacoes': transacoes, 'quantidade': len(transacoes), 'proximo_cursor': proximo_cursor})
+
+@rota('/exportar/transacoes.<formato>', methods=['GET'])
+def exportar_transacoes(formato):
+    """Exporta as transações em CSV ou JSONL, em streaming (?gzip=1, desde, ate, status, chave_id, moeda)."""
+    filtros = {campo: request.args.get(campo) for campo in ('status', 'chave_id', 'moeda', 'desde', 'ate')}
+    return resposta_exportacao('transacoes', formato, filtros,
+                               lambda: iterar_transacoes_pix(**filtros), CAMPOS_TRANSACOES)
+
+@rota('/exportar/notificacoes.<formato>', methods=['GET'])
+def exportar_notificacoes(formato):
+    """Exporta as notificações do diário em CSV ou JSONL, em streaming (?gzip=1, desde, ate)."""
+    filtros = {campo: request.args.get(campo) for campo in ('desde', 'ate')}
+
+    def registros():
+        entradas = iterar_notificacoes(obter_journal(), **filtros)
+        return (linha_notificacao(e) for e in entradas) if formato == 'csv' else entradas
+
+    return resposta_exportacao('notificacoes', formato, filtros, registros, CAMPOS_NOTIFICACOES)
+
+@rota('/eventos/<txid>', methods=['GET'])
+def eventos_pagamento(txid):
+    """Aguarda a confirmação do pagamento por até EVENTOS_LONGPOLL segundos.
+
+    Com `Accept: text/event-stream` responde em SSE e encerra; o EventSource do navegador
+    reconecta sozinho. Sem ele, responde JSON (long-poll). Para milhares de conexões
+    abertas, sirva esta rota pelo asgi_pix, que mantém o stream sem ocupar um worker.
+    """
+    espera = min(request.args.get('espera', EVENTOS_LONGPOLL, type=int), EVENTOS_LONGPOLL)
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        def gerar():
+            yield 'retry: 1000\n\n'
+            evento = eventos.aguardar(txid, espera, verificar=lambda: estado_pagamento(txid))
+            yield formatar_sse(evento) if evento else ': sem eventos\n\n'
+        return Response(stream_with_context(gerar()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    evento = eventos.aguardar(txid, espera, verificar=lambda: estado_pagamento(txid))
+    return jsonify(evento or {'txid': txid, 'status': 'PENDENTE'})
+
+@rota('/metrics', methods=['GET'])
+def metrics():
+    return Response(metricas.registro.exportar(), mimetype='text/plain; version=0.0.4')
+
+@rota('/debug/chaves')
 def debug_chaves_route():
     try:
         with open('/tmp/chaves_pix.json', 'r', encoding='utf-8') as f:
@@ -169,18 +563,16 @@ def debug_chaves_route():
         logger.error(f"Erro ao ler /tmp/chaves_pix.json: {str(e)}")
         return f"Erro ao ler /tmp/chaves_pix.json: {str(e)}"
 
-@app.route('/debug/transacoes')
+@rota('/debug/transacoes')
 def debug_transacoes_route():
     try:
-        with open('/tmp/transacoes_pix.json', 'r', encoding='utf-8') as f:
-            content = f.read()
-        logger.info(f"Conteúdo de /tmp/transacoes_pix.json: {content}")
-        return f"Conteúdo de /tmp/transacoes_pix.json:<pre>{content}</pre>"
+        content = json.dumps(carregar_transacoes_pix(), indent=4, ensure_ascii=False)
+        return f"Conteúdo de {TRANSACOES_DB}:<pre>{content}</pre>"
     except Exception as e:
-        logger.error(f"Erro ao ler /tmp/transacoes_pix.json: {str(e)}")
-        return f"Erro ao ler /tmp/transacoes_pix.json: {str(e)}"
+        logger.error(f"Erro ao ler {TRANSACOES_DB}: {str(e)}")
+        return f"Erro ao ler {TRANSACOES_DB}: {str(e)}"
 
-@app.route('/test_write')
+@rota('/test_write')
 def test_write_route():
     test_file = '/tmp/test_write.txt'
     try:
@@ -193,66 +585,369 @@ def test_write_route():
         return f"Erro ao escrever em {test_file}: {str(e)}"
 
 # FUNÇÕES AUXILIARES
+# As funções abaixo não dependem do Flask e também são usadas pelo app assíncrono (asgi_pix.py)
+def preparar_cobranca(valor, chave_id, moeda):
+    """Valida o formulário e monta o payload da cobrança. Levanta ValueError com a mensagem para o usuário."""
+    chave_pix = obter_chave_pix(chave_id)
+    if not chave_pix:
+        raise ValueError("Chave Pix não encontrada.")
+    try:
+        valor_float = float(valor.replace(',', '.'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Erro ao gerar QR Code: valor inválido: {valor}")
+    if not math.isfinite(valor_float):
+        raise ValueError(f"Erro ao gerar QR Code: valor inválido: {valor}")
+    if valor_float <= 0:
+        raise ValueError("O valor deve ser maior que zero.")
+    if moeda not in MOEDAS_SUPORTADAS:
+        raise ValueError(f"Moeda não suportada: {moeda}. Use {', '.join(sorted(MOEDAS_SUPORTADAS))}.")
+
+    # Criar cobrança Pix na OpenPix
+    payload = {
+        'value': int(Decimal(str(valor_float)) * 100),  # OpenPix usa centavos; Decimal não estoura com valores enormes
+        'correlationID': str(uuid.uuid4()),
+        'expiresIn': EXPIRACAO_SEGUNDOS,
+        'destination': {
+            'pixKey': chave_pix['chave'],
+            'type': chave_pix['tipo_chave']
+        },
+        'comment': f"Pagamento de R${valor_float:.2f} para {chave_pix['descricao']}"
+    }
+    logger.info("Payload enviado para OpenPix: %s", CampoLimitado(payload), extra={'amostra': 'cobranca'})
+    return chave_pix, valor_float, payload
+
+def concluir_cobranca(valor_float, chave_pix, moeda, charge):
+    """Salva a transação da cobrança criada e retorna o contexto do template qrcode.html."""
+    with ETAPA_COBRANCA.cronometrar(etapa='salvar_transacao'):
+        salvar_transacao_pix(valor_float, moeda, chave_pix['id'], charge['charge']['correlationID'])
+    return {
+        'valor': valor_float,
+        'chave': chave_pix['chave'],
+        'moeda': moeda,
+        'txid': charge['charge']['correlationID'],
+        'payload': charge['charge']['brCode'],
+        'qrcode_url': charge['charge']['qrCodeImage'],
+        'expiracao': EXPIRACAO_SEGUNDOS
+    }
+
+def criar_cobrancas_lote(itens, concorrencia):
+    """Gerador que cria as cobranças com até `concorrencia` chamadas simultâneas à OpenPix.
+
+    Produz um resultado por item assim que a cobrança fica pronta e, ao final, persiste
+    todas as transações criadas em uma única escrita (também se o cliente desconectar).
+    """
+    criadas = []
+    salvas = None
+    futuros = {}
+    entregues = set()
+    executor = ThreadPoolExecutor(max_workers=concorrencia)
+    try:
+        for indice, item in enumerate(itens):
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Cada cobrança deve ser um objeto {valor, chave_pix_id, moeda}")
+                chave_pix, valor_float, payload = preparar_cobranca(str(item.get('valor')), item.get('chave_pix_id'), item.get('moeda'))
+            except Exception as e:
+                # Qualquer item inválido vira uma linha de erro, sem interromper o stream
+                COBRANCAS.inc(resultado='invalida')
+                yield {'indice': indice, 'status': 'erro', 'erro': str(e)}
+                continue
+            futuros[executor.submit(obter_openpix().criar_cobranca, payload)] = (indice, item.get('moeda'), chave_pix, valor_float)
+        for futuro in as_completed(futuros):
+            entregues.add(futuro)
+            indice, moeda, chave_pix, valor_float = futuros[futuro]
+            try:
+                charge = futuro.result()['charge']
+            except Exception as e:
+                logger.error(f"Erro ao criar cobrança {indice} do lote: {str(e)}")
+                COBRANCAS.inc(resultado='erro')
+                yield {'indice': indice, 'status': 'erro', 'erro': str(e)}
+                continue
+            criadas.append({'valor': valor_float, 'moeda': moeda, 'chave_id': chave_pix['id'], 'txid': charge['correlationID']})
+            yield {
+                'indice': indice,
+                'status': 'ok',
+                'txid': charge['correlationID'],
+                'brCode': charge['brCode'],
+                'qrCodeImage': charge['qrCodeImage']
+            }
+    finally:
+        # Se o cliente desconectar, as chamadas que ainda não começaram são canceladas. As que já
+        # estavam na OpenPix terminam, e as cobranças criadas por elas também são gravadas.
+        executor.shutdown(wait=True, cancel_futures=True)
+        for futuro, (indice, moeda, chave_pix, valor_float) in futuros.items():
+            if futuro in entregues or futuro.cancelled() or futuro.exception() is not None:
+                continue
+            try:
+                charge = futuro.result()['charge']
+            except (KeyError, TypeError):
+                continue
+            criadas.append({'valor': valor_float, 'moeda': moeda, 'chave_id': chave_pix['id'], 'txid': charge['correlationID']})
+        if criadas:
+            with ETAPA_COBRANCA.cronometrar(etapa='salvar_lote'):
+                salvas = salvar_transacoes_pix_lote(criadas)
+        COBRANCAS.inc(len(criadas), resultado='criada')
+    yield {'resumo': {
+        'total': len(itens),
+        'criadas': len(criadas),
+        'falhas': len(itens) - len(criadas),
+        'persistidas': len(salvas) if salvas else 0
+    }}
+
+def evento_pagamento(transacao):
+    evento = {
+        'txid': transacao['txid'],
+        'status': transacao['status'],
+        'valor': transacao.get('valor'),
+        'moeda': transacao.get('moeda')
+    }
+    if transacao.get('conversao'):
+        evento['conversao'] = transacao['conversao']
+    return evento
+
+def publicar_alteracao(transacao):
+    """Avisa a página do QR Code quando o agendador conclui ou expira a transação, ou quando ela é convertida."""
+    eventos.publicar(transacao['txid'], evento_pagamento(transacao))
+    if not transacao.get('conversao'):
+        encaminhar_conversao(transacao)
+
+def estado_pagamento(txid):
+    """Evento de pagamento se a transação já foi concluída ou expirada (para quem assina depois)."""
+    transacao = buscar_transacao_pix(txid)
+    if transacao and transacao.get('status') in ('CONCLUIDA', 'EXPIRADA'):
+        return evento_pagamento(transacao)
+    return None
+
+def resposta_exportacao(nome, formato, filtros, registros, campos):
+    """Valida os parâmetros antes de abrir o stream, pois depois o status HTTP já foi enviado."""
+    if formato not in FORMATOS_EXPORTACAO:
+        return jsonify({'status': 'error', 'message': f"Formato deve ser {' ou '.join(FORMATOS_EXPORTACAO)}"}), 404
+    try:
+        instante(filtros.get('desde'))
+        instante(filtros.get('ate'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    compactado = request.args.get('gzip') == '1'
+    arquivo = f"{nome}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}" + ('.gz' if compactado else '')
+    return Response(
+        stream_with_context(exportar(registros(), formato, campos, gzip_saida=compactado)),
+        mimetype='application/gzip' if compactado else FORMATOS_EXPORTACAO[formato],
+        headers={'Content-Disposition': f'attachment; filename="{arquivo}"'}
+    )
+
+def receber_notificacao(corpo):
+    """Trata o corpo bruto de um webhook. Retorna (resposta, status HTTP, cabeçalhos)."""
+    inicio = time.perf_counter()
+    try:
+        with ETAPA_WEBHOOK.cronometrar(etapa='parse'):
+            payload = json.loads(corpo)
+    except ValueError:
+        NOTIFICACOES.inc(evento='', status='', resultado='invalida')
+        return {'status': 'error', 'message': 'Payload JSON inválido'}, 400, {}
+    evento, status = resumir_payload(payload)
+    with ETAPA_WEBHOOK.cronometrar(etapa='dedup'):
+        chave = chave_deduplicacao(payload)
+        try:
+            reserva = obter_deduplicador().reservar(chave) if chave else NOVA
+        except Exception as e:
+            logger.error(f"Erro ao reservar chave de deduplicação: {str(e)}")
+            NOTIFICACOES.inc(evento=evento, status=status, resultado='erro')
+            return {'status': 'error', 'message': str(e)}, 500, {}
+    if reserva == DUPLICADA:
+        NOTIFICACOES.inc(evento=evento, status=status, resultado='duplicada')
+        return {'status': 'success', 'message': 'Notificação duplicada ignorada', 'duplicada': True}, 200, {}
+    if reserva != NOVA:
+        # Outra entrega da mesma notificação ainda está em processamento; a OpenPix reenvia depois
+        NOTIFICACOES.inc(evento=evento, status=status, resultado='em_andamento')
+        return {'status': 'error', 'message': 'Notificação em processamento, tente novamente'}, 409, {'Retry-After': '30'}
+
+    if WEBHOOK_ASYNC:
+        try:
+            # O diário é gravado uma única vez, no aceite; as novas tentativas da fila só processam
+            registrar_notificacao(payload)
+            with ETAPA_WEBHOOK.cronometrar(etapa='enfileirar'):
+                notificacao_id = obter_fila().enfileirar(corpo)
+        except FilaCheia as e:
+            liberar_deduplicacao(chave)
+            NOTIFICACOES.inc(evento=evento, status=status, resultado='fila_cheia')
+            logger.warning(f"Notificação recusada: {str(e)}")
+            return {'status': 'error', 'message': 'Fila de notificações cheia, tente novamente'}, 503, {'Retry-After': '5'}
+        except Exception as e:
+            liberar_deduplicacao(chave)
+            NOTIFICACOES.inc(evento=evento, status=status, resultado='erro')
+            logger.error(f"Erro ao registrar ou enfileirar webhook: {str(e)}")
+            return {'status': 'error', 'message': str(e)}, 500, {}
+        NOTIFICACOES.inc(evento=evento, status=status, resultado='enfileirada')
+        ETAPA_WEBHOOK.observar(time.perf_counter() - inicio, etapa='total')
+        return {
+            'status': 'accepted',
+            'message': 'Notificação recebida, processamento em andamento',
+            'notificacao_id': notificacao_id
+        }, 202, {}
+
+    try:
+        resultado = registrar_e_processar(payload)
+    except Exception as e:
+        logger.error(f"Erro ao processar webhook: {str(e)}")
+        liberar_deduplicacao(chave)
+        NOTIFICACOES.inc(evento=evento, status=status, resultado='erro')
+        return {'status': 'error', 'message': str(e)}, 500, {}
+    if resultado.get('status') == 'ERROR':
+        liberar_deduplicacao(chave)
+        NOTIFICACOES.inc(evento=evento, status=status, resultado='erro')
+        if resultado.get('error') != FORMATO_DESCONHECIDO:
+            # Falha transitória (ex.: banco ocupado): um status diferente de 2xx faz a OpenPix reenviar
+            return {'status': 'error', 'message': resultado['error'], 'processamento': resultado}, 500, {}
+    else:
+        confirmar_deduplicacao(chave)
+        NOTIFICACOES.inc(evento=evento, status=status, resultado='processada')
+    ETAPA_WEBHOOK.observar(time.perf_counter() - inicio, etapa='total')
+    return {
+        'status': 'success',
+        'message': 'Notificação recebida com sucesso',
+        'processamento': resultado
+    }, 200, {}
+
+def confirmar_deduplicacao(chave):
+    """Confirma a chave depois do processamento. Uma falha aqui só deixa a reserva vencer."""
+    if not chave:
+        return
+    try:
+        obter_deduplicador().confirmar(chave)
+    except Exception as e:
+        logger.error(f"Erro ao confirmar chave de deduplicação {chave}: {str(e)}")
+
+def liberar_deduplicacao(chave):
+    """Libera a reserva após uma falha, para que a reentrega seja processada."""
+    if not chave:
+        return
+    try:
+        obter_deduplicador().esquecer(chave)
+    except Exception as e:
+        logger.error(f"Erro ao liberar chave de deduplicação {chave}, ela vence em {DEDUP_RESERVA}s: {str(e)}")
+
+def registrar_notificacao(payload):
+    """Grava a notificação recebida no diário, medindo a etapa."""
+    logger.info("Notificação Pix recebida: %s", CampoLimitado(payload), extra={'amostra': 'webhook'})
+    with ETAPA_WEBHOOK.cronometrar(etapa='salvar_notificacao'):
+        log_path = salvar_notificacao(payload)
+    logger.info("Notificação salva em: %s", log_path)
+
+def processar_medindo(payload):
+    """Processa a notificação, medindo a etapa."""
+    with ETAPA_WEBHOOK.cronometrar(etapa='processar_notificacao'):
+        return processar_notificacao_pix(payload)
+
+def registrar_e_processar(payload):
+    """Grava a notificação no diário e a processa, medindo cada etapa."""
+    registrar_notificacao(payload)
+    return processar_medindo(payload)
+
+def montar_status(desde=None, limite=10):
+    """Monta a resposta de /webhook/pix/status. Retorna (resposta, status HTTP)."""
+    try:
+        resumo = obter_journal().resumo(desde=desde, limite=max(1, min(limite, 1000)))
+    except Exception as e:
+        logger.error(f"Erro ao ler índice do diário, listando {LOGS_DIR}: {str(e)}")
+        return montar_status_legado()
+    resposta = {
+        'status': 'online',
+        'message': 'Serviço de webhook Pix está ativo',
+        'ultimas_notificacoes': [ref['id'] for ref in resumo['ultimas']],
+        'total_notificacoes': resumo['total'],
+        'por_evento': resumo['por_evento'],
+        'por_status': resumo['por_status'],
+        'deduplicacao': obter_deduplicador().metricas()
+    }
+    if desde is not None:
+        resposta['notificacoes'] = [
+            {campo: ref.get(campo) for campo in ('seq', 'id', 'recebido_em', 'evento', 'status')}
+            for ref in resumo['ultimas']
+        ]
+        resposta['proximo_cursor'] = resumo['ultimas'][-1]['seq'] if resumo['ultimas'] else desde
+    return resposta, 200
+
+def montar_status_legado():
+    """Caminho raro: conta os arquivos de notificação do formato antigo em logs/."""
+    try:
+        arquivos = [a for a in os.listdir(LOGS_DIR) if a.endswith('.json')]
+        arquivos.sort(reverse=True)
+        return {
+            'status': 'online',
+            'message': 'Serviço de webhook Pix está ativo',
+            'ultimas_notificacoes': arquivos[:10],
+            'total_notificacoes': len(arquivos)
+        }, 200
+    except Exception as e:
+        return {'status': 'error', 'message': str(e)}, 500
+
 def salvar_notificacao(payload):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     notification_id = str(uuid.uuid4())[:8]
-    filename = f"pix_notification_{timestamp}_{notification_id}.json"
-    filepath = os.path.join(LOGS_DIR, filename)
-    with open(filepath, 'w') as f:
-        json.dump(payload, f, indent=4)
-    return filepath
+    ref = obter_journal().anexar(payload, f"pix_notification_{timestamp}_{notification_id}")
+    return f"{os.path.join(JOURNAL_DIR, ref['segmento'])}#{ref['offset']}"
 
-def processar_notificacao_pix(payload):
+def processar_corpo_webhook(corpo):
+    """Processa, em um worker da fila, o corpo bruto de uma notificação já gravada no diário.
+
+    Roda de novo a cada tentativa da fila, então não grava no diário; isso é feito no aceite.
+    """
+    payload = json.loads(corpo)
+    evento, status = resumir_payload(payload)
+    chave = chave_deduplicacao(payload)
     try:
-        pix_info = {
-            'event': payload.get('event', payload.get('evento', 'UNKNOWN')),
-            'notification_id': str(uuid.uuid4()),
-            'raw_payload': payload
-        }
-
-        if 'pix' in payload and isinstance(payload['pix'], dict):
-            pix = payload['pix']
-            pix_info.update({
-                'status': pix.get('status'),
-                'valor': pix.get('valor'),
-                'txid': pix.get('txid'),
-                'e2eid': pix.get('e2eid'),
-                'infoPagador': pix.get('infoPagador', {}),
-                'type': pix.get('type', payload.get('type'))
-            })
-            # Atualizar transação, se aplicável
-            if pix_info['status'] in ['COMPLETED', 'CONCLUIDA']:
-                transacao = atualizar_transacao_pix(pix_info['txid'], 'CONCLUIDA')
-                if transacao:
-                    pix_info['proximo_passo'] = f"Pagamento confirmado, aguardando conversão para {transacao['moeda']}"
+        resultado = processar_medindo(payload)
+    except Exception:
+        liberar_deduplicacao(chave)
+        NOTIFICACOES.inc(evento=evento, status=status, resultado='erro_fila')
+        raise
+    if resultado.get('status') == 'ERROR':
+        liberar_deduplicacao(chave)
+        NOTIFICACOES.inc(evento=evento, status=status, resultado='erro_fila')
+        if resultado.get('error') != FORMATO_DESCONHECIDO:
+            raise RuntimeError(resultado['error'])  # A fila tenta de novo
+        return resultado
+    confirmar_deduplicacao(chave)
+    NOTIFICACOES.inc(evento=evento, status=status, resultado='processada_fila')
+    return resultado
+
+def processar_notificacao_pix(payload, incluir_payload=None):
+    """Normaliza a notificação pelo registro de utils.normalizador e conclui a transação paga."""
+    try:
+        if incluir_payload is None:
+            incluir_payload = WEBHOOK_INCLUIR_PAYLOAD
+        notificacao = normalizar(payload, incluir_payload)
+        if notificacao is None:
+            return {'status': 'ERROR', 'error': FORMATO_DESCONHECIDO}
+
+        pix_info = notificacao.como_dict()
+        pix_info['notification_id'] = str(uuid.uuid4())
+
+        # Atualizar transação, se aplicável
+        if notificacao.concluida:
+            with ETAPA_WEBHOOK.cronometrar(etapa='atualizar_transacao'):
+                transacao = atualizar_transacao_pix(notificacao.txid, 'CONCLUIDA')
+                if transacao is None and notificacao.correlation_id and notificacao.correlation_id != notificacao.txid:
+                    transacao = atualizar_transacao_pix(notificacao.correlation_id, 'CONCLUIDA')
+            if transacao:
+                conversao = transacao.get('conversao')
+                if conversao and conversao.get('erro'):
+                    pix_info['proximo_passo'] = f"Pagamento confirmado, sem conversão: {conversao['erro']}"
+                elif conversao:  # Notificação repetida de um pagamento já convertido
+                    pix_info['proximo_passo'] = f"Pagamento convertido: {conversao['quantidade']} {conversao['moeda']}"
                 else:
-                    pix_info['proximo_passo'] = 'Transação não encontrada'
-
-        elif payload.get('event') == 'OPENPIX:TRANSACTION_RECEIVED':
-            charge = payload.get('charge', {})
-            pm_pix = charge.get('paymentMethods', {}).get('pix', charge.get('customer', {}))
-            pix_info.update({
-                'status': charge.get('status') or pm_pix.get('status'),
-                'valor': (charge.get('value') or pm_pix.get('value', 0)) / 100,  # OpenPix usa centavos
-                'txid': charge.get('transactionID') or pm_pix.get('transactionID') or charge.get('correlationID'),
-                'e2eid': charge.get('identifier') or pm_pix.get('identifier'),
-                'infoPagador': charge.get('customer') or pm_pix.get('payer', {}),
-                'type': charge.get('type')
-            })
-            # Atualizar transação, se aplicável
-            if pix_info['status'] in ['COMPLETED', 'CONCLUIDA']:
-                transacao = atualizar_transacao_pix(pix_info['txid'], 'CONCLUIDA')
-                if transacao:
                     pix_info['proximo_passo'] = f"Pagamento confirmado, aguardando conversão para {transacao['moeda']}"
-                else:
-                    pix_info['proximo_passo'] = 'Transação não encontrada'
-
-        else:
-            return {'status': 'ERROR', 'error': 'Formato de payload desconhecido'}
+                    encaminhar_conversao(transacao)
+                try:
+                    eventos.publicar(transacao['txid'], evento_pagamento(transacao))
+                except Exception as e:
+                    logger.error(f"Erro ao publicar confirmação de {transacao['txid']}: {str(e)}")
+            else:
+                pix_info['proximo_passo'] = 'Transação não encontrada'
 
-        if pix_info['status'] in ['COMPLETED', 'CONCLUIDA']:
-            logger.info(f"📥 Pagamento confirmado: R${pix_info['valor']:.2f} | TXID: {pix_info['txid']}")
-            logger.info(f"👤 Pagador: {pix_info['infoPagador'].get('name') or pix_info['infoPagador'].get('nome')}")
+            pagador = notificacao.pagador or {}
+            logger.info(f"📥 Pagamento confirmado: R${(notificacao.valor or 0):.2f} | TXID: {notificacao.txid}")
+            logger.info(f"👤 Pagador: {pagador.get('name') or pagador.get('nome')}")
 
         return pix_info
     except Exception as e:
@@ -260,4 +955,4 @@ def processar_notificacao_pix(payload):
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)